@@ -0,0 +1,42 @@
+import asyncio
+import os
+import threading
+
+# Percorso async per le letture Firestore indipendenti (ASYNC_FIRESTORE=0 torna al solo percorso sincrono)
+ASYNC_FIRESTORE = os.environ.get('ASYNC_FIRESTORE', '1') == '1'
+
+_loop = None
+_lock = threading.Lock()
+
+
+def _get_loop():
+    """Event loop dell'istanza, in un thread dedicato: il client async resta legato a un solo loop."""
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='firestore-async', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run(coro):
+    """
+    Esegue la coroutine sul loop dell'istanza e ne attende il risultato dal thread della richiesta.
+    Il task parte con una copia del contesto corrente: traccia e memoizzazione della richiesta
+    restano condivise con il codice sincrono.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def call(obj, method, *args, **kwargs):
+    """
+    Chiama obj.<method>_async se esiste e il percorso async è attivo (attendendone il risultato),
+    altrimenti il metodo sincrono. I due metodi devono restituire lo stesso risultato.
+    """
+    if ASYNC_FIRESTORE:
+        fn = getattr(obj, f"{method}_async", None)
+        if fn is not None:
+            return run(fn(*args, **kwargs))
+    return getattr(obj, method)(*args, **kwargs)
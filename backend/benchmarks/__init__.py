@@ -0,0 +1 @@
+"""Benchmark offline del backend (vedi benchmarks/run.py)."""
@@ -0,0 +1,897 @@
+import asyncio
+import copy
+import datetime
+import enum
+import itertools
+import random
+import string
+import threading
+import time
+
+try:
+    from google.api_core.exceptions import NotFound, AlreadyExists, InvalidArgument
+except ImportError:  # pragma: no cover - google-api-core è una dipendenza di firebase-admin
+    class NotFound(Exception):
+        pass
+
+    class AlreadyExists(Exception):
+        pass
+
+    class InvalidArgument(Exception):
+        pass
+
+
+# Stesso limite del backend reale per un singolo commit
+MAX_WRITES_PER_COMMIT = 500
+
+# Ordine dei tipi usato da Firestore per ordinamenti e cursori
+_TYPE_RANK = ((type(None), 0), (bool, 1), (int, 2), (float, 2), (datetime.datetime, 3),
+              (str, 4), (bytes, 5), (list, 8), (dict, 9))
+
+
+def _rank(value):
+    for typ, rank in _TYPE_RANK:
+        if isinstance(value, typ):
+            return rank
+    return 10
+
+
+def _sort_key(value):
+    rank = _rank(value)
+    if rank == 8:
+        return (rank, tuple(_sort_key(v) for v in value))
+    if rank == 9:
+        return (rank, tuple(sorted((k, _sort_key(v)) for k, v in value.items())))
+    if rank == 0:
+        return (rank, 0)
+    return (rank, value)
+
+
+_MISSING = object()
+
+
+def _get_field(data, path):
+    current = data
+    for part in path.split('.'):
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+
+def _set_field(data, path, value):
+    parts = path.split('.')
+    current = data
+    for part in parts[:-1]:
+        nxt = current.get(part)
+        if not isinstance(nxt, dict):
+            nxt = {}
+            current[part] = nxt
+        current = nxt
+    current[parts[-1]] = value
+
+
+def _delete_field(data, path):
+    parts = path.split('.')
+    current = data
+    for part in parts[:-1]:
+        current = current.get(part)
+        if not isinstance(current, dict):
+            return
+    current.pop(parts[-1], None)
+
+
+def _equal(a, b):
+    # Firestore confronta int e float come numeri, ma non stringhe con numeri
+    if _rank(a) != _rank(b):
+        return False
+    return a == b
+
+
+def _matches(value, op, expected):
+    if value is _MISSING:
+        return False
+    if op == '==':
+        return _equal(value, expected)
+    if op == '!=':
+        return not _equal(value, expected)
+    if op == 'in':
+        return any(_equal(value, e) for e in expected)
+    if op == 'not-in':
+        return not any(_equal(value, e) for e in expected)
+    if op == 'array_contains':
+        return isinstance(value, list) and any(_equal(v, expected) for v in value)
+    if op == 'array_contains_any':
+        return isinstance(value, list) and any(_equal(v, e) for v in value for e in expected)
+    if _rank(value) != _rank(expected):
+        return False
+    if op == '<':
+        return value < expected
+    if op == '<=':
+        return value <= expected
+    if op == '>':
+        return value > expected
+    if op == '>=':
+        return value >= expected
+    raise InvalidArgument(f"Operatore non supportato: {op}")
+
+
+class MemoryFirestore:
+    """
+    Sostituto in memoria del client Firestore, con latenza simulata per ogni RPC.
+    Implementa il sottoinsieme di API usato da firebase.py (collection, document,
+    query con where/order_by/cursori/limit/select, get_all, batch, on_snapshot) e conta
+    RPC, letture e scritture in `stats`.
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+        self._collections = {}
+        # Indici di uguaglianza/appartenenza costruiti al primo uso: {collection: {(campo, tipo): {chiave: set(id)}}}
+        self._indexes = {}
+        self._lock = threading.RLock()
+        self._ids = itertools.count()
+        # Listener on_snapshot attivi e modifiche da notificare: (collection, id, dati prima, dati dopo)
+        self._watches = []
+        self._changes = []
+        self.stats = {"rpcs": 0, "reads": 0, "writes": 0}
+
+    # ---------------------------------------------------------
+    # API del client
+    # ---------------------------------------------------------
+    def collection(self, path, *more):
+        return CollectionReference(self, '/'.join((path,) + more))
+
+    def document(self, path, *more):
+        full = '/'.join((path,) + more)
+        coll, _, doc_id = full.rpartition('/')
+        return DocumentReference(self, coll, doc_id)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        refs = list(references)
+        self._rpc(reads=len(refs))
+        for ref in refs:
+            yield ref._snapshot(field_paths)
+
+    def load(self, collection_path, documents):
+        """Carica documenti {id: dict} direttamente nello storage (seed, senza latenza né statistiche)."""
+        with self._lock:
+            for doc_id, data in documents.items():
+                self._apply('set', DocumentReference(self, collection_path, doc_id), data)
+        self._notify()
+
+    def collections(self):
+        return [CollectionReference(self, path) for path in self._collections if '/' not in path]
+
+    # ---------------------------------------------------------
+    # Statistiche e latenza
+    # ---------------------------------------------------------
+    def reset_stats(self):
+        self.stats = {"rpcs": 0, "reads": 0, "writes": 0}
+
+    def document_count(self, collection_path):
+        return len(self._collections.get(collection_path, {}))
+
+    def _rpc(self, reads=0, writes=0):
+        with self._lock:
+            self.stats["rpcs"] += 1
+            self.stats["reads"] += reads
+            self.stats["writes"] += writes
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay += self._random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _count_reads(self, reads):
+        """Letture senza RPC (documenti consegnati ai listener)."""
+        with self._lock:
+            self.stats["reads"] += reads
+
+    def _auto_id(self):
+        rnd = random.Random(next(self._ids))
+        return ''.join(rnd.choice(string.ascii_letters + string.digits) for _ in range(20))
+
+    # ---------------------------------------------------------
+    # Storage
+    # ---------------------------------------------------------
+    def _docs(self, collection_path):
+        return self._collections.setdefault(collection_path, {})
+
+    def _read(self, collection_path, doc_id):
+        return self._collections.get(collection_path, {}).get(doc_id)
+
+    def _index(self, collection_path, field, kind):
+        """Indice {chiave: set(doc_id)} sul campo (kind='value' per ==/in, 'array' per array_contains)."""
+        indexes = self._indexes.setdefault(collection_path, {})
+        index = indexes.get((field, kind))
+        if index is None:
+            index = {}
+            for doc_id, stored in self._collections.get(collection_path, {}).items():
+                for key in _index_keys(stored['data'], field, kind):
+                    index.setdefault(key, set()).add(doc_id)
+            indexes[(field, kind)] = index
+        return index
+
+    def _reindex(self, collection_path, doc_id, old_data, new_data):
+        for (field, kind), index in self._indexes.get(collection_path, {}).items():
+            if old_data is not None:
+                for key in _index_keys(old_data, field, kind):
+                    ids = index.get(key)
+                    if ids is not None:
+                        ids.discard(doc_id)
+            if new_data is not None:
+                for key in _index_keys(new_data, field, kind):
+                    index.setdefault(key, set()).add(doc_id)
+
+    def _apply(self, op, ref, data=None, merge=False):
+        """Applica una singola scrittura (già validata) allo storage."""
+        docs = self._docs(ref._collection)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        current = docs.get(ref.id)
+
+        if op == 'delete':
+            if docs.pop(ref.id, None) is not None:
+                self._reindex(ref._collection, ref.id, current['data'], None)
+                if self._watches:
+                    self._changes.append((ref._collection, ref.id, current['data'], None))
+            return
+        if op == 'create' and current is not None:
+            raise AlreadyExists(f"Document already exists: {ref.path}")
+        if op == 'update' and current is None:
+            raise NotFound(f"No document to update: {ref.path}")
+
+        if op == 'update':
+            new = copy.deepcopy(current['data'])
+            for path, value in data.items():
+                self._apply_value(new, path, value, now)
+        elif merge and current is not None:
+            new = copy.deepcopy(current['data'])
+            self._merge(new, data, now)
+        else:
+            new = {}
+            self._merge(new, data, now)
+
+        docs[ref.id] = {
+            'data': new,
+            'create_time': current['create_time'] if current else now,
+            'update_time': now
+        }
+        self._reindex(ref._collection, ref.id, current['data'] if current else None, new)
+        if self._watches:
+            self._changes.append((ref._collection, ref.id, current['data'] if current else None, new))
+
+    def _notify(self):
+        """
+        Consegna ai listener le modifiche accumulate, come farebbe Firestore dopo il commit.
+        La consegna è sincrona (nel thread che ha scritto), così i benchmark sono deterministici.
+        """
+        with self._lock:
+            changes, self._changes = self._changes, []
+            deliveries = []
+            for watch in self._watches:
+                events = []
+                for coll, doc_id, old, new in changes:
+                    if coll != watch.query._collection:
+                        continue
+                    was = old is not None and watch.query._matches(doc_id, old)
+                    now = new is not None and watch.query._matches(doc_id, new)
+                    if not was and not now:
+                        continue
+                    kind = ChangeType.MODIFIED if was and now else (ChangeType.ADDED if now else ChangeType.REMOVED)
+                    snapshot = DocumentSnapshot(DocumentReference(self, coll, doc_id), copy.deepcopy(new if now else old))
+                    events.append(DocumentChange(kind, snapshot, -1, -1))
+                if events:
+                    deliveries.append((watch, events))
+        for watch, events in deliveries:
+            watch._deliver(events)
+
+    def _merge(self, target, data, now):
+        for key, value in data.items():
+            if isinstance(value, dict) and not _is_transform(value):
+                sub = target.get(key)
+                if not isinstance(sub, dict):
+                    sub = {}
+                    target[key] = sub
+                self._merge(sub, value, now)
+            else:
+                self._apply_value(target, key, value, now, dotted=False)
+
+    def _apply_value(self, target, path, value, now, dotted=True):
+        setter = _set_field if dotted else (lambda d, k, v: d.__setitem__(k, v))
+        deleter = _delete_field if dotted else (lambda d, k: d.pop(k, None))
+        getter = _get_field if dotted else (lambda d, k: d.get(k, _MISSING))
+
+        name = type(value).__name__
+        if name == 'Sentinel':
+            if 'delete' in value.description.lower():
+                deleter(target, path)
+            else:
+                setter(target, path, now)
+        elif name == 'ArrayUnion':
+            current = getter(target, path)
+            current = list(current) if isinstance(current, list) else []
+            for v in value.values:
+                if not any(_equal(v, c) for c in current):
+                    current.append(copy.deepcopy(v))
+            setter(target, path, current)
+        elif name == 'ArrayRemove':
+            current = getter(target, path)
+            current = list(current) if isinstance(current, list) else []
+            setter(target, path, [c for c in current if not any(_equal(c, v) for v in value.values)])
+        elif name == 'Increment':
+            current = getter(target, path)
+            base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+            setter(target, path, base + value.value)
+        elif name in ('Maximum', 'Minimum'):
+            current = getter(target, path)
+            if not isinstance(current, (int, float)) or isinstance(current, bool):
+                setter(target, path, value.value)
+            else:
+                pick = max if name == 'Maximum' else min
+                setter(target, path, pick(current, value.value))
+        else:
+            setter(target, path, copy.deepcopy(value))
+
+
+def _index_key(value):
+    rank = _rank(value)
+    if rank in (8, 9, 10):
+        return None
+    return (rank, value)
+
+
+def _index_keys(data, field, kind):
+    value = _get_field(data, field)
+    if value is _MISSING:
+        return ()
+    if kind == 'array':
+        if not isinstance(value, list):
+            return ()
+        keys = (_index_key(v) for v in value)
+    else:
+        keys = (_index_key(value),)
+    return [k for k in keys if k is not None]
+
+
+def _is_transform(value):
+    return type(value).__name__ in ('Sentinel', 'ArrayUnion', 'ArrayRemove', 'Increment', 'Maximum', 'Minimum')
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None):
+        self.reference = reference
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+        self.read_time = datetime.datetime.now(datetime.timezone.utc)
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        if self._data is None:
+            return None
+        value = _get_field(self._data, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return copy.deepcopy(value)
+
+
+class DocumentReference:
+    def __init__(self, client, collection_path, doc_id):
+        self._client = client
+        self._collection = collection_path
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._collection)
+
+    def collection(self, name):
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def _snapshot(self, field_paths=None):
+        stored = self._client._read(self._collection, self.id)
+        if stored is None:
+            return DocumentSnapshot(self, None)
+        data = stored['data']
+        if field_paths is not None:
+            data = _project(data, field_paths)
+        return DocumentSnapshot(self, copy.deepcopy(data), stored['create_time'], stored['update_time'])
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._rpc(reads=1)
+        return self._snapshot(field_paths)
+
+    def set(self, document_data, merge=False):
+        self._client._rpc(writes=1)
+        with self._client._lock:
+            self._client._apply('set', self, document_data, merge=bool(merge))
+        self._client._notify()
+
+    def create(self, document_data):
+        self._client._rpc(writes=1)
+        with self._client._lock:
+            self._client._apply('create', self, document_data)
+        self._client._notify()
+
+    def update(self, field_updates, option=None):
+        self._client._rpc(writes=1)
+        with self._client._lock:
+            self._client._apply('update', self, field_updates)
+        self._client._notify()
+
+    def delete(self, option=None):
+        self._client._rpc(writes=1)
+        with self._client._lock:
+            self._client._apply('delete', self)
+        self._client._notify()
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"<DocumentReference {self.path}>"
+
+
+def _project(data, field_paths):
+    projected = {}
+    for path in field_paths:
+        value = _get_field(data, path)
+        if value is not _MISSING:
+            _set_field(projected, path, value)
+    return projected
+
+
+_INDEXED_OPS = {'==': 'value', 'in': 'value', 'array_contains': 'array', 'array_contains_any': 'array'}
+
+
+class Query:
+    def __init__(self, client, collection_path, filters=(), orders=(), limit=None,
+                 offset=0, projection=None, start=None, end=None, all_descendants=False):
+        self._client = client
+        self._collection = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._offset = offset
+        self._projection = projection
+        self._start = start
+        self._end = end
+        self._all_descendants = all_descendants
+
+    def _copy(self, **changes):
+        params = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                      offset=self._offset, projection=self._projection, start=self._start,
+                      end=self._end, all_descendants=self._all_descendants)
+        params.update(changes)
+        return Query(self._client, self._collection, **params)
+
+    # ---------------------------------------------------------
+    # Builder
+    # ---------------------------------------------------------
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field_path, str(direction).upper().startswith('DESC')),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def offset(self, num_to_skip):
+        return self._copy(offset=num_to_skip)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, False))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, True))
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._copy(end=(document_fields_or_snapshot, True))
+
+    def end_at(self, document_fields_or_snapshot):
+        return self._copy(end=(document_fields_or_snapshot, False))
+
+    # ---------------------------------------------------------
+    # Esecuzione
+    # ---------------------------------------------------------
+    def _orderings(self):
+        orders = list(self._orders)
+        if not any(field == '__name__' for field, _ in orders):
+            orders.append(('__name__', orders[-1][1] if orders else False))
+        return orders
+
+    def _candidates(self):
+        if self._all_descendants:
+            name = self._collection
+            for path, docs in self._client._collections.items():
+                if path == name or path.endswith('/' + name):
+                    for doc_id, stored in docs.items():
+                        yield path, doc_id, stored
+            return
+
+        docs = self._client._collections.get(self._collection, {})
+        # Come Firestore, i filtri di uguaglianza/appartenenza usano un indice invece della scansione
+        ids = None
+        for field, op, value in self._filters:
+            if field == '__name__' or op not in _INDEXED_OPS:
+                continue
+            kind, values = _INDEXED_OPS[op], (value if op in ('in', 'array_contains_any') else [value])
+            keys = [_index_key(v) for v in values]
+            if any(k is None for k in keys):
+                continue
+            index = self._client._index(self._collection, field, kind)
+            matched = set()
+            for key in keys:
+                matched |= index.get(key, set())
+            ids = matched if ids is None else ids & matched
+
+        if ids is None:
+            for doc_id, stored in docs.items():
+                yield self._collection, doc_id, stored
+        else:
+            for doc_id in ids:
+                stored = docs.get(doc_id)
+                if stored is not None:
+                    yield self._collection, doc_id, stored
+
+    def _value(self, data, doc_id, field):
+        return doc_id if field == '__name__' else _get_field(data, field)
+
+    def _cursor_values(self, cursor, orders):
+        if isinstance(cursor, DocumentSnapshot):
+            data = cursor._data or {}
+            return [self._value(data, cursor.id, field) for field, _ in orders]
+        if isinstance(cursor, dict):
+            values = []
+            for field, _ in orders:
+                if field not in cursor:
+                    break
+                value = cursor[field]
+                if field == '__name__' and isinstance(value, DocumentReference):
+                    value = value.id
+                values.append(value)
+            return values
+        return list(cursor)
+
+    def _compare(self, key, cursor_values, orders):
+        """Confronta la chiave di ordinamento di un documento con un cursore (-1, 0, 1)."""
+        for (field, desc), value, bound in zip(orders, key, cursor_values):
+            a, b = _sort_key(value), _sort_key(bound)
+            if a != b:
+                result = -1 if a < b else 1
+                return -result if desc else result
+        return 0
+
+    def _matches(self, doc_id, data):
+        return all(_matches(self._value(data, doc_id, f), op, v) for f, op, v in self._filters)
+
+    def _run(self):
+        orders = self._orderings()
+        rows = []
+        with self._client._lock:
+            for coll, doc_id, stored in self._candidates():
+                data = stored['data']
+                if not self._matches(doc_id, data):
+                    continue
+                key = [self._value(data, doc_id, field) for field, _ in orders]
+                # Firestore esclude i documenti privi dei campi di ordinamento
+                if any(k is _MISSING for k in key):
+                    continue
+                rows.append((key, coll, doc_id, stored))
+
+        # Ordinamenti stabili applicati dall'ultimo al primo campo
+        for idx in reversed(range(len(orders))):
+            rows.sort(key=lambda r: _sort_key(r[0][idx]), reverse=orders[idx][1])
+
+        if self._start is not None:
+            cursor, after = self._start
+            values = self._cursor_values(cursor, orders)
+            rows = [r for r in rows if (self._compare(r[0], values, orders) > 0
+                                        or (not after and self._compare(r[0], values, orders) == 0))]
+        if self._end is not None:
+            cursor, before = self._end
+            values = self._cursor_values(cursor, orders)
+            rows = [r for r in rows if (self._compare(r[0], values, orders) < 0
+                                        or (not before and self._compare(r[0], values, orders) == 0))]
+
+        rows = rows[self._offset:]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        snapshots = []
+        for _, coll, doc_id, stored in rows:
+            data = stored['data']
+            if self._projection is not None:
+                data = _project(data, self._projection)
+            ref = DocumentReference(self._client, coll, doc_id)
+            snapshots.append(DocumentSnapshot(ref, copy.deepcopy(data), stored['create_time'], stored['update_time']))
+        return snapshots
+
+    def stream(self, transaction=None):
+        snapshots = self._run()
+        # Una RPC per query; una lettura per documento (minimo una, come la fatturazione Firestore)
+        self._client._rpc(reads=max(1, len(snapshots)))
+        yield from snapshots
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def count(self):
+        return _CountQuery(self)
+
+    def on_snapshot(self, callback):
+        """
+        Listener sulla query (filtri soltanto): il primo snapshot con tutti i documenti come
+        ADDED arriva subito, poi una chiamata per ogni commit che tocca la query.
+        Come in Firestore ogni documento consegnato conta una lettura; `docs` non viene
+        ricalcolato dopo il primo snapshot (viene passato vuoto).
+        """
+        watch = _Watch(self, callback)
+        with self._client._lock:
+            snapshots = self._run()
+            self._client._watches.append(watch)
+        self._client._count_reads(len(snapshots))
+        callback(snapshots, [DocumentChange(ChangeType.ADDED, s, -1, i) for i, s in enumerate(snapshots)],
+                 datetime.datetime.now(datetime.timezone.utc))
+        return watch
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class DocumentChange:
+    def __init__(self, type, document, old_index, new_index):
+        self.type = type
+        self.document = document
+        self.old_index = old_index
+        self.new_index = new_index
+
+
+class _Watch:
+    def __init__(self, query, callback):
+        self.query = query
+        self._callback = callback
+        self.is_active = True
+
+    def _deliver(self, events):
+        if not self.is_active:
+            return
+        self.query._client._count_reads(len(events))
+        self._callback([], events, datetime.datetime.now(datetime.timezone.utc))
+
+    def unsubscribe(self):
+        self.is_active = False
+        with self.query._client._lock:
+            if self in self.query._client._watches:
+                self.query._client._watches.remove(self)
+
+
+class _CountQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def get(self):
+        snapshots = self._query._run()
+        self._query._client._rpc(reads=1)
+        return [[_AggregationResult(len(snapshots))]]
+
+
+class _AggregationResult:
+    def __init__(self, value):
+        self.alias = 'count'
+        self.value = value
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._collection.rpartition('/')[2]
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self._collection, document_id or self._client._auto_id())
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.create(document_data)
+        return datetime.datetime.now(datetime.timezone.utc), ref
+
+    def list_documents(self):
+        return [DocumentReference(self._client, self._collection, doc_id)
+                for doc_id in list(self._client._collections.get(self._collection, {}))]
+
+
+class WriteBatch:
+    """Scritture accodate e applicate atomicamente al commit (massimo 500)."""
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, reference, document_data, merge=False):
+        self._writes.append(('set', reference, document_data, bool(merge)))
+
+    def create(self, reference, document_data):
+        self._writes.append(('create', reference, document_data, False))
+
+    def update(self, reference, field_updates, option=None):
+        self._writes.append(('update', reference, field_updates, False))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, False))
+
+    def commit(self):
+        if len(self._writes) > MAX_WRITES_PER_COMMIT:
+            raise InvalidArgument(f"maximum {MAX_WRITES_PER_COMMIT} writes allowed per request")
+        self._client._rpc(writes=len(self._writes))
+        with self._client._lock:
+            # Validazione preventiva: il commit è tutto o niente
+            for op, ref, _, _ in self._writes:
+                exists = self._client._read(ref._collection, ref.id) is not None
+                if op == 'update' and not exists:
+                    raise NotFound(f"No document to update: {ref.path}")
+                if op == 'create' and exists:
+                    raise AlreadyExists(f"Document already exists: {ref.path}")
+            for op, ref, data, merge in self._writes:
+                self._client._apply(op, ref, data, merge=merge)
+        self._client._notify()
+        results = [datetime.datetime.now(datetime.timezone.utc)] * len(self._writes)
+        self._writes = []
+        return results
+
+
+class Transaction(WriteBatch):
+    """
+    Transazione semplificata: letture immediate, scritture applicate al commit.
+    Espone anche i metodi interni usati dal decoratore firestore.transactional.
+    """
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._id = None
+        self._read_only = False
+        self._max_attempts = 5
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = self._client._auto_id()
+
+    def _commit(self):
+        results = self.commit()
+        self._clean_up()
+        return results
+
+    def _rollback(self):
+        self._clean_up()
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, DocumentReference):
+            return iter([ref_or_query.get(transaction=self)])
+        return ref_or_query.stream(transaction=self)
+
+    def get_all(self, references):
+        return self._client.get_all(references, transaction=self)
+
+
+# ---------------------------------------------------------
+# CLIENT ASYNC
+# ---------------------------------------------------------
+class AsyncMemoryFirestore:
+    """
+    Client async sullo stesso storage di un MemoryFirestore (sottoinsieme di AsyncClient).
+    Ogni RPC gira in un thread con la sua latenza simulata, così le chiamate lanciate
+    con asyncio.gather si sovrappongono come sul backend reale.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def collection(self, path, *more):
+        return AsyncCollectionReference(self._client.collection(path, *more))
+
+    def document(self, path, *more):
+        return AsyncDocumentReference(self._client.document(path, *more))
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        refs = [r._ref for r in references]
+        snapshots = await asyncio.to_thread(lambda: list(self._client.get_all(refs, field_paths)))
+        for snapshot in snapshots:
+            yield snapshot
+
+
+class AsyncDocumentReference:
+    def __init__(self, ref):
+        self._ref = ref
+        self.id = ref.id
+
+    @property
+    def path(self):
+        return self._ref.path
+
+    async def get(self, field_paths=None, transaction=None):
+        return await asyncio.to_thread(self._ref.get, field_paths)
+
+    async def set(self, document_data, merge=False):
+        return await asyncio.to_thread(self._ref.set, document_data, merge)
+
+    async def update(self, field_updates, option=None):
+        return await asyncio.to_thread(self._ref.update, field_updates)
+
+    async def delete(self, option=None):
+        return await asyncio.to_thread(self._ref.delete)
+
+
+class AsyncQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def where(self, *args, **kwargs):
+        return AsyncQuery(self._query.where(*args, **kwargs))
+
+    def order_by(self, *args, **kwargs):
+        return AsyncQuery(self._query.order_by(*args, **kwargs))
+
+    def limit(self, count):
+        return AsyncQuery(self._query.limit(count))
+
+    def select(self, field_paths):
+        return AsyncQuery(self._query.select(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return AsyncQuery(self._query.start_after(document_fields_or_snapshot))
+
+    async def stream(self, transaction=None):
+        snapshots = await asyncio.to_thread(lambda: list(self._query.stream()))
+        for snapshot in snapshots:
+            yield snapshot
+
+    async def get(self, transaction=None):
+        return await asyncio.to_thread(self._query.get)
+
+
+class AsyncCollectionReference(AsyncQuery):
+    def document(self, document_id=None):
+        return AsyncDocumentReference(self._query.document(document_id))
@@ -0,0 +1,308 @@
+"""
+Benchmark offline delle azioni di main.analyze_player su un Firestore in memoria.
+
+Esempi (dalla cartella backend):
+    python -m benchmarks.run --sizes 1000,10000 --output baseline.json
+    python -m benchmarks.run --sizes 1000,10000 --latency-ms 8 --compare baseline.json
+
+Con --compare il processo termina con codice 1 se un'azione è più lenta della baseline
+oltre la tolleranza o se esegue più RPC/letture/scritture Firestore.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+import async_runtime
+import context_cache
+import firebase
+import hattrick_client
+import main
+import player_pool
+import player_schema
+from flask import Flask, request
+
+from benchmarks import synthetic
+from benchmarks.memory_firestore import AsyncMemoryFirestore, MemoryFirestore
+
+_app = Flask('benchmarks')
+
+
+class Scenario:
+    """Un'azione da misurare: payload per la i-esima esecuzione e preparazione non cronometrata."""
+
+    def __init__(self, name, payload, setup=None):
+        self.name = name
+        self.payload = payload
+        self.setup = setup
+
+
+def call(payload):
+    """Esegue analyze_player come farebbe functions-framework, senza output sul terminale."""
+    with _app.test_request_context('/', method='POST', json=payload):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = main.analyze_player(request)
+    body, status = result[0], result[1]
+    if status != 200 or (isinstance(body, dict) and 'error' in body):
+        raise RuntimeError(f"{payload.get('action')}/{payload.get('method')} -> {status}: {body}")
+    return body
+
+
+def build_scenarios(dataset, client, args):
+    coach = synthetic.BENCH_COACH
+    coach_list = dataset.coach_lists()[0]
+    list_members = set(dataset.lists[coach_list]['player_ids'])
+    list_league = dataset.teams[dataset.lists[coach_list]['team_id']]['NativeLeagueID']
+    addable = [pid for pid in dataset.coach_players()
+               if pid not in list_members and dataset.players[pid]['NativeLeagueID'] == list_league]
+
+    from hattrick_advisor import payload_from_player
+    sample = dataset.players[next(iter(list_members))]
+    analysis_payload = payload_from_player(sample, {"player_role": "defender", "team_target": "U21"})
+
+    shortlist = [pid for pid in dataset.coach_players()
+                 if dataset.players[pid]['NativeLeagueID'] == list_league][:30]
+
+    def restore_list():
+        original = dataset.lists[coach_list]
+        client.load('lists', {coach_list: dict(original, player_ids=sorted(original['player_ids']),
+                                               player_count=len(original['player_ids']))})
+        client.load('players-details', {pid: dataset.players[pid] for pid in shortlist})
+
+    sync_players = [dataset.players[pid] for pid in dataset.coach_players()[:args.sync_players]]
+    changed_ids = [p['PlayerID'] for p in sync_players[::max(1, int(1 / args.sync_changed))]]
+    hasher = firebase.PlayerManager()
+
+    def restore_sync_players(with_hash):
+        docs = {}
+        for p in sync_players:
+            doc = dict(p)
+            if with_hash:
+                doc['content_hash'] = hasher._content_hash(p)
+            docs[p['PlayerID']] = doc
+        client.load('players-details', docs)
+
+    def sync_setup(changed, with_hash):
+        def setup():
+            restore_sync_players(with_hash)
+            hattrick_client.HattrickClient = synthetic.hattrick_client_factory(
+                sync_players, args.http_latency_ms, changed)
+        return setup
+
+    scenarios = [
+        Scenario('get_user_context', lambda i: {
+            'action': 'manage_roles', 'method': 'get_user_context', 'requesterEmail': coach}),
+        Scenario('get_lists', lambda i: {
+            'action': 'manage_lists', 'method': 'get_lists', 'email': coach}),
+        Scenario('get_list_players', lambda i: {
+            'action': 'manage_lists', 'method': 'get_list_players', 'email': coach, 'listId': coach_list}),
+        Scenario('get_list_players_detailed', lambda i: {
+            'action': 'manage_players', 'method': 'get_list_players_detailed',
+            'requesterEmail': coach, 'listId': coach_list}),
+        Scenario('get_my_players_page', lambda i: {
+            'action': 'manage_players', 'method': 'get_my_players', 'requesterEmail': coach, 'pageSize': 100}),
+        Scenario('search_players', lambda i: {
+            'action': 'manage_players', 'method': 'search_players', 'requesterEmail': coach,
+            'query': 'ma', 'pageSize': 50}),
+        Scenario('search_players_list', lambda i: {
+            'action': 'manage_players', 'method': 'search_players', 'requesterEmail': coach,
+            'query': 'ro', 'listId': coach_list, 'pageSize': 50}),
+        Scenario('analysis', lambda i: dict(analysis_payload, email=coach)),
+        Scenario('analyze_batch', lambda i: {
+            'action': 'analyze_batch', 'email': coach, 'listId': coach_list,
+            'player_role': 'defender', 'team_target': 'U21', 'rankRoles': True}),
+        Scenario('add_player', lambda i: {
+            'action': 'manage_lists', 'method': 'add_player', 'email': coach,
+            'listId': coach_list, 'playerId': addable[i % len(addable)]}),
+        Scenario('add_players_30', lambda i: {
+            'action': 'manage_lists', 'method': 'add_players', 'email': coach,
+            'listId': coach_list, 'playerIds': shortlist}, setup=restore_list),
+        Scenario('import_players', lambda i: {
+            'action': 'manage_players', 'method': 'import_players', 'requesterEmail': coach,
+            'players': synthetic.import_rows(dataset, args.import_rows, offset=i * args.import_rows)}),
+        Scenario('sync_players_full', lambda i: {
+            'action': 'manage_players', 'method': 'sync_players', 'requesterEmail': coach,
+            'incremental': False}, setup=sync_setup((), with_hash=False)),
+        Scenario('sync_players_incremental', lambda i: {
+            'action': 'manage_players', 'method': 'sync_players', 'requesterEmail': coach,
+            'incremental': True}, setup=sync_setup(changed_ids, with_hash=True)),
+    ]
+    if args.typed_schema:
+        # Le query strutturate richiedono lo schema tipizzato
+        scenarios.append(Scenario('query_players_u21', lambda i: {
+            'action': 'manage_players', 'method': 'query_players', 'requesterEmail': coach,
+            'leagueId': list_league, 'pageSize': 50,
+            'filters': [{'field': 'Age', 'op': '<', 'value': 21},
+                        {'field': 'target_pct.midfielder_u21_normal', 'op': '>=', 'value': 60}],
+            'sort': {'field': 'target_pct.midfielder_u21_normal', 'direction': 'desc'}}))
+    return scenarios
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)]
+
+
+def run_scenario(scenario, client, args):
+    timings, counters = [], []
+    # Prima esecuzione non cronometrata: import lazy e warm-up dell'istanza
+    for i in range(args.warmup + args.repeat):
+        if scenario.setup:
+            scenario.setup()
+        if not args.warm_cache:
+            context_cache.user_context_cache.clear()
+        payload = scenario.payload(i)
+        client.reset_stats()
+        start = time.perf_counter()
+        call(payload)
+        elapsed = (time.perf_counter() - start) * 1000
+        if i >= args.warmup:
+            timings.append(elapsed)
+            counters.append(dict(client.stats))
+
+    return {
+        "runs": len(timings),
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        # Le operazioni Firestore sono deterministiche: si riporta l'ultima esecuzione
+        "rpcs": counters[-1]["rpcs"],
+        "reads": counters[-1]["reads"],
+        "writes": counters[-1]["writes"]
+    }
+
+
+def run_size(n_players, args):
+    dataset = synthetic.generate(n_players, n_nations=args.nations, seed=args.seed)
+    client = MemoryFirestore(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed)
+    if args.typed_schema:
+        # Dataset già nello schema tipizzato (anche per i ripristini degli scenari)
+        for p in dataset.players.values():
+            player_schema.normalize(p)
+    dataset.load_into(client)
+    firebase.db.use(client)
+    firebase.adb.use(AsyncMemoryFirestore(client))
+    context_cache.user_context_cache.clear()
+    if args.typed_schema:
+        # Registra il backfill completato: le ricerche usano solo league_id
+        firebase.PlayerManager().normalize_schema(synthetic.BENCH_COACH)
+
+    original_client = hattrick_client.HattrickClient
+    results = {}
+    try:
+        for scenario in build_scenarios(dataset, client, args):
+            if args.only and scenario.name not in args.only:
+                continue
+            results[scenario.name] = run_scenario(scenario, client, args)
+            r = results[scenario.name]
+            print(f"  {n_players:>7} {scenario.name:<28} median {r['median_ms']:>10.2f} ms"
+                  f"  p95 {r['p95_ms']:>10.2f} ms  rpcs {r['rpcs']:>5}  reads {r['reads']:>7}  writes {r['writes']:>6}",
+                  file=sys.stderr)
+    finally:
+        hattrick_client.HattrickClient = original_client
+        firebase.db.use(None)
+        firebase.adb.use(None)
+    return results
+
+
+def compare(baseline, current, tolerance, min_delta_ms):
+    """Elenco delle regressioni rispetto alla baseline (tempo mediano o operazioni Firestore)."""
+    regressions = []
+    for size, actions in current["results"].items():
+        for name, now in actions.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if not before:
+                continue
+            delta = now["median_ms"] - before["median_ms"]
+            if delta > min_delta_ms and now["median_ms"] > before["median_ms"] * (1 + tolerance):
+                regressions.append(f"{size} {name}: median {before['median_ms']} -> {now['median_ms']} ms")
+            for key in ("rpcs", "reads", "writes"):
+                if now[key] > before[key]:
+                    regressions.append(f"{size} {name}: {key} {before[key]} -> {now[key]}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000', help="numero di giocatori, separati da virgola (1000-100000)")
+    parser.add_argument('--nations', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="latenza simulata per ogni RPC Firestore")
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--http-latency-ms', type=float, default=0.0, help="latenza simulata per le richieste Hattrick")
+    parser.add_argument('--sync-players', type=int, default=500)
+    parser.add_argument('--sync-changed', type=float, default=0.1, help="quota di giocatori modificati nella sync incrementale")
+    parser.add_argument('--import-rows', type=int, default=500)
+    parser.add_argument('--warm-cache', action='store_true', help="mantiene la cache dei permessi tra le esecuzioni")
+    parser.add_argument('--sync-only', action='store_true', help="disattiva il percorso Firestore async (ASYNC_FIRESTORE=0)")
+    parser.add_argument('--typed-schema', action='store_true', help="giocatori nello schema tipizzato, con backfill completato")
+    parser.add_argument('--player-pool', action='store_true', help="attiva il pool giocatori in memoria (caricato nel warm-up)")
+    parser.add_argument('--only', type=lambda s: set(s.split(',')), default=None, help="azioni da eseguire, separate da virgola")
+    parser.add_argument('--output', help="file JSON dove salvare i risultati (default: stdout)")
+    parser.add_argument('--compare', help="baseline JSON con cui confrontare i risultati")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="rallentamento relativo tollerato sul tempo mediano")
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help="differenze assolute sotto questa soglia sono ignorate")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    player_pool.PLAYER_POOL_ENABLED = args.player_pool
+    async_runtime.ASYNC_FIRESTORE = not args.sync_only
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "http_latency_ms": args.http_latency_ms,
+            # Tetto di throughput della sync reale (N / rate secondi); il client sintetico non lo applica
+            "sync_rate_per_sec": hattrick_client.DEFAULT_RATE_PER_SEC,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "nations": args.nations,
+            "sync_players": args.sync_players,
+            "import_rows": args.import_rows,
+            "warm_cache": args.warm_cache,
+            "player_pool": args.player_pool,
+            "typed_schema": args.typed_schema,
+            "async_firestore": not args.sync_only
+        },
+        "results": {}
+    }
+    for n in sizes:
+        report["results"][str(n)] = run_size(n, args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("Nessuna regressione rispetto alla baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,252 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from xml.sax.saxutils import escape
+
+import player_search
+
+FIRST_NAMES = (
+    "Andrea", "Marco", "Luca", "Giovanni", "Sang-Duk", "Ivan", "Sean", "Óscar", "José", "Jan",
+    "Pavel", "Tomáš", "Lars", "Sven", "Mikko", "Ahmed", "Karim", "Diego", "Mateo", "Pierre",
+    "Hugo", "Nikola", "Stefan", "Kenji", "Hiro", "Ali", "Emre", "Bruno", "Rui", "Anders"
+)
+LAST_NAMES = (
+    "Rossi", "Bianchi", "Kwon", "Kadlec", "Player", "Núñez", "García", "Novák", "Svoboda", "Larsen",
+    "Nielsen", "Virtanen", "Haddad", "Benali", "Fernández", "Dubois", "Martin", "Petrović", "Jovanović",
+    "Tanaka", "Sato", "Yılmaz", "Kaya", "Silva", "Costa", "Andersson", "Johansson", "Müller", "Schmidt", "Ricci"
+)
+SKILL_XML_FIELDS = ('KeeperSkill', 'PlaymakerSkill', 'ScorerSkill', 'PassingSkill',
+                    'WingerSkill', 'DefenderSkill', 'SetPiecesSkill')
+
+BENCH_COACH = "coach@bench.local"
+BENCH_SCOUT = "scout@bench.local"
+FETCHED_DATE = datetime(2026, 1, 23, 13, 13, 20, tzinfo=timezone.utc)
+
+
+class Dataset:
+    """Dati sintetici generati in modo deterministico dal seed."""
+
+    def __init__(self, players, nations, teams, memberships, lists, coach_leagues):
+        self.players = players              # {player_id: dict}
+        self.nations = nations              # [league_id]
+        self.teams = teams                  # {team_id: dict}
+        self.memberships = memberships      # {membership_id: dict}
+        self.lists = lists                  # {list_id: dict}
+        self.coach_leagues = coach_leagues  # league_id gestite da BENCH_COACH
+
+    def load_into(self, client):
+        """Scrive il dataset nel client in memoria (senza latenza né statistiche)."""
+        client.load('players-details', self.players)
+        client.load('teams', self.teams)
+        client.load('memberships', self.memberships)
+        client.load('lists', {lid: dict(l, player_ids=sorted(l['player_ids']), player_count=len(l['player_ids']))
+                              for lid, l in self.lists.items()})
+
+    def coach_lists(self):
+        return [lid for lid, l in self.lists.items() if self.teams[l['team_id']]['owner'] == BENCH_COACH]
+
+    def coach_players(self):
+        leagues = set(self.coach_leagues)
+        return [pid for pid, p in self.players.items() if p['NativeLeagueID'] in leagues]
+
+
+def _player(rnd, player_id, league_id, owner_email=BENCH_COACH):
+    age = rnd.randint(17, 30)
+    p = {
+        'PlayerID': player_id,
+        'FirstName': rnd.choice(FIRST_NAMES),
+        'LastName': rnd.choice(LAST_NAMES),
+        'Age': str(age),
+        'AgeDays': str(rnd.randint(0, 111)),
+        'TSI': str(rnd.randint(1000, 250000)),
+        'PlayerForm': str(rnd.randint(1, 8)),
+        'StaminaSkill': str(rnd.randint(3, 9)),
+        'InjuryLevel': '-1',
+        'CountryID': league_id,
+        'NativeLeagueID': league_id,
+        'TrainingName': rnd.choice(("Difesa", "Regia", "Cross", "Attacco", "Passaggi", "Parate")),
+        'StaminaTrainingPart': str(rnd.choice((10, 15, 20))),
+        'owner_email': owner_email,
+        'updated_at': FETCHED_DATE - timedelta(days=rnd.randint(1, 60)),
+        'list_ids': []
+    }
+    for field in SKILL_XML_FIELDS:
+        p[field] = str(min(20, int(rnd.expovariate(1 / 5.0))))
+    p.update(player_search.build_search_fields(p, player_id))
+    return p
+
+
+def generate(n_players, n_nations=50, coach_nations=3, lists_per_team=3, list_size=100, seed=42):
+    """
+    Genera giocatori, team (U21 e NT per nazione), membership, liste e appartenenze
+    alle liste. BENCH_COACH è coach delle prime `coach_nations` nazioni e BENCH_SCOUT
+    è scout di una di esse.
+    """
+    rnd = random.Random(seed)
+    nations = [str(100 + i) for i in range(n_nations)]
+    coach_leagues = nations[:coach_nations]
+
+    teams = {}
+    for i, league_id in enumerate(nations):
+        owner = BENCH_COACH if league_id in coach_leagues else f"coach{i}@bench.local"
+        for level in ('U21', 'NT'):
+            team_id = f"team-{league_id}-{level.lower()}"
+            teams[team_id] = {
+                'name': f"{level} {league_id}",
+                'type': level,
+                'owner': owner,
+                'NativeLeagueID': league_id
+            }
+
+    memberships = {}
+    for league_id in coach_leagues[:1]:
+        team_id = f"team-{league_id}-u21"
+        memberships[f"{BENCH_SCOUT}_{team_id}"] = {'email': BENCH_SCOUT, 'team_id': team_id, 'role': 'scout'}
+
+    players = {}
+    by_nation = {league_id: [] for league_id in nations}
+    for i in range(n_players):
+        player_id = str(400000000 + i)
+        league_id = nations[i % n_nations]
+        owner = BENCH_COACH if league_id in coach_leagues else f"owner{league_id}@bench.local"
+        players[player_id] = _player(rnd, player_id, league_id, owner)
+        by_nation[league_id].append(player_id)
+
+    lists = {}
+    for team_id, team in teams.items():
+        pool = by_nation[team['NativeLeagueID']]
+        for n in range(lists_per_team):
+            list_id = f"list-{team_id}-{n}"
+            # Al massimo metà della nazione, così restano giocatori da aggiungere alle liste
+            members = rnd.sample(pool, min(list_size, len(pool) // 2))
+            lists[list_id] = {'name': f"Lista {n}", 'owner': team['owner'], 'team_id': team_id,
+                              'created_at': FETCHED_DATE, 'player_ids': members}
+            for player_id in members:
+                players[player_id]['list_ids'].append(list_id)
+
+    return Dataset(players, nations, teams, memberships, lists, coach_leagues)
+
+
+def import_rows(dataset, count, offset=0):
+    """Righe CSV sintetiche per import_players (giocatori nuovi, ID oltre quelli del dataset)."""
+    rnd = random.Random(offset)
+    start = 400000000 + len(dataset.players) + offset
+    rows = []
+    for i in range(count):
+        p = _player(rnd, str(start + i), dataset.coach_leagues[i % len(dataset.coach_leagues)])
+        rows.append({k: v for k, v in p.items()
+                     if k not in ('updated_at', 'list_ids', 'owner_email') and not k.startswith('search_')})
+    return rows
+
+
+# ---------------------------------------------------------
+# MOCK HATTRICK (players.xml + playerdetails)
+# ---------------------------------------------------------
+class _GeneratorStream:
+    """File-like di sola lettura che produce l'XML a blocchi da un generatore."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = b''
+        self.decode_content = False
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _Response:
+    def __init__(self, status_code, raw=None, headers=None, content=b''):
+        self.status_code = status_code
+        self.raw = raw
+        self.headers = headers or {}
+        self.content = content
+
+
+def _tag(name, value):
+    return f"<{name}>{escape(str(value))}</{name}>"
+
+
+def players_xml_chunks(players, changed_ids=()):
+    """players.xml per la sync; i giocatori in changed_ids hanno TSI diverso (digest cambiato)."""
+    changed = set(changed_ids)
+    yield (
+        '<?xml version="1.0" encoding="utf-8"?>\n<HattrickData>'
+        + _tag('FileName', 'players.xml')
+        + _tag('FetchedDate', FETCHED_DATE.strftime('%Y-%m-%d %H:%M:%S'))
+        + '<Team><TeamID>1</TeamID><PlayerList>'
+    ).encode('utf-8')
+    for p in players:
+        tsi = int(p['TSI']) + (1 if p['PlayerID'] in changed else 0)
+        fields = [_tag('PlayerID', p['PlayerID']), _tag('FirstName', p['FirstName']),
+                  _tag('LastName', p['LastName']), _tag('Age', p['Age']), _tag('AgeDays', p['AgeDays']),
+                  _tag('TSI', tsi), _tag('PlayerForm', p['PlayerForm']),
+                  _tag('CountryID', p['CountryID']), _tag('InjuryLevel', p['InjuryLevel']),
+                  _tag('StaminaSkill', p['StaminaSkill'])]
+        fields += [_tag(f, p[f]) for f in SKILL_XML_FIELDS]
+        yield ('<Player>' + ''.join(fields) + '</Player>').encode('utf-8')
+    yield b'</PlayerList></Team></HattrickData>'
+
+
+def player_detail_xml(p):
+    skills = ''.join(_tag(f, p[f]) for f in ('StaminaSkill',) + SKILL_XML_FIELDS)
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n<HattrickData>'
+        + _tag('FileName', 'playerdetails.xml') + _tag('UserID', '1')
+        + _tag('FetchedDate', FETCHED_DATE.strftime('%Y-%m-%d %H:%M:%S'))
+        + '<Player>' + _tag('PlayerID', p['PlayerID']) + _tag('FirstName', p['FirstName'])
+        + _tag('LastName', p['LastName']) + _tag('Age', p['Age']) + _tag('AgeDays', p['AgeDays'])
+        + '<OwningTeam><TeamID>1</TeamID><TeamName>Bench FC</TeamName><LeagueID>1</LeagueID></OwningTeam>'
+        + _tag('NativeLeagueID', p['NativeLeagueID']) + _tag('TSI', p['TSI'])
+        + '<PlayerSkills>' + skills + '</PlayerSkills>'
+        + '</Player></HattrickData>'
+    ).encode('utf-8')
+
+
+def hattrick_client_factory(players, latency_ms=0.0, changed_ids=()):
+    """
+    Classe con la stessa interfaccia di HattrickClient che serve players.xml e i dettagli
+    dai giocatori sintetici, con latenza HTTP simulata per richiesta.
+    """
+    by_id = {p['PlayerID']: p for p in players}
+
+    class SyntheticHattrickClient:
+        def __init__(self, base_url, max_workers=None, **kwargs):
+            self.base_url = base_url
+            self.max_workers = int(max_workers or 8)
+            self._executor = None
+
+        def _wait(self):
+            if latency_ms > 0:
+                time.sleep(latency_ms / 1000.0)
+
+        def fetch_player_list(self, timeout=10, stream=False, etag=None):
+            self._wait()
+            return _Response(200, raw=_GeneratorStream(players_xml_chunks(players, changed_ids)))
+
+        def _fetch_detail(self, player_id):
+            self._wait()
+            p = by_id.get(str(player_id))
+            return player_detail_xml(p) if p else None
+
+        def fetch_player_details(self, player_ids, timeout=5):
+            if not player_ids:
+                return {}
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return dict(zip(player_ids, self._executor.map(self._fetch_detail, player_ids)))
+
+        def close(self):
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+
+    return SyntheticHattrickClient
@@ -0,0 +1,39 @@
+import time
+from contextlib import contextmanager
+
+# Istante (approssimato) di avvio del processo: questo modulo è il primo importato da main
+PROCESS_START = time.perf_counter()
+
+# Durata (ms) della prima esecuzione di ogni fase di avvio
+TIMINGS = {}
+
+_state = {"first_request_at": None}
+
+
+@contextmanager
+def stage(name):
+    """Misura una fase di avvio; viene registrata solo la prima occorrenza (quella a freddo)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if name not in TIMINGS:
+            TIMINGS[name] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def mark_first_request():
+    """Ritorna True solo alla prima richiesta servita dall'istanza."""
+    if _state["first_request_at"] is not None:
+        return False
+    _state["first_request_at"] = time.perf_counter()
+    return True
+
+
+def report():
+    """Riepilogo dei tempi di cold start dell'istanza corrente."""
+    first = _state["first_request_at"]
+    return {
+        "stages_ms": dict(TIMINGS),
+        "process_to_first_request_ms": round((first - PROCESS_START) * 1000, 2) if first else None,
+        "uptime_s": round(time.perf_counter() - PROCESS_START, 1)
+    }
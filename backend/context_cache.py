@@ -0,0 +1,99 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# TTL (secondi) e dimensione massima della cache condivisa tra le richieste di un'istanza calda.
+# ROLE_CACHE_TTL_SECONDS=0 disattiva la cache cross-request (resta solo la memoizzazione per richiesta).
+ROLE_CACHE_TTL_SECONDS = float(os.environ.get('ROLE_CACHE_TTL_SECONDS', '30'))
+ROLE_CACHE_MAX_SIZE = int(os.environ.get('ROLE_CACHE_MAX_SIZE', '1024'))
+
+_request_scope = contextvars.ContextVar('request_scope', default=None)
+
+
+class TTLCache:
+    """Cache LRU thread-safe con scadenza per voce."""
+
+    def __init__(self, ttl_seconds, max_size):
+        self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def request_scoped(fn):
+    """
+    Decoratore per l'entry point HTTP: apre uno scope di memoizzazione
+    valido solo per la durata della richiesta corrente.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _request_scope.set({})
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request_scope.reset(token)
+    return wrapper
+
+
+def request_get(key):
+    """Valore memoizzato nella richiesta corrente (None se assente o fuori scope)."""
+    scope = _request_scope.get()
+    if scope is None:
+        return None
+    return scope.get(key)
+
+
+def request_set(key, value):
+    scope = _request_scope.get()
+    if scope is not None:
+        scope[key] = value
+
+
+def request_invalidate(key):
+    scope = _request_scope.get()
+    if scope is not None:
+        scope.pop(key, None)
+
+
+# Contesto permessi (RoleManager.get_user_context) indicizzato per email
+user_context_cache = TTLCache(ROLE_CACHE_TTL_SECONDS, ROLE_CACHE_MAX_SIZE)
+
+# Nazione (NativeLeagueID) dei team, usata per servire le liste dal pool giocatori
+team_league_cache = TTLCache(ROLE_CACHE_TTL_SECONDS, ROLE_CACHE_MAX_SIZE)
+
+# Stato del backfill dello schema tipizzato dei giocatori (firebase.schema_migrated)
+schema_state_cache = TTLCache(ROLE_CACHE_TTL_SECONDS, 8)
@@ -1,16 +1,292 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
-import requests
-import xml.etree.ElementTree as ET
-from datetime import datetime
-import pytz # Potrebbe servire per gestire le timezone se necessario, ma proviamo senza per ora se Hattrick è naive o UTC
-
-# Inizializza l'app Firebase solo se non è già stata inizializzata
-if not firebase_admin._apps:
-    # Su Cloud Run/Functions, le credenziali di default (Service Account) vengono rilevate automaticamente
-    firebase_admin.initialize_app()
-
-db = firestore.client()
+import asyncio
+import bisect
+import contextvars
+import copy
+import hashlib
+import heapq
+import importlib
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timezone
+import context_cache
+import coldstart
+import instrumentation
+import player_import
+import player_pool
+import player_query
+import player_schema
+import player_search
+import skill_history
+
+
+class _LazyModule:
+    """Importa il modulo solo al primo accesso a un suo attributo (riduce il cold start)."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with coldstart.stage(f"import:{self._name}"):
+                self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+class _LazyFirestoreClient:
+    """
+    Client Firestore creato al primo utilizzo e poi riusato per tutta la vita dell'istanza calda.
+    Espone gli stessi metodi del client (collection, batch, get_all, ...); query, riferimenti
+    e batch restituiti sono avvolti da instrumentation per misurare letture e scritture.
+    Con is_async=True crea il client async (firebase_admin.firestore_async), da usare solo
+    nelle coroutine eseguite da async_runtime.
+    """
+    def __init__(self, is_async=False):
+        self._client = None
+        self._is_async = is_async
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    stage = 'firestore_async_client' if self._is_async else 'firestore_client'
+                    with coldstart.stage(stage):
+                        import firebase_admin
+                        # Inizializza l'app Firebase solo se non è già stata inizializzata
+                        if not firebase_admin._apps:
+                            # Su Cloud Run/Functions, le credenziali di default (Service Account) vengono rilevate automaticamente
+                            firebase_admin.initialize_app()
+                        if self._is_async:
+                            self._client = firestore_async.client()
+                        else:
+                            self._client = firestore.client()
+        return self._client
+
+    def use(self, client):
+        """Sostituisce il client (es. con uno in memoria per i benchmark); None torna al client reale."""
+        with self._lock:
+            self._client = client
+        if not self._is_async:
+            # I listener del pool giocatori e lo stato dello schema appartengono al client precedente
+            player_pool.pool.clear()
+            context_cache.schema_state_cache.clear()
+
+    def __getattr__(self, attr):
+        return instrumentation.traced_client_call(self._get_client(), attr)
+
+
+firestore = _LazyModule('firebase_admin.firestore')
+firestore_async = _LazyModule('firebase_admin.firestore_async')
+db = _LazyFirestoreClient()
+# Client async per le letture indipendenti eseguite in parallelo (metodi *_async)
+adb = _LazyFirestoreClient(is_async=True)
+
+MOCK_BASE_URL = "https://nt-data-lab-705728164092.europe-west1.run.app/mock"
+
+# Limite massimo di operazioni per singolo WriteBatch Firestore
+FIRESTORE_BATCH_LIMIT = 500
+
+# Numero massimo di valori per un filtro 'in' / 'array_contains_any'
+FIRESTORE_IN_LIMIT = 30
+
+# Query eseguite in parallelo quando un filtro 'in' viene diviso in blocchi
+QUERY_MAX_WORKERS = int(os.environ.get('QUERY_MAX_WORKERS', '8'))
+
+# Giocatori per WriteBatch quando ognuno ha anche la voce di storico skill (due scritture)
+PLAYERS_PER_HISTORY_BATCH = FIRESTORE_BATCH_LIMIT // 2
+
+# Campi letti dal documento del giocatore a salvataggio e import: base del delta della voce
+# di storico e, per gli aggiornamenti parziali, di target_pct e league_id (player_schema)
+HISTORY_FIELD_PATHS = list(skill_history.SNAPSHOT_FIELDS) + ['history_year'] + list(player_schema.LEAGUE_SOURCES)
+
+# Giocatori aggiunti/rimossi per transazione: una scrittura per giocatore più quella della lista
+MEMBERS_PER_TRANSACTION = FIRESTORE_BATCH_LIMIT - 1
+
+# Dimensione di default e massima di una pagina di risultati di ricerca
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+
+# Documenti letti al massimo per pagina di query strutturata (predicati valutati sul server):
+# raggiunto il limite la pagina può essere incompleta e il cursore riprende da dove si è fermata
+QUERY_MAX_SCAN = int(os.environ.get('QUERY_MAX_SCAN', '5000'))
+
+# Documento di sync_state con l'avanzamento del backfill dello schema tipizzato di players-details
+PLAYER_SCHEMA_STATE_DOC = 'players_schema'
+
+# Campi della lista (players.xml) che concorrono al digest del giocatore per la sync incrementale
+CONTENT_HASH_FIELDS = (
+    'StaminaSkill', 'KeeperSkill', 'PlaymakerSkill', 'ScorerSkill', 'PassingSkill',
+    'WingerSkill', 'DefenderSkill', 'SetPiecesSkill',
+    'TSI', 'PlayerForm', 'InjuryLevel'
+)
+
+class Page(list):
+    """Lista di risultati con il cursore della pagina successiva (None se è l'ultima)."""
+    def __init__(self, items=(), next_page_token=None):
+        super().__init__(items)
+        self.next_page_token = next_page_token
+
+def fetch_page(query, page_size=None, page_token=None, fields=None, id_key='id', in_filter=None):
+    """
+    Esegue la query con proiezione (select) e paginazione a cursore opzionali.
+    - fields: lista di campi da restituire (None = documento completo)
+    - page_size/page_token: ordina per ID documento, limita a page_size e riparte
+      dopo l'ID page_token. Senza page_size ritorna tutti i risultati.
+    - in_filter: (campo, operatore, valori) per un filtro 'in'/'array_contains_any' con un
+      numero qualsiasi di valori, eseguito a blocchi tramite stream_in
+    Ritorna una Page con next_page_token valorizzato se ci sono altri risultati.
+    """
+    if fields:
+        query = query.select(list(fields))
+    limit = None
+    if page_size:
+        page_size = int(page_size)
+        query = query.order_by('__name__')
+        if page_token:
+            query = query.start_after({'__name__': page_token})
+        # page_size + 1 per sapere se esiste una pagina successiva
+        limit = page_size + 1
+        query = query.limit(limit)
+
+    if in_filter:
+        field, op, values = in_filter
+        docs = stream_in(query, field, values, op=op, limit=limit, order_by='__name__' if page_size else None)
+    else:
+        docs = query.stream()
+
+    items = []
+    for doc in docs:
+        data = doc.to_dict()
+        data[id_key] = doc.id
+        items.append(data)
+
+    next_token = None
+    if page_size and len(items) > page_size:
+        items = items[:page_size]
+        next_token = items[-1][id_key]
+    return Page(items, next_token)
+
+# ---------------------------------------------------------
+# QUERY 'IN' A BLOCCHI
+# ---------------------------------------------------------
+_query_executor = None
+_query_executor_lock = threading.Lock()
+
+def _executor():
+    """Pool di thread condiviso per le query parallele (creato al primo utilizzo)."""
+    global _query_executor
+    if _query_executor is None:
+        with _query_executor_lock:
+            if _query_executor is None:
+                _query_executor = ThreadPoolExecutor(max_workers=QUERY_MAX_WORKERS)
+    return _query_executor
+
+def chunked_queries(query, field, values, op='in'):
+    """Una query per ogni blocco di FIRESTORE_IN_LIMIT valori (duplicati rimossi)."""
+    values = list(dict.fromkeys(values))
+    return [query.where(field, op, values[i:i + FIRESTORE_IN_LIMIT])
+            for i in range(0, len(values), FIRESTORE_IN_LIMIT)]
+
+def _order_value(doc, field):
+    if field == '__name__':
+        return doc.id
+    try:
+        value = doc.get(field)
+    except KeyError:
+        value = None
+    return '' if value is None else value
+
+def stream_queries(queries, limit=None, order_by=None, descending=False):
+    """
+    Esegue più query in parallelo e restituisce i documenti in streaming, senza duplicati
+    (per ID) e fermandosi a `limit`. Con order_by (campo già usato come ordinamento da ogni
+    query, decrescente se descending) i risultati vengono fusi mantenendo l'ordine, a parità
+    di valore per ID come in Firestore; altrimenti arrivano nell'ordine in cui le query terminano.
+    """
+    if not queries:
+        return
+    seen = set()
+
+    def emit(docs):
+        for doc in docs:
+            if doc.id in seen:
+                continue
+            seen.add(doc.id)
+            yield doc
+            if limit is not None and len(seen) >= limit:
+                return
+
+    if len(queries) == 1:
+        yield from emit(queries[0].stream())
+        return
+
+    # Ogni thread esegue una query nel contesto della richiesta (strumentazione inclusa)
+    futures = [_executor().submit(contextvars.copy_context().run, lambda q=q: list(q.stream()))
+               for q in queries]
+    if order_by is None:
+        for future in as_completed(futures):
+            for doc in emit(future.result()):
+                yield doc
+            if limit is not None and len(seen) >= limit:
+                break
+    else:
+        results = [f.result() for f in futures]
+        yield from emit(heapq.merge(*results, key=lambda doc: (_order_value(doc, order_by), doc.id),
+                                    reverse=descending))
+
+def stream_in(query, field, values, op='in', limit=None, order_by=None):
+    """
+    Filtro field op values (op = 'in' o 'array_contains_any') senza il limite dei 30 valori:
+    la query viene divisa in blocchi eseguiti in parallelo e uniti da stream_queries.
+    """
+    return stream_queries(chunked_queries(query, field, values, op), limit, order_by)
+
+def league_id_variants(league_ids):
+    """League ID sia come stringa che come intero: in players-details convivono i due tipi."""
+    values = []
+    for lid in league_ids:
+        values.append(str(lid))
+        try:
+            values.append(int(lid))
+        except (TypeError, ValueError):
+            pass
+    return values
+
+def schema_migrated():
+    """
+    True se il backfill dello schema tipizzato ha coperto tutta players-details (versione
+    corrente): da quel momento ogni giocatore ha league_id. Stato in cache per ROLE_CACHE_TTL_SECONDS.
+    """
+    migrated = context_cache.schema_state_cache.get(PLAYER_SCHEMA_STATE_DOC)
+    if migrated is None:
+        snap = db.collection('sync_state').document(PLAYER_SCHEMA_STATE_DOC).get()
+        state = snap.to_dict() if snap.exists else {}
+        migrated = state.get('done_version') == player_schema.SCHEMA_VERSION
+        context_cache.schema_state_cache.set(PLAYER_SCHEMA_STATE_DOC, migrated)
+    return migrated
+
+def league_queries(query, league_ids):
+    """
+    Blocchi 'in' della query sulle nazioni indicate. A schema migrato un solo campo indicizzato
+    (league_id, intero); prima del backfill NativeLeagueID e CountryID, come stringa o intero.
+    """
+    if schema_migrated():
+        ids = []
+        for lid in league_ids:
+            try:
+                ids.append(player_schema.to_int(lid))
+            except (TypeError, ValueError):
+                pass
+        return chunked_queries(query, player_schema.LEAGUE_FIELD, list(dict.fromkeys(ids)))
+
+    values = league_id_variants(league_ids)
+    queries = []
+    for field in player_schema.LEAGUE_SOURCES:
+        queries += chunked_queries(query, field, values)
+    return queries
+
+@instrumentation.trace_methods
 class UserManager:
     def __init__(self):
         self.collection_name = 'users'
@@ -39,27 +315,22 @@ class UserManager:
         }
         
         db.collection(self.collection_name).document(email).set(clean_data, merge=True)
+        RoleManager.invalidate_user_context(email)
         return {"status": "success", "email": email}
 
+@instrumentation.trace_methods
 class TargetManager:
     def __init__(self):
         self.collection_name = 'user_targets'
 
-    def get_user_targets(self, email):
-        """Recupera tutti i target salvati per un determinato utente (email)."""
+    def get_user_targets(self, email, page_size=None, page_token=None, fields=None):
+        """Recupera i target salvati per un determinato utente (email), con paginazione opzionale."""
         if not email:
             raise ValueError("Email utente mancante.")
         
         # Query: where email == user_email
-        docs = db.collection(self.collection_name).where('user_email', '==', email).stream()
-        
-        targets = []
-        for doc in docs:
-            data = doc.to_dict()
-            data['id'] = doc.id
-            targets.append(data)
-        
-        return targets
+        query = db.collection(self.collection_name).where('user_email', '==', email)
+        return fetch_page(query, page_size, page_token, fields)
 
     def save_target(self, email, target_data):
         """Salva (crea o sovrascrive) un target."""
@@ -102,6 +373,7 @@ class TargetManager:
         doc_ref.delete()
         return {"status": "deleted", "id": target_id}
 
+@instrumentation.trace_methods
 class TeamManager:
     def __init__(self):
         self.collection_name = 'teams'
@@ -116,6 +388,41 @@ class TeamManager:
             teams.append(t)
         return teams
 
+    async def get_coach_teams_async(self, coach_email):
+        teams = []
+        async for doc in adb.collection(self.collection_name).where('owner', '==', coach_email).stream():
+            t = doc.to_dict()
+            t['id'] = doc.id
+            teams.append(t)
+        return teams
+
+    def get_teams_by_ids(self, team_ids):
+        """Legge più team con una sola multi-get (get_all). Ritorna {team_id: dict}."""
+        unique_ids = list(dict.fromkeys(tid for tid in team_ids if tid))
+        if not unique_ids:
+            return {}
+        refs = [db.collection(self.collection_name).document(tid) for tid in unique_ids]
+        teams = {}
+        for snap in db.get_all(refs):
+            if snap.exists:
+                t = snap.to_dict()
+                t['id'] = snap.id
+                teams[snap.id] = t
+        return teams
+
+    async def get_teams_by_ids_async(self, team_ids):
+        unique_ids = list(dict.fromkeys(tid for tid in team_ids if tid))
+        if not unique_ids:
+            return {}
+        refs = [adb.collection(self.collection_name).document(tid) for tid in unique_ids]
+        teams = {}
+        async for snap in adb.get_all(refs):
+            if snap.exists:
+                t = snap.to_dict()
+                t['id'] = snap.id
+                teams[snap.id] = t
+        return teams
+
     def is_coach_of(self, coach_email, team_id):
         """Verifica se l'utente è il coach di uno specifico team."""
         doc = db.collection(self.collection_name).document(team_id).get()
@@ -130,6 +437,7 @@ class TeamManager:
             return True
         return False
 
+@instrumentation.trace_methods
 class MembershipManager:
     def __init__(self):
         self.collection_name = 'memberships'
@@ -155,6 +463,12 @@ class MembershipManager:
             memberships.append(doc.to_dict())
         return memberships
 
+    async def get_user_memberships_async(self, email):
+        memberships = []
+        async for doc in adb.collection(self.collection_name).where('email', '==', email).stream():
+            memberships.append(doc.to_dict())
+        return memberships
+
     def get_team_members(self, team_id):
         """Ritorna tutti i membri di uno specifico team."""
         docs = db.collection(self.collection_name).where('team_id', '==', team_id).stream()
@@ -163,28 +477,78 @@ class MembershipManager:
             members.append(doc.to_dict())
         return members
 
+    def get_members_of_teams(self, team_ids):
+        """Ritorna i membri di più team (query 'in' a blocchi eseguiti in parallelo)."""
+        query = db.collection(self.collection_name)
+        return [doc.to_dict() for doc in stream_in(query, 'team_id', team_ids)]
+
+@instrumentation.trace_methods
 class RoleManager:
     def __init__(self):
         self.team_manager = TeamManager()
         self.membership_manager = MembershipManager()
 
+    @staticmethod
+    def invalidate_user_context(email):
+        """Invalida il contesto permessi memoizzato (richiesta corrente e cache di istanza)."""
+        context_cache.user_context_cache.invalidate(email)
+        context_cache.request_invalidate(('user_context', email))
+
     def get_user_context(self, email):
         """
         Ritorna il contesto completo dell'utente:
         - I team di cui è Coach
         - I team di cui è Membro (scout/assistant)
+        Il risultato è memoizzato per la richiesta corrente e, con TTL, per l'istanza.
         """
+        ctx = self._cached_context(email)
+        if ctx is None:
+            ctx = self._store_context(email, self._load_user_context(email))
+
+        # Copia difensiva: i chiamanti possono modificare il dict ritornato
+        return copy.deepcopy(ctx)
+
+    async def get_user_context_async(self, email):
+        """Come get_user_context, con le query su team posseduti e membership in parallelo."""
+        ctx = self._cached_context(email)
+        if ctx is None:
+            owned_teams, memberships = await asyncio.gather(
+                self.team_manager.get_coach_teams_async(email),
+                self.membership_manager.get_user_memberships_async(email)
+            )
+            teams = await self.team_manager.get_teams_by_ids_async([m.get('team_id') for m in memberships])
+            ctx = self._store_context(email, self._build_user_context(owned_teams, memberships, teams))
+        return copy.deepcopy(ctx)
+
+    def _cached_context(self, email):
+        key = ('user_context', email)
+        ctx = context_cache.request_get(key)
+        if ctx is None:
+            ctx = context_cache.user_context_cache.get(email)
+            if ctx is not None:
+                context_cache.request_set(key, ctx)
+        return ctx
+
+    def _store_context(self, email, ctx):
+        context_cache.user_context_cache.set(email, ctx)
+        context_cache.request_set(('user_context', email), ctx)
+        return ctx
+
+    def _load_user_context(self, email):
         owned_teams = self.team_manager.get_coach_teams(email)
         memberships = self.membership_manager.get_user_memberships(email)
         
-        # Arricchiamo le membership con le info del team (nome, tipo)
+        # Arricchiamo le membership con le info del team (nome, tipo) con una sola multi-get
+        teams = self.team_manager.get_teams_by_ids([m.get('team_id') for m in memberships])
+        return self._build_user_context(owned_teams, memberships, teams)
+
+    @staticmethod
+    def _build_user_context(owned_teams, memberships, teams):
         enriched_memberships = []
         for m in memberships:
-            team_id = m.get('team_id')
-            team_doc = db.collection('teams').document(team_id).get()
-            if team_doc.exists:
-                m['team_info'] = team_doc.to_dict()
-                m['team_info']['id'] = team_doc.id
+            team_info = teams.get(m.get('team_id'))
+            if team_info is not None:
+                m['team_info'] = dict(team_info)
             enriched_memberships.append(m)
         
         return {
@@ -201,46 +565,47 @@ class RoleManager:
         if not self.team_manager.is_coach_of(requester_email, team_id):
             raise PermissionError("Solo il Coach del team può assegnare ruoli per questo team.")
         
-        return self.membership_manager.set_membership(target_email, team_id, new_role)
+        result = self.membership_manager.set_membership(target_email, team_id, new_role)
+        self.invalidate_user_context(target_email)
+        return result
     
     def get_managed_league_ids(self, email):
         """
         Ritorna la lista delle NativeLeagueID che l'utente può gestire.
+        Derivata dal contesto utente (memoizzato), senza query aggiuntive.
         """
-        owned_teams = self.team_manager.get_coach_teams(email)
-        memberships = self.membership_manager.get_user_memberships(email)
-        
+        return self.managed_league_ids(self.get_user_context(email))
+
+    @staticmethod
+    def managed_league_ids(ctx):
+        """NativeLeagueID dei team posseduti e di quelli delle membership nel contesto utente."""
         managed_league_ids = set()
         
         # 1. Team owned
-        for t in owned_teams:
+        for t in ctx['owned_teams']:
             nlid = t.get('NativeLeagueID')
             if nlid:
                 managed_league_ids.add(str(nlid))
         
         # 2. Memberships
-        for m in memberships:
-            tid = m.get('team_id')
-            if tid:
-                team_doc = db.collection('teams').document(tid).get()
-                if team_doc.exists:
-                    nlid = team_doc.to_dict().get('NativeLeagueID')
-                    if nlid:
-                        managed_league_ids.add(str(nlid))
+        for m in ctx['memberships']:
+            nlid = m.get('team_info', {}).get('NativeLeagueID')
+            if nlid:
+                managed_league_ids.add(str(nlid))
         
         return list(managed_league_ids)
     
     def get_all_managed_users(self, requester_email):
         """Ritorna tutti gli utenti in tutti i team gestiti da questo coach."""
         owned_teams = self.team_manager.get_coach_teams(requester_email)
+        teams_by_id = {t['id']: t for t in owned_teams}
         all_members = []
-        for team in owned_teams:
-            members = self.membership_manager.get_team_members(team['id'])
-            for m in members:
-                m['team_info'] = team
-                all_members.append(m)
+        for m in self.membership_manager.get_members_of_teams(list(teams_by_id)):
+            m['team_info'] = teams_by_id.get(m.get('team_id'))
+            all_members.append(m)
         return all_members
 
+@instrumentation.trace_methods
 class ListManager:
     def __init__(self):
         self.lists_coll = 'lists'
@@ -254,20 +619,18 @@ class ListManager:
         ids += [m['team_id'] for m in ctx['memberships']]
         return list(set(ids))
 
-    def get_lists(self, user_email):
-        """Ritorna tutte le liste visibili all'utente (coach o membro)."""
+    def get_lists(self, user_email, page_size=None, page_token=None, fields=None):
+        """Ritorna le liste visibili all'utente (coach o membro), con paginazione opzionale."""
         team_ids = self._get_visible_team_ids(user_email)
         if not team_ids:
-            return []
+            return Page()
 
-        # Firestore limit: array_in supporta fino a 30 elementi.
-        # Se sono di più andrebbe divisa in più query, ma per ora assumiamo < 30.
-        docs = db.collection(self.lists_coll).where('team_id', 'in', team_ids).stream()
-        lists = []
-        for doc in docs:
-            l = doc.to_dict()
-            l['id'] = doc.id
-            lists.append(l)
+        # Filtro 'in' a blocchi: nessun limite sul numero di team visibili
+        lists = fetch_page(db.collection(self.lists_coll), page_size, page_token, fields,
+                           in_filter=('team_id', 'in', team_ids))
+        # L'indice dei membri resta sul server: al client basta player_count
+        for l in lists:
+            l.pop('player_ids', None)
         return lists
 
     def create_list(self, user_email, name, team_id):
@@ -280,6 +643,8 @@ class ListManager:
             'name': name,
             'owner': user_email,
             'team_id': team_id,
+            'player_ids': [],
+            'player_count': 0,
             'created_at': firestore.SERVER_TIMESTAMP
         }
         update_time, doc_ref = db.collection(self.lists_coll).add(data)
@@ -300,99 +665,352 @@ class ListManager:
         if team_id not in team_ids:
              raise PermissionError("Non hai permessi su questa lista.")
 
+        # Toglie la lista dai giocatori membri prima di eliminarla (update: i giocatori
+        # eliminati nel frattempo vengono saltati, senza ricreare documenti vuoti)
+        member_ids = self._member_ids(list_id, data)
+        for i in range(0, len(member_ids), FIRESTORE_BATCH_LIMIT):
+            refs = self._existing_player_refs(member_ids[i:i + FIRESTORE_BATCH_LIMIT])
+            if not refs:
+                continue
+            batch = db.batch()
+            for player_ref in refs:
+                batch.update(player_ref, {'list_ids': firestore.ArrayRemove([list_id])})
+            batch.commit()
+
         doc_ref.delete()
         return {"id": list_id, "status": "deleted"}
 
     def add_player(self, user_email, list_id, player_id):
         """Aggiunge un giocatore ad una lista se l'utente ha i permessi sulla nazione del giocatore."""
-        # 1. Verifica accesso alla lista
-        doc_list = db.collection(self.lists_coll).document(list_id).get()
-        if not doc_list.exists:
-            return {"status": "error", "message": "Lista non trovata"}
-        
-        team_id = doc_list.to_dict().get('team_id')
-        team_ids = self._get_visible_team_ids(user_email)
-        if team_id not in team_ids:
-            raise PermissionError("Non hai permessi su questa lista.")
+        return self._single_add_result(self.add_players(user_email, list_id, [player_id]))
 
-        # 2. Recupera la nazione (NativeLeagueID) associata alla lista tramite il team
-        team_doc = db.collection('teams').document(team_id).get()
-        if not team_doc.exists:
-            return {"status": "error", "message": "Team associato alla lista non trovato."}
-        
-        list_league_id = str(team_doc.to_dict().get('NativeLeagueID', ''))
+    async def add_player_async(self, user_email, list_id, player_id):
+        return self._single_add_result(await self.add_players_async(user_email, list_id, [player_id]))
 
-        # 3. Verifica permessi sul giocatore (NativeLeagueID)
-        player_ref = db.collection(self.players_coll).document(str(player_id))
-        player_snap = player_ref.get()
-        if not player_snap.exists:
-            return {"status": "error", "message": "Giocatore non trovato nel database."}
-        
-        player_data = player_snap.to_dict()
-        player_league_id = str(player_data.get('NativeLeagueID', ''))
-        
-        # 4. Controllo incrociato: la nazione del giocatore deve corrispondere alla nazione della lista
-        if player_league_id != list_league_id:
-            raise PermissionError(f"Questo giocatore (Nazione {player_league_id}) non può essere aggiunto a questa lista (Nazione {list_league_id}).")
-
-        # 5. Verifica globale permessi utente (opzionale ma sicuro)
-        from firebase import RoleManager
-        role_mgr = RoleManager()
-        if player_league_id not in role_mgr.get_managed_league_ids(user_email):
-            raise PermissionError(f"Non hai i permessi per gestire giocatori della nazione {player_league_id}.")
-
-        # 3. Procedi con l'aggiunta
-        player_ref.set({
-            'list_ids': firestore.ArrayUnion([list_id])
-        }, merge=True)
+    @staticmethod
+    def _single_add_result(result):
+        """Risposta storica di add_player a partire dall'esito di add_players."""
+        if result["status"] == "error":
+            return result
+
+        for rejected in result["rejected"]:
+            if rejected["reason"] == "not_found":
+                return {"status": "error", "message": rejected["message"]}
+            raise PermissionError(rejected["message"])
         return {"status": "added"}
     
-    def remove_player(self, list_id, player_id):
-        player_ref = db.collection(self.players_coll).document(str(player_id))
-        player_ref.update({
-            'list_ids': firestore.ArrayRemove([list_id])
-        })
+    def remove_player(self, user_email, list_id, player_id):
+        """Rimuove un giocatore da una lista, se l'utente ha accesso al team della lista."""
+        result = self.remove_players(user_email, list_id, [player_id])
+        if result["status"] == "error":
+            return result
         return {"status": "removed"}
+
+    def _resolve_list_access(self, user_email, list_id):
+        """
+        Legge la lista e ne ricava la nazione (NativeLeagueID) dal contesto permessi dell'utente,
+        verificando che il team della lista sia tra quelli visibili.
+        Ritorna (dati_lista, league_id) oppure (None, messaggio di errore).
+        """
+        doc_list = db.collection(self.lists_coll).document(list_id).get()
+        if not doc_list.exists:
+            return None, "Lista non trovata"
+        return self._list_access(doc_list.to_dict(), self.role_manager.get_user_context(user_email))
+
+    @staticmethod
+    def _list_access(list_data, ctx):
+        """Nazione della lista dal contesto permessi (vedi _resolve_list_access)."""
+        team_id = list_data.get('team_id')
+        teams = {t['id']: t for t in ctx['owned_teams']}
+        for m in ctx['memberships']:
+            teams.setdefault(m['team_id'], m.get('team_info'))
+        if team_id not in teams:
+            raise PermissionError("Non hai permessi su questa lista.")
+
+        team_info = teams[team_id]
+        if team_info is None:
+            # Membership verso un team non più esistente
+            return None, "Team associato alla lista non trovato."
+        return list_data, str(team_info.get('NativeLeagueID', ''))
+
+    def add_players(self, user_email, list_id, player_ids):
+        """
+        Aggiunge più giocatori ad una lista: permessi e nazione della lista vengono risolti
+        una sola volta, i giocatori letti con una multi-get e validati in memoria, e tutte le
+        aggiunte applicate in un'unica transazione (a blocchi se oltre il limite di scritture).
+        Ritorna added, already_present e rejected (player_id, reason, message).
+        """
+        list_data, list_league_id = self._resolve_list_access(user_email, list_id)
+        if list_data is None:
+            return {"status": "error", "message": list_league_id}
+
+        if list_league_id not in self.role_manager.get_managed_league_ids(user_email):
+            raise PermissionError(f"Non hai i permessi per gestire giocatori della nazione {list_league_id}.")
+
+        ids = list(dict.fromkeys(str(pid) for pid in player_ids if pid not in (None, '')))
+        refs = [db.collection(self.players_coll).document(pid) for pid in ids]
+        leagues = {}
+        for snap in db.get_all(refs, field_paths=['NativeLeagueID']) if refs else ():
+            if snap.exists:
+                leagues[snap.id] = str(snap.to_dict().get('NativeLeagueID', ''))
+        return self._apply_additions(list_id, ids, leagues, list_league_id)
+
+    async def add_players_async(self, user_email, list_id, player_ids):
+        """
+        Come add_players, ma lista, contesto permessi e nazioni dei giocatori vengono letti
+        in parallelo; la transazione resta quella sincrona, eseguita in un thread.
+        """
+        ids = list(dict.fromkeys(str(pid) for pid in player_ids if pid not in (None, '')))
+
+        async def player_leagues():
+            refs = [adb.collection(self.players_coll).document(pid) for pid in ids]
+            leagues = {}
+            if refs:
+                async for snap in adb.get_all(refs, field_paths=['NativeLeagueID']):
+                    if snap.exists:
+                        leagues[snap.id] = str(snap.to_dict().get('NativeLeagueID', ''))
+            return leagues
+
+        doc_list, ctx, leagues = await asyncio.gather(
+            adb.collection(self.lists_coll).document(list_id).get(),
+            self.role_manager.get_user_context_async(user_email),
+            player_leagues()
+        )
+        if not doc_list.exists:
+            return {"status": "error", "message": "Lista non trovata"}
+        list_data, list_league_id = self._list_access(doc_list.to_dict(), ctx)
+        if list_data is None:
+            return {"status": "error", "message": list_league_id}
+
+        if list_league_id not in RoleManager.managed_league_ids(ctx):
+            raise PermissionError(f"Non hai i permessi per gestire giocatori della nazione {list_league_id}.")
+        return await asyncio.to_thread(self._apply_additions, list_id, ids, leagues, list_league_id)
+
+    def _apply_additions(self, list_id, ids, leagues, list_league_id):
+        """Valida i giocatori (esistenza e nazione) e applica le aggiunte valide in transazione."""
+        valid, rejected = [], []
+        for pid in ids:
+            player_league_id = leagues.get(pid)
+            if player_league_id is None:
+                rejected.append({"player_id": pid, "reason": "not_found",
+                                 "message": "Giocatore non trovato nel database."})
+            elif player_league_id != list_league_id:
+                rejected.append({"player_id": pid, "reason": "nation_mismatch",
+                                 "message": f"Questo giocatore (Nazione {player_league_id}) non può essere aggiunto a questa lista (Nazione {list_league_id})."})
+            else:
+                valid.append(pid)
+
+        added = []
+        for i in range(0, len(valid), MEMBERS_PER_TRANSACTION):
+            chunk_added, _ = self._update_members(list_id, add=valid[i:i + MEMBERS_PER_TRANSACTION])
+            added += chunk_added
+
+        added_set = set(added)
+        return {
+            "status": "success",
+            "added": added,
+            "already_present": [pid for pid in valid if pid not in added_set],
+            "rejected": rejected
+        }
+
+    def remove_players(self, user_email, list_id, player_ids):
+        """Rimuove più giocatori da una lista con un unico controllo permessi e una transazione."""
+        list_data, error = self._resolve_list_access(user_email, list_id)
+        if list_data is None:
+            return {"status": "error", "message": error}
+
+        ids = list(dict.fromkeys(str(pid) for pid in player_ids if pid not in (None, '')))
+        removed = []
+        for i in range(0, len(ids), MEMBERS_PER_TRANSACTION):
+            _, chunk_removed = self._update_members(list_id, remove=ids[i:i + MEMBERS_PER_TRANSACTION])
+            removed += chunk_removed
+
+        removed_set = set(removed)
+        return {
+            "status": "success",
+            "removed": removed,
+            "not_in_list": [pid for pid in ids if pid not in removed_set]
+        }
     
-    def get_list_players(self, list_id):
-        docs = db.collection(self.players_coll).where('list_ids', 'array_contains', list_id).stream()
-        players = []
-        for doc in docs:
-            p = doc.to_dict()
-            p['player_id'] = doc.id
-            players.append(p)
-        return players
+    def get_list_players(self, list_id, page_size=None, page_token=None, fields=None):
+        return self.fetch_members_page(list_id, page_size, page_token, fields, id_key='player_id')
+
+    # ---------------------------------------------------------
+    # POOL GIOCATORI IN MEMORIA
+    # ---------------------------------------------------------
+    # Con PLAYER_POOL_ENABLED=1 i giocatori delle nazioni usate di recente restano in memoria
+    # (player_pool), aggiornati dai listener on_snapshot: ricerca, query e liste non eseguono
+    # query su players-details. Il pool tiene solo i campi interrogati (POOL_FIELDS): i documenti
+    # completi della pagina restituita si leggono con una multi-get. Senza pool (o se non è
+    # pronto) si usa Firestore come prima.
+
+    def _pool_queries(self, league_id):
+        """Query ascoltate dal pool per la nazione (una sola a schema migrato, vedi league_queries)."""
+        return league_queries(db.collection(self.players_coll), [league_id])
+
+    def player_pools(self, league_ids):
+        """NationPool delle nazioni indicate, o None se il pool non può servirle tutte."""
+        return player_pool.pool.nations(league_ids, self._pool_queries)
+
+    def list_league_id(self, list_data):
+        """NativeLeagueID del team della lista (in cache: la nazione di un team non cambia)."""
+        team_id = list_data.get('team_id')
+        if not team_id:
+            return None
+        league_id = context_cache.team_league_cache.get(team_id)
+        if league_id is None:
+            team_doc = db.collection('teams').document(team_id).get()
+            if not team_doc.exists:
+                return None
+            league_id = str(team_doc.to_dict().get('NativeLeagueID', ''))
+            context_cache.team_league_cache.set(team_id, league_id)
+        return league_id or None
+
+    # ---------------------------------------------------------
+    # INDICE MEMBRI DELLA LISTA
+    # ---------------------------------------------------------
+    # Ogni lista tiene in player_ids (ordinati) e player_count i propri membri, aggiornati
+    # in transazione insieme a list_ids sul giocatore: la lista si apre con una lettura
+    # del documento più una multi-get dei giocatori, senza query array_contains.
+
+    def _member_ids(self, list_id, list_data, transaction=None):
+        """
+        ID dei membri dall'indice della lista. Per le liste create prima dell'indice
+        (senza player_ids) li ricava dalla query array_contains su list_ids.
+        """
+        ids = list_data.get('player_ids')
+        if ids is not None:
+            return list(ids)
+        query = db.collection(self.players_coll).where('list_ids', 'array_contains', list_id).select(['__name__'])
+        docs = query.stream(transaction=transaction) if transaction is not None else query.stream()
+        return sorted(doc.id for doc in docs)
+
+    def _existing_player_refs(self, player_ids, transaction=None):
+        """Riferimenti dei soli giocatori esistenti (multi-get di list_ids), per gli update."""
+        refs = [db.collection(self.players_coll).document(pid) for pid in player_ids]
+        if not refs:
+            return []
+        return [snap.reference for snap in db.get_all(refs, field_paths=['list_ids'], transaction=transaction)
+                if snap.exists]
+
+    def _update_members(self, list_id, add=(), remove=()):
+        """Aggiunge/rimuove giocatori dalla lista aggiornando in una transazione lista e giocatori."""
+        list_ref = db.collection(self.lists_coll).document(list_id)
+        players_coll = self.players_coll
+
+        @firestore.transactional
+        def apply(transaction):
+            snap = list_ref.get(transaction=transaction)
+            if not snap.exists:
+                raise ValueError("Lista non trovata")
+            members = set(self._member_ids(list_id, snap.to_dict(), transaction))
+            added = [pid for pid in dict.fromkeys(add) if pid not in members]
+            removed = [pid for pid in dict.fromkeys(remove) if pid in members]
+            # Letture prima delle scritture: i giocatori rimossi ancora esistenti
+            removed_refs = self._existing_player_refs(removed, transaction)
+
+            members.update(added)
+            members.difference_update(removed)
+            transaction.update(list_ref, {'player_ids': sorted(members), 'player_count': len(members)})
+            for pid in added:
+                transaction.set(db.collection(players_coll).document(pid),
+                                {'list_ids': firestore.ArrayUnion([list_id])}, merge=True)
+            for player_ref in removed_refs:
+                transaction.update(player_ref, {'list_ids': firestore.ArrayRemove([list_id])})
+            return added, removed
+
+        return apply(db.transaction())
+
+    def fetch_members_page(self, list_id, page_size=None, page_token=None, fields=None, id_key='id'):
+        """
+        Giocatori della lista dall'indice dei membri: una lettura della lista e una multi-get
+        (get_all) dei soli giocatori della pagina, in ordine di ID. Con il pool attivo e fields
+        tutti nel pool (POOL_FIELDS) ID e dati arrivano dalla memoria; le viste con il documento
+        completo non usano il pool, che richiederebbe comunque la multi-get.
+        Ritorna una Page.
+        """
+        snap = db.collection(self.lists_coll).document(list_id).get()
+        if not snap.exists:
+            return Page()
+        list_data = snap.to_dict()
+
+        nation = None
+        if player_pool.PLAYER_POOL_ENABLED and player_pool.covers(fields):
+            league_id = self.list_league_id(list_data)
+            pools = self.player_pools([league_id]) if league_id else None
+            nation = pools[0] if pools else None
+        if nation is not None and list_data.get('player_ids') is None:
+            ids = nation.list_members(list_id)
+        else:
+            ids = self._member_ids(list_id, list_data)
+
+        if page_token:
+            ids = ids[bisect.bisect_right(ids, str(page_token)):]
+        next_token = None
+        if page_size and len(ids) > int(page_size):
+            ids = ids[:int(page_size)]
+            next_token = ids[-1]
+        if not ids:
+            return Page()
+
+        found = {}
+        if nation is not None:
+            for pid in ids:
+                player = nation.get(pid)
+                if player is not None:
+                    data = player.to_dict(fields)
+                    data[id_key] = pid
+                    found[pid] = data
+        missing = [pid for pid in ids if pid not in found]
+        if missing:
+            refs = [db.collection(self.players_coll).document(pid) for pid in missing]
+            for doc in db.get_all(refs, field_paths=list(fields) if fields else None):
+                if doc.exists:
+                    data = doc.to_dict()
+                    # Come nel pool: i prefissi di ricerca sono solo un indice lato server
+                    data.pop('search_prefixes', None)
+                    data[id_key] = doc.id
+                    found[doc.id] = data
+        return Page([found[pid] for pid in ids if pid in found], next_token)
+
+    def rebuild_members_index(self, user_email):
+        """Backfill di player_ids/player_count per le liste visibili all'utente. Solo per coach."""
+        ctx = self.role_manager.get_user_context(user_email)
+        if not ctx['is_any_coach']:
+            raise PermissionError("Solo un Coach può ricostruire l'indice delle liste.")
+
+        rebuilt = 0
+        for l in self.get_lists(user_email):
+            query = db.collection(self.players_coll).where('list_ids', 'array_contains', l['id']).select(['__name__'])
+            ids = sorted(doc.id for doc in query.stream())
+            db.collection(self.lists_coll).document(l['id']).update({'player_ids': ids, 'player_count': len(ids)})
+            rebuilt += 1
+        return {"status": "success", "lists_count": rebuilt}
+@instrumentation.trace_methods
 class PlayerManager:
     def __init__(self):
         self.players_coll = 'players-details'
+        self.sync_state_coll = 'sync_state'
+        self.history_coll = 'players-history'
         self.list_manager = ListManager()
 
-    def get_list_players_detailed(self, user_email, list_id):
+    def get_list_players_detailed(self, user_email, list_id, page_size=None, page_token=None, fields=None):
         """
-        Ritorna i dettagli completi di tutti i giocatori in una lista.
+        Ritorna i dettagli dei giocatori in una lista (tutti i campi o solo fields),
+        con paginazione opzionale.
         """
         # Rimosso il check sui permessi lista come richiesto
-        docs = db.collection(self.players_coll).where('list_ids', 'array_contains', list_id).stream()
-        players = []
-        for doc in docs:
-            p = doc.to_dict()
-            p['id'] = doc.id
-            players.append(p)
-        return players
+        return self.list_manager.fetch_members_page(list_id, page_size, page_token, fields)
 
-    def get_my_players(self, user_email):
+    def get_my_players(self, user_email, page_size=None, page_token=None, fields=None):
         """
-        Ritorna tutti i giocatori appartenenti all'utente (indipendente dalle liste).
+        Ritorna i giocatori appartenenti all'utente (indipendente dalle liste),
+        con proiezione e paginazione opzionali.
         """
         if not user_email:
-            return []
-        docs = db.collection(self.players_coll).where('owner_email', '==', user_email).stream()
-        players = []
-        for doc in docs:
-            p = doc.to_dict()
-            p['id'] = doc.id
-            players.append(p)
-        return players
+            return Page()
+        query = db.collection(self.players_coll).where('owner_email', '==', user_email)
+        return fetch_page(query, page_size, page_token, fields)
 
     def get_player(self, user_email, player_id):
         """
@@ -421,6 +1039,16 @@ class PlayerManager:
                 clean[k.strip()] = v
         return clean
 
+    def _index_for_search(self, p_data, player_id):
+        """
+        Aggiunge i campi di indice per la ricerca (search_name, search_prefixes, search_key).
+        Solo se il payload contiene sia FirstName che LastName, così un update parziale
+        non corrompe l'indice.
+        """
+        if 'FirstName' in p_data and 'LastName' in p_data:
+            p_data.update(player_search.build_search_fields(p_data, player_id))
+        return p_data
+
     def save_player(self, user_email, player_data):
         """
         Salva o aggiorna un giocatore assicurando il riferimento all'utente (owner_email).
@@ -434,219 +1062,707 @@ class PlayerManager:
             raise ValueError("PlayerID mancante o non valido dopo la pulizia.")
         
         player_id = str(pid_raw).strip()
+        existing = self._get_existing_players([player_id], HISTORY_FIELD_PATHS).get(player_id)
+        player_schema.normalize(player_data, existing=existing)
         player_data['owner_email'] = user_email
         player_data['updated_at'] = firestore.SERVER_TIMESTAMP
+        self._index_for_search(player_data, player_id)
+        history = self._history_write(player_id, player_data, datetime.now(timezone.utc), existing)
         
         try:
-            db.collection(self.players_coll).document(player_id).set(player_data, merge=True)
+            batch = db.batch()
+            batch.set(db.collection(self.players_coll).document(player_id), player_data, merge=True)
+            if history:
+                batch.set(*history, merge=True)
+            batch.commit()
             return {"id": player_id, "status": "saved"}
         except Exception as e:
             print(f"Error saving player {player_id}: {e}")
             raise e
 
-    def import_players(self, user_email, players_list):
+    def import_players(self, user_email, players_list, fmt='json', max_workers=None):
         """
-        Salva una lista di giocatori in batch (max 500 per batch).
+        Import massivo di giocatori da un array JSON o da un upload NDJSON/CSV (str, bytes o stream).
+        Le righe vengono validate e normalizzate in streaming e scritte, insieme alla voce di
+        storico skill, in WriteBatch da PLAYERS_PER_HISTORY_BATCH giocatori, committati in
+        parallelo (max_workers, limitato a 1..IMPORT_MAX_WORKERS) con un numero limitato di batch in volo.
+        Ritorna conteggi ed errori per riga (riga, PlayerID, messaggio).
         """
+        report = player_import.ImportReport()
         if not players_list:
-            return {"status": "success", "count": 0}
+            return report.as_dict()
 
-        batch = db.batch()
-        count = 0
-        total = 0
-        
-        for p_raw in players_list:
-            try:
-                p = self._clean_data(p_raw)
-                pid_raw = p.get('PlayerID')
-                
-                if pid_raw is None or str(pid_raw).strip() == "":
-                    # Salta righe invalide
+        max_workers = player_import.worker_count(max_workers)
+        pending = []
+        in_flight = set()
+        # Valori già scritti da questo import, per i PlayerID ripetuti in blocchi successivi
+        written = {}
+
+        def submit(chunk):
+            # Una multi-get per blocco: storico in delta e target_pct dai valori salvati
+            existing = self._get_existing_players([pid for _, pid, _ in chunk], HISTORY_FIELD_PATHS)
+            existing.update({pid: written[pid] for _, pid, _ in chunk if pid in written})
+            at = datetime.now(timezone.utc)
+            rows = []
+            for row, player_id, p in chunk:
+                player_schema.apply_targets(p, existing.get(player_id))
+                history = self._history_write(player_id, p, at, existing.get(player_id))
+                existing[player_id] = written[player_id] = {**existing.get(player_id, {}), **p}
+                rows.append((row, player_id, p, history))
+            in_flight.add(executor.submit(contextvars.copy_context().run, self._commit_import_batch, rows))
+
+        def collect(done):
+            for future in done:
+                rows, error = future.result()
+                if error is None:
+                    report.imported += len(rows)
+                else:
+                    for row, player_id, _, _ in rows:
+                        report.add_error(row, player_id, f"Scrittura fallita: {error}")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for row, record in player_import.iter_records(players_list, fmt):
+                try:
+                    player_id, p = player_import.normalize_row(record)
+                except ValueError as row_err:
+                    report.add_error(row, None, str(row_err))
+                    continue
+                try:
+                    player_schema.normalize(p)
+                except ValueError as type_err:
+                    report.add_error(row, player_id, str(type_err))
                     continue
-                
-                player_id = str(pid_raw).strip()
+
                 p['owner_email'] = user_email
                 p['updated_at'] = firestore.SERVER_TIMESTAMP
-                
-                doc_ref = db.collection(self.players_coll).document(player_id)
-                batch.set(doc_ref, p, merge=True)
-                
-                count += 1
-                total += 1
-                
-                if count == 500:
-                    batch.commit()
-                    batch = db.batch()
-                    count = 0
-            except Exception as row_err:
-                print(f"Skipping row due to error: {row_err}")
-                continue
-        
-        if count > 0:
+                self._index_for_search(p, player_id)
+                pending.append((row, player_id, p))
+
+                if len(pending) == PLAYERS_PER_HISTORY_BATCH:
+                    submit(pending)
+                    pending = []
+                    # Backpressure: non più di max_workers batch in attesa di commit
+                    if len(in_flight) >= max_workers:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+
+            if pending:
+                submit(pending)
+            collect(wait(in_flight).done)
+
+        return report.as_dict()
+
+    def _commit_import_batch(self, rows):
+        """Committa un blocco di righe (riga, player_id, dati, storico). Ritorna (rows, errore o None)."""
+        try:
+            batch = db.batch()
+            for _, player_id, data, history in rows:
+                batch.set(db.collection(self.players_coll).document(player_id), data, merge=True)
+                if history:
+                    batch.set(*history, merge=True)
             batch.commit()
-            
-        return {"status": "success", "imported_count": total}
+            return rows, None
+        except Exception as e:
+            instrumentation.log("import_batch_failed", severity='ERROR', rows=len(rows), error=str(e))
+            return rows, str(e)
+
+    def _get_existing_players(self, player_ids, field_paths=None):
+        """Legge con una sola multi-get (get_all) i documenti esistenti. Ritorna {id: dict}."""
+        if not player_ids:
+            return {}
+        refs = [db.collection(self.players_coll).document(str(pid)) for pid in player_ids]
+        existing = {}
+        for snap in db.get_all(refs, field_paths=field_paths):
+            if snap.exists:
+                existing[snap.id] = snap.to_dict()
+        return existing
+
+    def _is_stale(self, existing_data, fetched_date):
+        """True se il documento non esiste o è più vecchio della FetchedDate della lista."""
+        if existing_data is None:
+            return True
 
-    def sync_players_from_mock(self, user_email):
+        updated_at = existing_data.get('updated_at')
+        if not updated_at:
+            return True
+
+        if hasattr(updated_at, 'tzinfo') and updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        return fetched_date > updated_at
+
+    def _content_hash(self, p_data):
+        """Digest compatto (16 hex) dei campi rilevanti del giocatore: skill, TSI, forma, infortunio."""
+        payload = '|'.join(f"{k}={p_data.get(k, '')}" for k in CONTENT_HASH_FIELDS)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+    def _commit_in_batches(self, writes):
+        """
+        Scrive le coppie (doc_ref, data) con set(merge=True) in WriteBatch
+        da massimo FIRESTORE_BATCH_LIMIT operazioni ciascuno.
         """
-        Sincronizza i giocatori chiamando il mock API (lista + dettagli individuali) 
-        e confrontando le date.
+        for i in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for doc_ref, data in writes[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.set(doc_ref, data, merge=True)
+            batch.commit()
+        return len(writes)
+
+    def sync_players_from_mock(self, user_email, max_workers=None, incremental=True):
+        """
+        Sincronizza i giocatori chiamando il mock API (lista + dettagli individuali).
+        In modalità incrementale (default) un giocatore viene riscaricato e riscritto solo se
+        il digest dei suoi campi (skill, TSI, forma, infortunio) è cambiato; con
+        incremental=False si usa il vecchio confronto FetchedDate > updated_at.
+        I dettagli vengono scaricati in parallelo (max_workers, default SYNC_MAX_WORKERS)
+        tramite una sessione HTTP condivisa con retry e rate limiting per host.
+        La lista viene letta in streaming e processata a blocchi di PLAYERS_PER_HISTORY_BATCH
+        giocatori: per ogni blocco una sola get_all e un solo WriteBatch (giocatori e storico
+        skill), con memoria costante.
         """
-        base_url = "https://nt-data-lab-705728164092.europe-west1.run.app/mock"
-        list_url = f"{base_url}?file=players&version=2.7"
+        # requests e il parser XML servono solo alla sync: import locale
+        import hattrick_xml
+        from hattrick_client import HattrickClient
+
+        client = HattrickClient(MOCK_BASE_URL, max_workers=max_workers)
+        stats = {"synced_ids": [], "added": 0, "changed": 0, "unchanged": 0, "detail_failed": 0}
+        state_ref = db.collection(self.sync_state_coll).document(user_email)
         
         try:
-            # 1. Recupera la lista principale dei giocatori
-            response = requests.get(list_url, timeout=10)
+            # 1. Recupera la lista principale dei giocatori (in streaming).
+            #    In modalità incrementale la richiesta è condizionale sull'ETag dell'ultima sync.
+            last_etag = None
+            if incremental:
+                state_snap = state_ref.get()
+                if state_snap.exists:
+                    last_etag = state_snap.to_dict().get('players_etag')
+
+            response = client.fetch_player_list(timeout=10, stream=True, etag=last_etag)
+            if response.status_code == 304:
+                # Lista invariata: nessun parsing né scrittura
+                return {
+                    "status": "not_modified",
+                    "synced_count": 0,
+                    "synced_ids": [],
+                    "added_count": 0,
+                    "changed_count": 0,
+                    "unchanged_count": 0
+                }
             if response.status_code != 200:
                 print(f"Sync failed: mock list returned {response.status_code}")
                 return {"error": f"Failed to fetch mock list: {response.status_code}"}
             
-            root_list = ET.fromstring(response.content)
-            fetched_date_str = root_list.findtext('FetchedDate')
-            if not fetched_date_str:
+            response.raw.decode_content = True
+            header = {}
+            fetched_date = None
+            chunk = []
+
+            # 2. Cicla sui giocatori presenti nella lista, a blocchi
+            for p_data in hattrick_xml.iter_players(response.raw, header):
+                if fetched_date is None:
+                    # FetchedDate precede la PlayerList nell'XML
+                    fetched_date_str = header.get('FetchedDate')
+                    if not fetched_date_str:
+                        return {"error": "FetchedDate non trovato nell'XML della lista"}
+                    # Formato Hattrick: 2026-01-23 12:13:20
+                    fetched_date = datetime.strptime(fetched_date_str, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+                chunk.append(p_data)
+                if len(chunk) == PLAYERS_PER_HISTORY_BATCH:
+                    self._sync_chunk(client, chunk, user_email, fetched_date, incremental, stats)
+                    chunk = []
+
+            if fetched_date is None and not header.get('FetchedDate'):
                 return {"error": "FetchedDate non trovato nell'XML della lista"}
+            if chunk:
+                self._sync_chunk(client, chunk, user_email, fetched_date, incremental, stats)
+
+            # Memorizza l'ETag solo a sync completata senza dettagli mancanti, per le richieste
+            # condizionali successive: altrimenti un 304 salterebbe i giocatori da riprovare
+            etag = response.headers.get('ETag')
+            if etag and not stats["detail_failed"]:
+                state_ref.set({'players_etag': etag, 'synced_at': firestore.SERVER_TIMESTAMP}, merge=True)
+            elif stats["detail_failed"]:
+                state_ref.set({'players_etag': firestore.DELETE_FIELD}, merge=True)
             
-            # Formato Hattrick: 2026-01-23 12:13:20
-            fetched_date = datetime.strptime(fetched_date_str, '%Y-%m-%d %H:%M:%S').replace(tzinfo=pytz.UTC)
-            
-            synced_ids = []
-            
-            # 2. Cicla sui giocatori presenti nella lista
-            for player_el in root_list.findall('.//Player'):
-                p_data = {}
-                for child in player_el:
-                    if child.text: # Salta tag vuoti o complessi non gestiti qui
-                        p_data[child.tag] = child.text
-                
-                player_id = p_data.get('PlayerID')
-                if not player_id:
-                    continue
-                
-                # --- RECUPERO DETTAGLI INDIVIDUALI ---
-                detail_url = f"{base_url}?file=playerdetails&version=3.1&actionType=view&playerID={player_id}"
-                try:
-                    detail_res = requests.get(detail_url, timeout=5)
-                    if detail_res.status_code == 200:
-                        detail_root = ET.fromstring(detail_res.content)
-                        
-                        # UserID dalla radice dell'XML di dettaglio
-                        xml_user_id = detail_root.findtext('UserID')
-                        if xml_user_id:
-                            p_data['UserID'] = xml_user_id
-
-                        player_detail = detail_root.find('Player')
-                        if player_detail is not None:
-                            # Mergia i campi del dettaglio
-                            for d_child in player_detail:
-                                if d_child.tag == 'PlayerSkills':
-                                    # Appiattisce le skill (es. StaminaSkill, KeeperSkill)
-                                    for skill in d_child:
-                                        p_data[skill.tag] = skill.text
-                                elif d_child.tag == 'OwningTeam':
-                                    # Info dal team proprietario
-                                    p_data['TeamID'] = d_child.findtext('TeamID')
-                                    p_data['TeamName'] = d_child.findtext('TeamName')
-                                    p_data['OwningTeam_LeagueID'] = d_child.findtext('LeagueID')
-                                elif d_child.text:
-                                    # Altri campi piatti (NativeLeagueID, NextBirthDay, etc.)
-                                    p_data[d_child.tag] = d_child.text
-                except Exception as detail_err:
-                    print(f"Warning: could not fetch details for player {player_id}: {detail_err}")
-
-                # --- CONTROLLO E SALVATAGGIO ---
-                doc_ref = db.collection(self.players_coll).document(str(player_id))
-                snapshot = doc_ref.get()
-                
-                should_update = False
-                if not snapshot.exists:
-                    should_update = True
-                else:
-                    existing_data = snapshot.to_dict()
-                    updated_at = existing_data.get('updated_at')
-                    
-                    if updated_at:
-                        if hasattr(updated_at, 'tzinfo') and updated_at.tzinfo is None:
-                            updated_at = updated_at.replace(tzinfo=pytz.UTC)
-                        
-                        if fetched_date > updated_at:
-                            should_update = True
-                    else:
-                        should_update = True
-                
-                if should_update:
-                    p_data['owner_email'] = user_email
-                    p_data['updated_at'] = fetched_date
-                    p_data = self._clean_data(p_data)
-                    doc_ref.set(p_data, merge=True)
-                    synced_ids.append(player_id)
-            
-            return {"status": "success", "synced_count": len(synced_ids), "synced_ids": synced_ids}
+            return {
+                "status": "success",
+                "synced_count": len(stats["synced_ids"]),
+                "synced_ids": stats["synced_ids"],
+                "added_count": stats["added"],
+                "changed_count": stats["changed"],
+                "unchanged_count": stats["unchanged"],
+                "detail_failed_count": stats["detail_failed"]
+            }
             
         except Exception as e:
             print(f"Error during sync: {e}")
             return {"error": str(e)}
+        finally:
+            client.close()
+
+    def _sync_chunk(self, client, players, user_email, fetched_date, incremental, stats):
+        """Processa un blocco di giocatori della lista: confronto, dettagli e scrittura in batch."""
+        # Legge in un'unica multi-get tutti i documenti esistenti e individua in memoria
+        # i giocatori nuovi o modificati (digest diverso da quello salvato)
+        existing = self._get_existing_players([p['PlayerID'] for p in players])
+        to_update = []
+        for p_data in players:
+            player_id = p_data['PlayerID']
+            p_data['content_hash'] = self._content_hash(p_data)
+            existing_data = existing.get(player_id)
+
+            if existing_data is None:
+                stats["added"] += 1
+            elif incremental:
+                if existing_data.get('content_hash') == p_data['content_hash']:
+                    stats["unchanged"] += 1
+                    continue
+                stats["changed"] += 1
+            elif self._is_stale(existing_data, fetched_date):
+                stats["changed"] += 1
+            else:
+                stats["unchanged"] += 1
+                continue
+            to_update.append(p_data)
+
+        # Giocatori invariati salvati prima dell'indice di ricerca: si scrivono solo i campi
+        # di ricerca, altrimenti resterebbero esclusi dalle ricerche paginate. Vanno in batch
+        # separati: il blocco giocatori + storico resta in un solo WriteBatch
+        updated_ids = {p['PlayerID'] for p in to_update}
+        search_writes = []
+        for player_id, existing_data in existing.items():
+            if player_id not in updated_ids and 'search_key' not in existing_data:
+                fields = player_search.build_search_fields(existing_data, player_id)
+                if fields:
+                    search_writes.append((db.collection(self.players_coll).document(player_id), fields))
+
+        # --- RECUPERO DETTAGLI INDIVIDUALI (in parallelo, solo per i giocatori da aggiornare) ---
+        details = client.fetch_player_details([p['PlayerID'] for p in to_update], timeout=5)
 
-    def search_players(self, user_email, query, list_id=None):
+        # --- SALVATAGGIO IN BATCH ---
+        from hattrick_xml import parse_player_detail
+        writes = []
+        ingested_at = datetime.now(timezone.utc)
+        for p_data in to_update:
+            player_id = p_data['PlayerID']
+            detail_content = details.get(player_id)
+            merged = False
+            if detail_content:
+                try:
+                    detail = parse_player_detail(detail_content)
+                    if detail:
+                        p_data.update(detail)
+                        merged = True
+                except Exception as detail_err:
+                    print(f"Warning: could not parse details for player {player_id}: {detail_err}")
+            if not merged:
+                # Senza dettagli il digest non viene salvato: la prossima sync incrementale
+                # considera il giocatore modificato e riprova a scaricarli
+                p_data['content_hash'] = firestore.DELETE_FIELD
+                stats["detail_failed"] += 1
+
+            p_data['owner_email'] = user_email
+            p_data['updated_at'] = fetched_date
+            player_schema.normalize(p_data, strict=False, existing=existing.get(player_id))
+            self._index_for_search(p_data, player_id)
+            history = self._history_write(player_id, p_data, ingested_at, existing.get(player_id))
+            p_data = self._clean_data(p_data)
+            writes.append((db.collection(self.players_coll).document(str(player_id)), p_data))
+            if history:
+                writes.append(history)
+            stats["synced_ids"].append(player_id)
+
+        self._commit_in_batches(writes)
+        self._commit_in_batches(search_writes)
+
+    # ---------------------------------------------------------
+    # STORICO SKILL
+    # ---------------------------------------------------------
+    # Ogni sync, import o salvataggio che cambia skill/TSI/forma aggiunge una voce compatta
+    # (skill_history) al documento annuale del giocatore in players-history, nello stesso
+    # batch del giocatore. Il documento del giocatore tiene solo history_year: l'anno della
+    # sua ultima voce completa, da cui parte il delta successivo.
+    # Ogni voce ha il tempo di ingest (non la FetchedDate dell'XML): i delta sono concatenati
+    # nell'ordine di scrittura e decodificati in ordine di tempo, che così coincidono.
+
+    def _history_write(self, player_id, p_data, at, existing=None):
+        """
+        Scrittura (ref, dati) della voce di storico per lo snapshot in p_data, o None se non
+        c'è nulla da registrare. La voce è un delta rispetto ai valori del documento esistente
+        se la sua ultima voce è nello stesso anno, altrimenti un keyframe. Aggiorna history_year
+        su p_data.
+        """
+        values = skill_history.vector(p_data)
+        year = skill_history.history_year(at)
+        previous = None
+        if existing is not None and existing.get('history_year') == year:
+            previous = skill_history.vector(existing)
+        entry = skill_history.encode_entry(at, values, previous)
+        if entry is None:
+            return None
+        # Da uno snapshot parziale non si può calcolare il delta successivo: keyframe alla prossima scrittura
+        p_data['history_year'] = year if None not in values else firestore.DELETE_FIELD
+        ref = db.collection(self.history_coll).document(skill_history.history_doc_id(player_id, at))
+        return ref, {'player_id': str(player_id), 'year': year, 'entries': firestore.ArrayUnion([entry])}
+
+    def get_skill_history(self, user_email, player_ids, since=None, until=None):
+        """
+        Snapshot settimanali (l'ultimo di ogni settimana ISO) dei giocatori nell'intervallo
+        [since, until] (datetime o stringhe ISO, estremi opzionali). Legge solo i documenti
+        di storico degli anni coinvolti, non i giocatori. Ritorna {player_id: [snapshot]}.
+        """
+        since = skill_history.parse_time(since)
+        until = skill_history.parse_time(until)
+        ids = [str(pid) for pid in dict.fromkeys(player_ids or ()) if pid not in (None, '')]
+        if not ids:
+            return {}
+
+        query = db.collection(self.history_coll)
+        if since:
+            query = query.where('year', '>=', skill_history.history_year(since))
+        if until:
+            query = query.where('year', '<=', skill_history.history_year(until))
+
+        entries = {pid: [] for pid in ids}
+        for doc in stream_in(query, 'player_id', ids):
+            data = doc.to_dict()
+            entries.setdefault(data['player_id'], []).extend(data.get('entries', []))
+        return {pid: skill_history.weekly(skill_history.decode_entries(e), since, until)
+                for pid, e in entries.items()}
+
+    def search_players(self, user_email, query, list_id=None, limit=None, page_token=None):
         """
         Cerca giocatori nella collection players-details filtrando per i league ID 
         gestiti dall'utente e opzionalmente per la nazione di una specifica lista.
+        La ricerca usa l'indice search_prefixes (prefisso di nome, cognome o nome completo),
+        ordinato per search_key, con limite e paginazione a cursore (page_token = search_key
+        dell'ultimo risultato). Ritorna una Page.
+        Senza limit né page_token ritorna tutti i giocatori che contengono la query nel nome
+        (comportamento originale, usato dal frontend per caricare l'intero pool).
+        Richiede gli indici compositi definiti in firestore.indexes.json.
+        Con il pool giocatori attivo la ricerca avviene in memoria sulle stesse chiavi.
         """
-        from firebase import RoleManager
-        role_mgr = RoleManager()
-        managed_league_ids = role_mgr.get_managed_league_ids(user_email)
+        managed_league_ids = self.list_manager.role_manager.get_managed_league_ids(user_email)
         
         if not managed_league_ids:
-            return []
+            return Page()
 
-        # Se list_id è fornito, filtriamo ulteriormente per la nazione della lista
+        list_data = None
         if list_id:
             doc_list = db.collection('lists').document(list_id).get()
-            if doc_list.exists:
-                team_id = doc_list.to_dict().get('team_id')
-                team_doc = db.collection('teams').document(team_id).get()
-                if team_doc.exists:
-                    list_league_id = str(team_doc.to_dict().get('NativeLeagueID', ''))
-                    # L'utente deve poter gestire la nazione della lista
-                    if list_league_id in managed_league_ids:
-                        managed_league_ids = [list_league_id]
-                    else:
-                        return [] # L'utente non ha permessi su questa lista/nazione
-
-        # Cerchiamo sia come stringa che come intero per sicurezza sui tipi in Firestore
-        search_ids = []
-        for lid in managed_league_ids:
-            search_ids.append(str(lid))
-            try:
-                search_ids.append(int(lid))
-            except:
-                pass
-        
-        # Eliminiamo duplicati e prepariamo batch da 30 (limite Firestore)
-        search_ids = list(set(search_ids))
-        
-        all_allowed_players = []
-        for i in range(0, len(search_ids), 30):
-            batch = search_ids[i:i+30]
-            
-            # 1. Cerca per NativeLeagueID (usato nei dettagli completi)
-            docs_native = db.collection(self.players_coll).where('NativeLeagueID', 'in', batch).stream()
-            for doc in docs_native:
-                p = doc.to_dict()
-                p['id'] = doc.id
-                if p['id'] not in [ap['id'] for ap in all_allowed_players]:
-                    full_name = f"{p.get('FirstName', '')} {p.get('LastName', '')}".lower()
-                    if not query or query.lower() in full_name:
-                        all_allowed_players.append(p)
-
-            # 2. Cerca per CountryID (usato nei sync preliminari o import CSV)
-            docs_country = db.collection(self.players_coll).where('CountryID', 'in', batch).stream()
-            for doc in docs_country:
-                p = doc.to_dict()
-                p['id'] = doc.id
-                if p['id'] not in [ap['id'] for ap in all_allowed_players]:
-                    full_name = f"{p.get('FirstName', '')} {p.get('LastName', '')}".lower()
-                    if not query or query.lower() in full_name:
-                        all_allowed_players.append(p)
-                    
-        return all_allowed_players
+            list_data = doc_list.to_dict() if doc_list.exists else None
+        return self._search_leagues(managed_league_ids, list_data, query, limit, page_token)
+
+    async def search_players_async(self, user_email, query, list_id=None, limit=None, page_token=None):
+        """Come search_players, con contesto permessi e lista letti in parallelo."""
+        async def read_list():
+            if not list_id:
+                return None
+            doc_list = await adb.collection('lists').document(list_id).get()
+            return doc_list.to_dict() if doc_list.exists else None
+
+        ctx, list_data = await asyncio.gather(
+            self.list_manager.role_manager.get_user_context_async(user_email),
+            read_list()
+        )
+        managed_league_ids = RoleManager.managed_league_ids(ctx)
+        if not managed_league_ids:
+            return Page()
+        return await asyncio.to_thread(self._search_leagues, managed_league_ids, list_data, query, limit, page_token)
+
+    def _list_leagues(self, managed_league_ids, list_data):
+        """
+        Nazioni su cui cercare: se è indicata una lista, solo la nazione della lista.
+        Ritorna [] se l'utente non gestisce la nazione della lista.
+        """
+        if list_data is not None:
+            list_league_id = self.list_manager.list_league_id(list_data)
+            if list_league_id is not None:
+                # L'utente deve poter gestire la nazione della lista
+                if list_league_id in managed_league_ids:
+                    return [list_league_id]
+                return []
+        return managed_league_ids
+
+    def _search_leagues(self, managed_league_ids, list_data, query, limit, page_token):
+        managed_league_ids = self._list_leagues(managed_league_ids, list_data)
+        if not managed_league_ids:
+            return Page() # L'utente non ha permessi su questa lista/nazione
+
+        if limit is None and not page_token:
+            # Senza pageSize né pageToken: tutti i giocatori delle nazioni, come prima della paginazione
+            return self._search_all(managed_league_ids, player_search.query_token(query))
+
+        limit = min(int(limit or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT)
+        token = player_search.query_token(query)
+
+        nations = self.list_manager.player_pools(managed_league_ids)
+        if nations is not None:
+            found = list(player_pool.search(nations, token, page_token, limit=limit + 1))
+            next_token = found[limit - 1].search_key if len(found) > limit else None
+            # Il pool fornisce gli ID della pagina; i documenti completi con una multi-get
+            docs = self._get_existing_players([player.id for player in found[:limit]])
+            players = []
+            for player in found[:limit]:
+                p = docs.get(player.id)
+                if p is not None:
+                    p.pop('search_prefixes', None)
+                    p['id'] = player.id
+                    players.append(p)
+            return Page(players, next_token)
+
+        base = db.collection(self.players_coll)
+        if token:
+            base = base.where('search_prefixes', 'array_contains', token)
+        base = base.order_by('search_key')
+        if page_token:
+            base = base.start_after({'search_key': page_token})
+        # limit + 1 per sapere se esiste una pagina successiva
+        base = base.limit(limit + 1)
+
+        # Un blocco 'in' ogni 30 nazioni su league_id (più i campi legacy prima del backfill
+        # dello schema), eseguiti in parallelo e fusi in ordine di search_key
+        queries = league_queries(base, managed_league_ids)
+
+        players = []
+        for doc in stream_queries(queries, limit=limit + 1, order_by='search_key'):
+            p = doc.to_dict()
+            p['id'] = doc.id
+            p.pop('search_prefixes', None)
+            players.append(p)
+
+        next_token = players[limit - 1]['search_key'] if len(players) > limit else None
+        return Page(players[:limit], next_token)
+
+    def _search_all(self, league_ids, token):
+        """
+        Ricerca non paginata: tutti i giocatori delle nazioni il cui nome contiene il token
+        (come la ricerca originale), ordinati per nome. Il nome è confrontato in memoria,
+        quindi sono inclusi anche i giocatori ancora senza campi di ricerca.
+        """
+        players = []
+        for doc in stream_queries(league_queries(db.collection(self.players_coll), league_ids)):
+            p = doc.to_dict()
+            search_name = p.get('search_name')
+            if search_name is None:
+                search_name = player_search.normalize_text(f"{p.get('FirstName') or ''} {p.get('LastName') or ''}")
+            if token not in search_name:
+                continue
+            p['id'] = doc.id
+            p.pop('search_prefixes', None)
+            players.append((search_name, doc.id, p))
+        players.sort(key=lambda e: e[:2])
+        return Page([p for _, _, p in players])
+
+    # ---------------------------------------------------------
+    # QUERY STRUTTURATE
+    # ---------------------------------------------------------
+    # I predicati sul campo di ordinamento diventano filtri Firestore sull'indice composito
+    # (league_id, campo); gli altri vengono valutati sul server, pagina per pagina, così al
+    # client arrivano solo i giocatori che li soddisfano. Il completamento dei target di
+    # default è precalcolato all'ingest in target_pct (player_schema).
+
+    def query_players(self, user_email, filters=None, sort=None, list_id=None, league_id=None,
+                      page_size=None, page_token=None, fields=None):
+        """
+        Giocatori delle nazioni gestite dall'utente (o della sola league_id / nazione della lista)
+        che soddisfano tutti i predicati strutturati, ordinati per sort e paginati a cursore.
+        Vedi player_query.parse per il formato di filters e sort. Con il pool giocatori attivo
+        la query è eseguita in memoria. Ritorna una Page (solo fields se indicati).
+        """
+        query = player_query.parse(filters, sort)
+        if not schema_migrated():
+            raise ValueError("Schema giocatori non aggiornato: eseguire normalize_schema prima delle query strutturate.")
+
+        managed_league_ids = self.list_manager.role_manager.get_managed_league_ids(user_email)
+        if league_id not in (None, ''):
+            if str(league_id) not in managed_league_ids:
+                raise PermissionError("Non hai permessi su questa nazione.")
+            managed_league_ids = [str(league_id)]
+        if list_id:
+            doc_list = db.collection('lists').document(list_id).get()
+            managed_league_ids = self._list_leagues(managed_league_ids, doc_list.to_dict() if doc_list.exists else None)
+        if not managed_league_ids:
+            return Page()
+
+        limit = min(int(page_size or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT)
+        cursor = player_query.decode_token(page_token) if page_token else None
+
+        nations = self.list_manager.player_pools(managed_league_ids)
+        if nations is not None:
+            rows, next_token = self._query_pool(nations, query, limit, cursor)
+            if not player_pool.covers(fields):
+                # Il pool ha solo i campi interrogabili: il resto del documento per la sola pagina
+                docs = self._get_existing_players([pid for pid, _ in rows], list(fields) if fields else None)
+                rows = [(pid, docs[pid]) for pid, _ in rows if pid in docs]
+        else:
+            rows, next_token = self._query_firestore(managed_league_ids, query, limit, cursor)
+
+        players = []
+        for pid, data in rows:
+            if fields:
+                p = {f: data[f] for f in fields if f in data}
+            else:
+                p = dict(data)
+                p.pop('search_prefixes', None)
+            p['id'] = pid
+            players.append(p)
+        return Page(players, next_token)
+
+    def _query_pool(self, nations, query, limit, cursor):
+        """Query in memoria sui giocatori delle nazioni caricate: (righe (id, dati), cursore)."""
+        found = {}
+        for nation in nations:
+            for player in nation.players():
+                if player.id not in found and query.matches(player.data):
+                    found[player.id] = player
+        keyed = []
+        for player in found.values():
+            key = query.sort_key(player.data, player.id)
+            if not isinstance(key[0], (int, float)):
+                continue # come in Firestore, l'ordinamento esclude chi non ha il campo
+            if cursor is not None and (key <= tuple(cursor) if not query.descending else key >= tuple(cursor)):
+                continue
+            keyed.append((key, player))
+        keyed.sort(key=lambda kp: kp[0], reverse=query.descending)
+
+        rows = [(player.id, player.data) for _, player in keyed[:limit]]
+        next_token = player_query.encode_token(*keyed[limit - 1][0]) if len(keyed) > limit else None
+        return rows, next_token
+
+    def _query_firestore(self, league_ids, query, limit, cursor):
+        """
+        Query Firestore ordinata sul campo di ordinamento (con i suoi predicati), letta a pagine
+        finché non si trovano limit + 1 giocatori che soddisfano gli altri predicati, la query
+        si esaurisce o si superano QUERY_MAX_SCAN documenti. Ritorna (righe (id, dati), cursore).
+        """
+        direction = firestore.Query.DESCENDING if query.descending else firestore.Query.ASCENDING
+        base = db.collection(self.players_coll)
+        for field, op, value in query.pushed:
+            base = base.where(field, op, value)
+        base = base.order_by(query.sort_field, direction=direction).order_by('__name__', direction=direction)
+        batch_size = min(FIRESTORE_BATCH_LIMIT, max(limit + 1, 100))
+
+        rows = []
+        scanned = 0
+        exhausted = False
+        while len(rows) <= limit and scanned < QUERY_MAX_SCAN:
+            q = base
+            if cursor is not None:
+                q = q.start_after({query.sort_field: cursor[0], '__name__': cursor[1]})
+            docs = list(stream_queries(league_queries(q.limit(batch_size), league_ids), limit=batch_size,
+                                       order_by=query.sort_field, descending=query.descending))
+            for doc in docs:
+                data = doc.to_dict()
+                scanned += 1
+                cursor = query.sort_key(data, doc.id)
+                if query.matches(data, residual_only=True):
+                    rows.append((doc.id, data))
+                    if len(rows) > limit:
+                        break
+            if len(docs) < batch_size:
+                exhausted = True
+                break
+
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_id, last = rows[-1]
+            return rows, player_query.encode_token(*query.sort_key(last, last_id))
+        # Limite di lettura raggiunto: pagina parziale, il cursore riprende dall'ultimo documento letto
+        return rows, None if exhausted or cursor is None else player_query.encode_token(*cursor)
+
+    def rebuild_search_index(self, user_email, page_size=FIRESTORE_BATCH_LIMIT):
+        """
+        Backfill dei campi di ricerca su tutti i documenti di players-details.
+        Scorre la collection a pagine ordinate per ID e scrive in WriteBatch. Solo per coach.
+        """
+        ctx = self.list_manager.role_manager.get_user_context(user_email)
+        if not ctx['is_any_coach']:
+            raise PermissionError("Solo un Coach può ricostruire l'indice di ricerca.")
+
+        coll = db.collection(self.players_coll)
+        last_doc = None
+        updated = 0
+        while True:
+            q = coll.order_by('__name__').limit(page_size)
+            if last_doc is not None:
+                q = q.start_after(last_doc)
+            docs = list(q.stream())
+            if not docs:
+                break
+
+            writes = []
+            for doc in docs:
+                fields = player_search.build_search_fields(doc.to_dict(), doc.id)
+                if fields:
+                    writes.append((doc.reference, fields))
+            updated += self._commit_in_batches(writes)
+            last_doc = docs[-1]
+
+        return {"status": "success", "indexed_count": updated}
+
+    def normalize_schema(self, user_email, page_size=FIRESTORE_BATCH_LIMIT - 1, max_pages=None, restart=False):
+        """
+        Backfill dello schema tipizzato (player_schema) sui documenti esistenti di players-details:
+        tipi dei campi, league_id e schema_version. Scorre la collection a pagine ordinate per ID
+        e riscrive solo i campi da correggere; ogni pagina è committata nello stesso WriteBatch
+        del cursore in sync_state, quindi un'esecuzione interrotta (o limitata da max_pages)
+        riprende dal punto in cui si era fermata. A backfill completato le ricerche passano
+        al solo league_id. Solo per coach.
+        """
+        ctx = self.list_manager.role_manager.get_user_context(user_email)
+        if not ctx['is_any_coach']:
+            raise PermissionError("Solo un Coach può normalizzare lo schema dei giocatori.")
+
+        page_size = max(1, min(int(page_size), FIRESTORE_BATCH_LIMIT - 1))
+        coll = db.collection(self.players_coll)
+        state_ref = db.collection(self.sync_state_coll).document(PLAYER_SCHEMA_STATE_DOC)
+        state = {}
+        if not restart:
+            snap = state_ref.get()
+            state = snap.to_dict() if snap.exists else {}
+        if state.get('version') != player_schema.SCHEMA_VERSION:
+            # Nuova versione dello schema: si riparte dall'inizio della collection
+            state = {}
+        if state.get('done_version') == player_schema.SCHEMA_VERSION:
+            return {"status": "done", "normalized_count": 0, "scanned_count": 0}
+
+        cursor = state.get('cursor')
+        scanned = normalized = pages = 0
+        while max_pages is None or pages < int(max_pages):
+            q = coll.order_by('__name__').limit(page_size)
+            if cursor:
+                q = q.start_after({'__name__': cursor})
+            docs = list(q.stream())
+            if not docs:
+                break
+
+            batch = db.batch()
+            for doc in docs:
+                fields = player_schema.changes(doc.to_dict())
+                if fields:
+                    batch.set(doc.reference, fields, merge=True)
+                    normalized += 1
+            cursor = docs[-1].id
+            batch.set(state_ref, {
+                'version': player_schema.SCHEMA_VERSION,
+                'cursor': cursor,
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+            batch.commit()
+            scanned += len(docs)
+            pages += 1
+            if len(docs) < page_size:
+                cursor = None
+                break
+        else:
+            return {"status": "partial", "normalized_count": normalized, "scanned_count": scanned, "cursor": cursor}
+
+        state_ref.set({
+            'version': player_schema.SCHEMA_VERSION,
+            'done_version': player_schema.SCHEMA_VERSION,
+            'cursor': None,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+        context_cache.schema_state_cache.invalidate(PLAYER_SCHEMA_STATE_DOC)
+        return {"status": "done", "normalized_count": normalized, "scanned_count": scanned}
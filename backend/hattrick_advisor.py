@@ -1,12 +1,196 @@
 import datetime
+import re
+from collections.abc import Mapping
+from types import MappingProxyType
 
+import instrumentation
+import training_projection
+
+# Mappatura campi skill Hattrick (Firestore/CSV) -> chiavi skill dell'advisor
+SKILL_FIELDS = {
+    "goalkeeping": "KeeperSkill",
+    "playmaking": "PlaymakerSkill",
+    "scoring": "ScorerSkill",
+    "passing": "PassingSkill",
+    "winger": "WingerSkill",
+    "defending": "DefenderSkill",
+    "set pieces": "SetPiecesSkill"
+}
+
+# Parole chiave (ita/eng) del nome allenamento -> training_type
+TRAINING_KEYWORDS = [
+    (("parat", "goalk", "goaltendin"), "goalkeeping"),
+    (("difes", "defen"), "defending"),
+    (("regia", "playma"), "playmaking"),
+    (("cross", "winger"), "winger"),
+    (("passag", "passing", "short passe"), "passing"),
+    (("attac", "scoring"), "scoring"),
+    (("piazzat", "setpi", "set pieces"), "set pieces")
+]
+
+# --- DATABASE TARGET (Basato sui tuoi dati) ---
+# Formato: [Minimo, Ideale]
+_DEFAULT_TARGETS_SPEC = {
+    "goalkeeper": {
+        "U21": {
+            "Normal": {"goalkeeping": 16, "set pieces": 16, "defending": 5}
+        },
+        "NT": {
+            "Normal": {"goalkeeping": 20, "defending": 14, "set pieces": 20}
+        }
+    },
+    "defender": {
+        "U21": {
+            "Normal": {"defending": 14, "playmaking": 10, "passing": 7}
+        },
+        "NT": {
+            "Normal": {"defending": 18, "playmaking": 16.5, "passing": 9},
+            "Counter-attack": {"defending": 18.5, "playmaking": 15, "passing": 10}
+        }
+    },
+    "midfielder": {
+        "U21": {
+            "Normal": {"playmaking": 16, "passing": 7, "defending": 6}
+        },
+        "NT": {
+            "Normal": {"playmaking": 18.5, "passing": 13, "defending": 10, "scoring": 7}
+        }
+    },
+    "forward": {
+        "U21": {
+            "Normal": {"scoring": 14, "passing": 7, "winger": 7, "playmaking": 7},
+            "PNF":    {"scoring": 14, "playmaking": 10, "passing": 7} # Corretto 17->7 per coerenza
+        },
+        "NT": {
+            "Normal": {"scoring": 18, "passing": 12, "winger": 10, "playmaking": 12},
+            "PNF":    {"scoring": 18, "playmaking": 15, "passing": 10}
+        }
+    },
+    "winger": {
+        "U21": {
+            "Normal": {"playmaking": 12, "winger": 14, "defending": 6, "passing": 7}
+        },
+        "NT": {
+            "Normal": {"playmaking": 18, "winger": 18, "defending": 8, "passing": 9}
+        }
+    },
+    "wingback": {
+        "U21": {
+            "Normal": {"defending": 13, "winger": 7, "passing": 6, "playmaking": 6}
+        },
+        "NT": {
+            "Normal": {"defending": 18, "winger": 16, "passing": 9, "playmaking": 8},
+            "Counter-attack": {"defending": 18, "winger": 16, "passing": 10, "playmaking": 7}
+        }
+    }
+}
+
+
+def _freeze(value):
+    """Converte ricorsivamente i dict in mapping di sola lettura."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    return value
+
+def _thaw(value):
+    """Copia ricorsiva in dict normali (per chi ha bisogno del vecchio formato mutabile)."""
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    return value
+
+
+class TargetRegistry:
+    """
+    Registro dei target ruolo -> livello -> variante -> skill.
+    Il registro di default è immutabile e costruito una sola volta all'import;
+    i target utente sono un overlay leggero {(ruolo, livello): {variante: stats}}
+    sopra la base, senza copiarla. Le risoluzioni (ruolo, livello, variante) sono memoizzate.
+    """
+
+    def __init__(self, base, overlay=None):
+        self.base = base
+        self.overlay = overlay or {}
+        self._resolved = {}
+        self._engine = None
+
+    def with_user_targets(self, user_targets):
+        """
+        Nuovo registro con i target utente sovrapposti.
+        Struttura user_target attesa:
+        {
+            "role": "midfielder",
+            "name": "MyU21",
+            "variant": "Normal",
+            "stats": { ... }
+        }
+        """
+        overlay = {key: dict(variants) for key, variants in self.overlay.items()}
+        for t in user_targets or []:
+            role = t.get('role', '').lower()
+            name = t.get('name', 'Custom')
+            variant = t.get('variant', 'Normal')
+            # Sovrascrittura o aggiunta variante
+            overlay.setdefault((role, name), {})[variant] = t.get('stats', {})
+        return TargetRegistry(self.base, overlay)
+
+    def level_config(self, role, level):
+        """Varianti disponibili per ruolo e livello (base + overlay)."""
+        base_level = self.base.get(role, {}).get(level, {})
+        user_level = self.overlay.get((role, level))
+        if not user_level:
+            return base_level
+        return {**base_level, **user_level}
+
+    def resolve(self, role, level, variant):
+        """
+        Ritorna (target_skills, variante_usata). Se la variante non esiste
+        (es. "Technical") fallback su "Normal"; (None, "Normal (Fallback)") se manca anche quella.
+        """
+        key = (role, level, variant)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            level_config = self.level_config(role, level)
+            target_skills = level_config.get(variant)
+            if not target_skills:
+                resolved = (level_config.get("Normal"), "Normal (Fallback)")
+            else:
+                resolved = (target_skills, variant)
+            # Le chiavi arrivano dai payload: limitiamo la crescita della memo
+            if len(self._resolved) < MAX_RESOLVED_CACHE:
+                self._resolved[key] = resolved
+        return resolved
+
+    def as_dict(self):
+        """Vista completa (base + overlay) come dict annidato mutabile."""
+        targets = _thaw(self.base)
+        for (role, level), variants in self.overlay.items():
+            targets.setdefault(role, {}).setdefault(level, {}).update(variants)
+        return targets
+
+    def engine(self):
+        """Motore vettoriale (NumPy) costruito una volta per registro."""
+        if self._engine is None:
+            # Import locale: NumPy serve solo per l'analisi batch
+            from target_engine import TargetEngine
+            self._engine = TargetEngine(self.as_dict())
+        return self._engine
+
+
+# Numero massimo di risoluzioni (ruolo, livello, variante) memoizzate per registro
+MAX_RESOLVED_CACHE = 4096
+
+DEFAULT_TARGETS = _freeze(_DEFAULT_TARGETS_SPEC)
+DEFAULT_REGISTRY = TargetRegistry(DEFAULT_TARGETS)
+
+
+@instrumentation.trace_methods
 class HattrickAdvisor:
     """
     Classe Stateless per l'analisi dei giocatori Hattrick.
     Supporta target specifici per U21 e Nazionale Maggiore (NT).
     """
 
-    def __init__(self, data, user_targets=None):
+    def __init__(self, data, user_targets=None, registry=None):
         """
         :param data: JSON payload contenente:
                      - last_update (str)
@@ -18,6 +202,7 @@ class HattrickAdvisor:
                      - training_type (str)
                      - stamina_share (int)
         :param user_targets: Lista di dizionari con i target utente (opzionale)
+        :param registry: TargetRegistry già risolto da riusare (es. in batch), alternativo a user_targets
         """
         self.data = data
         
@@ -26,92 +211,22 @@ class HattrickAdvisor:
         self.target_level = self.data.get("team_target", "U21") # Rimosso .upper() per supportare custom case-sensitive
         self.variant = self.data.get("role_variant", "Normal")
         
-        # --- DATABASE TARGET (Basato sui tuoi dati) ---
-        # Formato: [Minimo, Ideale]
-        self.TARGETS = {
-            "goalkeeper": {
-                "U21": {
-                    "Normal": {"goalkeeping": 16, "set pieces": 16, "defending": 5}
-                },
-                "NT": {
-                    "Normal": {"goalkeeping": 20, "defending": 14, "set pieces": 20}
-                }
-            },
-            "defender": {
-                "U21": {
-                    "Normal": {"defending": 14, "playmaking": 10, "passing": 7}
-                },
-                "NT": {
-                    "Normal": {"defending": 18, "playmaking": 16.5, "passing": 9},
-                    "Counter-attack": {"defending": 18.5, "playmaking": 15, "passing": 10}
-                }
-            },
-            "midfielder": {
-                "U21": {
-                    "Normal": {"playmaking": 16, "passing": 7, "defending": 6}
-                },
-                "NT": {
-                    "Normal": {"playmaking": 18.5, "passing": 13, "defending": 10, "scoring": 7}
-                }
-            },
-            "forward": {
-                "U21": {
-                    "Normal": {"scoring": 14, "passing": 7, "winger": 7, "playmaking": 7},
-                    "PNF":    {"scoring": 14, "playmaking": 10, "passing": 7} # Corretto 17->7 per coerenza
-                },
-                "NT": {
-                    "Normal": {"scoring": 18, "passing": 12, "winger": 10, "playmaking": 12},
-                    "PNF":    {"scoring": 18, "playmaking": 15, "passing": 10}
-                }
-            },
-            "winger": {
-                "U21": {
-                    "Normal": {"playmaking": 12, "winger": 14, "defending": 6, "passing": 7}
-                },
-                "NT": {
-                    "Normal": {"playmaking": 18, "winger": 18, "defending": 8, "passing": 9}
-                }
-            },
-            "wingback": {
-                "U21": {
-                    "Normal": {"defending": 13, "winger": 7, "passing": 6, "playmaking": 6}
-                },
-                "NT": {
-                    "Normal": {"defending": 18, "winger": 16, "passing": 9, "playmaking": 8},
-                    "Counter-attack": {"defending": 18, "winger": 16, "passing": 10, "playmaking": 7}
-                }
-            }
-        }
-
-        # Merge User Targets
-        if user_targets:
+        # Target di default condivisi + eventuale overlay dei target utente
+        self.targets = registry or DEFAULT_REGISTRY
+        if user_targets and registry is None:
             self.merge_user_targets(user_targets)
 
+    @property
+    def TARGETS(self):
+        """Vista dict completa dei target (compatibilità con il vecchio attributo)."""
+        return self.targets.as_dict()
+
     def merge_user_targets(self, user_targets):
         """
-        Unisce i target utente a quelli di default.
-        Struttura user_target attesa:
-        {
-            "role": "midfielder",
-            "name": "MyU21",
-            "variant": "Normal",
-            "stats": { ... }
-        }
+        Unisce i target utente a quelli di default come overlay, senza modificare il registro condiviso.
+        Vedi TargetRegistry.with_user_targets per la struttura attesa.
         """
-        for t in user_targets:
-            role = t.get('role', '').lower()
-            name = t.get('name', 'Custom')
-            variant = t.get('variant', 'Normal')
-            stats = t.get('stats', {})
-
-            if role not in self.TARGETS:
-                self.TARGETS[role] = {}
-            
-            if name not in self.TARGETS[role]:
-                self.TARGETS[role][name] = {}
-            
-            # Sovrascrittura o aggiunta variante
-            self.TARGETS[role][name][variant] = stats
+        self.targets = self.targets.with_user_targets(user_targets)
 
     # ---------------------------------------------------------
     # 1. UPDATE CHECK
@@ -138,13 +253,33 @@ class HattrickAdvisor:
             return {"status": "ERROR", "message": "Formato data invalido"}
 
     # ---------------------------------------------------------
-    # 2. TRAJECTORY CHECK (Stub)
+    # 2. TRAJECTORY CHECK
     # ---------------------------------------------------------
-    def check_training_trajectory(self):
-        return {
-            "status": "STUB",
-            "message": "Analisi predittiva non ancora attiva."
-        }
+    def check_training_trajectory(self, trajectory=None):
+        """
+        Proietta settimana per settimana la skill allenata verso i target del ruolo
+        e stima quando ogni target viene raggiunto e se prima del limite d'età U21.
+        :param trajectory: traiettoria già calcolata (usata dall'analisi batch)
+        """
+        target_skills, _ = self.targets.resolve(self.role, self.target_level, self.variant)
+        if not target_skills:
+            return {
+                "status": "INFO",
+                "message": f"Nessun target configurato per {self.role} -> {self.target_level}"
+            }
+
+        training = self.data.get("training_type", "").lower()
+        current_skills = self.data.get("current_skills", {})
+        age = self.data.get("player_age", 17.0)
+
+        if trajectory is None and training in training_projection.SKILL_BASE_WEEKS:
+            trajectory = training_projection.project_skill(
+                current_skills.get(training, 0), age, training, self.data.get("stamina_share", 15)
+            )
+
+        return training_projection.trajectory_report(
+            current_skills, age, training, target_skills, self.target_level, trajectory
+        )
 
     # ---------------------------------------------------------
     # 3. TRAINING COMPATIBILITY
@@ -176,18 +311,9 @@ class HattrickAdvisor:
     # 4. TARGET CHECK (Logica aggiornata con i tuoi dati)
     # ---------------------------------------------------------
     def check_role_targets(self):
-        # 1. Recupera la configurazione corretta
+        # 1. Recupera la configurazione corretta (risoluzione memoizzata, fallback su "Normal")
         try:
-            role_config = self.TARGETS.get(self.role, {})
-            level_config = role_config.get(self.target_level, {})
-            
-            # Se la variante specificata non esiste (es. "Technical"), fallback su "Normal"
-            target_skills = level_config.get(self.variant)
-            if not target_skills:
-                target_skills = level_config.get("Normal")
-                used_variant = "Normal (Fallback)"
-            else:
-                used_variant = self.variant
+            target_skills, used_variant = self.targets.resolve(self.role, self.target_level, self.variant)
 
         except Exception as e:
             return {"status": "ERROR", "message": f"Errore config target: {str(e)}"}
@@ -272,4 +398,163 @@ class HattrickAdvisor:
             "3_compatibility": self.check_training_compatibility(),
             "4_role_targets": self.check_role_targets(),
             "5_stamina": self.check_stamina_setup()
-        }
\ No newline at end of file
+        }
+
+# ---------------------------------------------------------
+# ANALISI BATCH (liste intere)
+# ---------------------------------------------------------
+def _parse_number(value):
+    if value is None or value == '':
+        return 0
+    try:
+        return float(str(value).replace(',', '.'))
+    except ValueError:
+        return 0
+
+def _format_date(value):
+    """Converte la data del giocatore nel formato atteso da check_data_freshness."""
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%dT%H:%M:%S")
+
+    clean = str(value or '').strip()
+    match = re.match(r'^(\d{2})/(\d{2})/(\d{4})(?:\s+(\d{2}):(\d{2}):(\d{2}))?$', clean)
+    if match:
+        day, month, year, hour, minute, sec = match.groups()
+        return f"{year}-{month}-{day}T{hour or '00'}:{minute or '00'}:{sec or '00'}"
+    if re.match(r'^\d{4}-\d{2}-\d{2}', clean):
+        return clean.replace(' ', 'T')[:19]
+    return datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+def _map_training_type(name):
+    t = (name or '').lower()
+    for keywords, training in TRAINING_KEYWORDS:
+        if any(k in t for k in keywords):
+            return training
+    return 'unknown'
+
+def payload_from_player(player, defaults=None):
+    """
+    Costruisce il payload dell'advisor da un documento giocatore (Firestore o riga CSV),
+    come fa CsvMapperService.mapPlayerToPayload lato frontend.
+    defaults: player_role, team_target, role_variant comuni a tutto il batch.
+    """
+    defaults = defaults or {}
+    age = int(_parse_number(player.get('Age')) or 17)
+    age_days = int(_parse_number(player.get('AgeDays')))
+    return {
+        "last_update": _format_date(player.get('Updated') or player.get('updated_at')),
+        "player_age": round(age + age_days / 112.0, 2),
+        "player_role": defaults.get("player_role", ""),
+        "team_target": defaults.get("team_target", "U21"),
+        "role_variant": defaults.get("role_variant", "Normal"),
+        "training_type": _map_training_type(player.get('TrainingName')),
+        "stamina_share": _parse_number(player.get('StaminaTrainingPart')) or 15,
+        "current_skills": {skill: _parse_number(player.get(field)) for skill, field in SKILL_FIELDS.items()}
+    }
+
+def build_registry(user_targets=None):
+    """Registro target: quello di default condiviso, oppure un overlay con i target utente."""
+    if not user_targets:
+        return DEFAULT_REGISTRY
+    return DEFAULT_REGISTRY.with_user_targets(user_targets)
+
+def build_target_engine(user_targets=None):
+    """Motore vettoriale (NumPy) sui target di default + target utente."""
+    # Il motore sui soli target di default è costruito una volta per istanza
+    return build_registry(user_targets).engine()
+
+def check_role_targets_batch(payloads, user_targets=None, engine=None):
+    """Equivalente vettoriale di check_role_targets per una lista di payload advisor."""
+    engine = engine or build_target_engine(user_targets)
+    return engine.check_batch([
+        (p.get("player_role", "").lower(), p.get("team_target", "U21"),
+         p.get("role_variant", "Normal"), p.get("current_skills", {}))
+        for p in payloads
+    ])
+
+def rank_best_roles(payloads, user_targets=None, level=None, top=3, engine=None):
+    """Per ogni payload, le `top` combinazioni ruolo/livello/variante più vicine al completamento."""
+    engine = engine or build_target_engine(user_targets)
+    return engine.rank_roles([p.get("current_skills", {}) for p in payloads], level=level, top=top)
+
+def check_training_trajectory_batch(payloads, registry=None):
+    """
+    Proiezioni di allenamento per una lista di payload: i giocatori con la stessa skill
+    allenata vengono proiettati insieme con un unico passo vettoriale per settimana.
+    """
+    registry = registry or DEFAULT_REGISTRY
+    groups = {}
+    for i, p in enumerate(payloads):
+        training = p.get("training_type", "").lower()
+        if training in training_projection.SKILL_BASE_WEEKS:
+            groups.setdefault(training, []).append(i)
+
+    trajectories = [None] * len(payloads)
+    for training, rows in groups.items():
+        matrix = training_projection.project_skill_batch(
+            [payloads[i].get("current_skills", {}).get(training, 0) for i in rows],
+            [payloads[i].get("player_age", 17.0) for i in rows],
+            training,
+            [payloads[i].get("stamina_share", 15) for i in rows]
+        )
+        for r, i in enumerate(rows):
+            trajectories[i] = matrix[r].tolist()
+
+    return [
+        HattrickAdvisor(p, registry=registry).check_training_trajectory(trajectory=trajectories[i])
+        for i, p in enumerate(payloads)
+    ]
+
+def run_batch_analysis(players, user_targets=None, defaults=None, rank_roles=False):
+    """
+    Esegue l'analisi completa per ogni giocatore con gli stessi target utente.
+    players: payload dell'advisor (con current_skills) o documenti giocatore grezzi.
+    Il controllo target è calcolato in un'unica passata vettoriale; con rank_roles=True
+    ogni report include anche i ruoli più adatti (best_roles).
+    Ritorna i report per giocatore e un riepilogo COMPLETED/IN_PROGRESS per ruolo e livello.
+    """
+    defaults = defaults or {}
+    payloads = []
+    for player in players:
+        if "current_skills" in player:
+            payloads.append({**defaults, **player})
+        else:
+            payloads.append(payload_from_player(player, defaults))
+
+    registry = build_registry(user_targets)
+    engine = registry.engine() if payloads else None
+    role_targets = check_role_targets_batch(payloads, engine=engine) if payloads else []
+    trajectories = check_training_trajectory_batch(payloads, registry) if payloads else []
+    best_roles = rank_best_roles(payloads, engine=engine) if rank_roles and payloads else None
+
+    reports = []
+    summary = {}
+    for i, (player, payload) in enumerate(zip(players, payloads)):
+        advisor = HattrickAdvisor(payload, registry=registry)
+        report = {
+            "1_freshness": advisor.check_data_freshness(),
+            "2_trajectory": trajectories[i],
+            "3_compatibility": advisor.check_training_compatibility(),
+            "4_role_targets": role_targets[i],
+            "5_stamina": advisor.check_stamina_setup()
+        }
+        entry = {
+            "player_id": player.get("PlayerID") or player.get("id") or player.get("player_id"),
+            "name": f"{player.get('FirstName', '')} {player.get('LastName', '')}".strip(),
+            "report": report
+        }
+        if best_roles is not None:
+            entry["best_roles"] = best_roles[i]
+        reports.append(entry)
+
+        key = f"{payload.get('player_role', '')} {payload.get('team_target', 'U21')}".strip()
+        bucket = summary.setdefault(key, {"completed": 0, "in_progress": 0, "other": 0})
+        target_status = report["4_role_targets"].get("status")
+        if target_status == "COMPLETED":
+            bucket["completed"] += 1
+        elif target_status == "IN_PROGRESS":
+            bucket["in_progress"] += 1
+        else:
+            bucket["other"] += 1
+
+    return {"count": len(reports), "reports": reports, "summary": summary}
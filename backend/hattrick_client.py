@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Parametri di default, sovrascrivibili da variabili d'ambiente su Cloud Run
+DEFAULT_MAX_WORKERS = int(os.environ.get('SYNC_MAX_WORKERS', '8'))
+# Richieste al secondo per host (0 = nessun limite, default). Con un limite R la sync dei
+# dettagli non scende sotto N/R secondi qualunque sia la concorrenza: impostarlo solo se
+# l'host remoto lo richiede (es. API Hattrick reali), non per il mock.
+DEFAULT_RATE_PER_SEC = float(os.environ.get('SYNC_RATE_PER_SEC', '0'))
+DEFAULT_MAX_RETRIES = int(os.environ.get('SYNC_MAX_RETRIES', '3'))
+DEFAULT_BACKOFF = float(os.environ.get('SYNC_BACKOFF_FACTOR', '0.5'))
+
+
+class HostRateLimiter:
+    """
+    Token bucket per host: limita il numero di richieste al secondo
+    verso ciascun host, condiviso tra tutti i worker del pool.
+    Con rate_per_sec nullo o <= 0 non limita.
+    """
+
+    def __init__(self, rate_per_sec):
+        self.rate = rate_per_sec
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def acquire(self, host):
+        """Blocca il chiamante finché non è disponibile uno slot per l'host."""
+        if not self.rate or self.rate <= 0:
+            return
+        interval = 1.0 / self.rate
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HattrickClient:
+    """
+    Client HTTP per il mock (o le API) Hattrick.
+    Usa una sessione con connection pool, retry con backoff esponenziale
+    e rate limiting per host; i dettagli giocatore vengono scaricati in parallelo.
+    """
+
+    def __init__(self, base_url, max_workers=None, rate_per_sec=None,
+                 max_retries=None, backoff_factor=None):
+        self.base_url = base_url
+        self.max_workers = int(max_workers or DEFAULT_MAX_WORKERS)
+        self.rate_limiter = HostRateLimiter(DEFAULT_RATE_PER_SEC if rate_per_sec is None else rate_per_sec)
+
+        retry = Retry(
+            total=DEFAULT_MAX_RETRIES if max_retries is None else max_retries,
+            backoff_factor=DEFAULT_BACKOFF if backoff_factor is None else backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            respect_retry_after_header=True
+        )
+        # Il pool di connessioni deve essere grande almeno quanto il numero di worker
+        adapter = HTTPAdapter(max_retries=retry,
+                              pool_connections=self.max_workers,
+                              pool_maxsize=self.max_workers)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, timeout=10, stream=False, etag=None):
+        """GET rispettando il rate limit dell'host di destinazione; con etag la richiesta è condizionale."""
+        self.rate_limiter.acquire(urlparse(url).netloc)
+        headers = {'If-None-Match': etag} if etag else None
+        return self.session.get(url, timeout=timeout, stream=stream, headers=headers)
+
+    def player_list_url(self):
+        return f"{self.base_url}?file=players&version=2.7"
+
+    def player_detail_url(self, player_id):
+        return f"{self.base_url}?file=playerdetails&version=3.1&actionType=view&playerID={player_id}"
+
+    def fetch_player_list(self, timeout=10, stream=False, etag=None):
+        """
+        Con stream=True il body va letto da response.raw (es. con hattrick_xml.iter_players).
+        Con etag il server risponde 304 se la lista non è cambiata.
+        """
+        return self.get(self.player_list_url(), timeout=timeout, stream=stream, etag=etag)
+
+    def _fetch_detail(self, player_id, timeout):
+        try:
+            res = self.get(self.player_detail_url(player_id), timeout=timeout)
+            if res.status_code == 200:
+                return player_id, res.content
+            print(f"Warning: details for player {player_id} returned {res.status_code}")
+        except Exception as detail_err:
+            print(f"Warning: could not fetch details for player {player_id}: {detail_err}")
+        return player_id, None
+
+    def fetch_player_details(self, player_ids, timeout=5):
+        """
+        Scarica in parallelo l'XML di dettaglio per ogni giocatore.
+        Ritorna un dict {player_id: bytes | None}; gli errori non interrompono il batch.
+        """
+        player_ids = list(player_ids)
+        if not player_ids:
+            return {}
+
+        workers = min(self.max_workers, len(player_ids))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(lambda pid: self._fetch_detail(pid, timeout), player_ids)
+            return dict(results)
+
+    def close(self):
+        self.session.close()
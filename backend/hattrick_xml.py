@@ -0,0 +1,92 @@
+import io
+import xml.etree.ElementTree as ET
+
+
+def _as_stream(source):
+    """Accetta path, bytes o file-like e ritorna qualcosa di leggibile da iterparse."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+
+def iter_elements(source, tag, header=None):
+    """
+    Scorre l'XML in streaming con iterparse e restituisce uno alla volta gli elementi <tag>.
+    Dopo ogni elemento il sottoalbero viene svuotato e staccato dal padre,
+    quindi la memoria resta costante indipendentemente dalla dimensione del file.
+
+    :param header: dict opzionale popolato con i campi semplici figli della radice
+                   (FetchedDate, UserID, ...) man mano che vengono letti.
+    """
+    stack = []
+    for event, elem in ET.iterparse(_as_stream(source), events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if elem.tag == tag:
+            yield elem
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+        elif header is not None and len(stack) == 1 and len(elem) == 0:
+            # Campo semplice sotto <HattrickData>
+            header[elem.tag] = elem.text
+
+
+def flatten_player(player_el):
+    """Appiattisce un <Player> di players.xml: solo i figli con testo (salta tag vuoti o complessi)."""
+    p_data = {}
+    for child in player_el:
+        if child.text and len(child) == 0:
+            p_data[child.tag] = child.text
+    return p_data
+
+
+def flatten_player_detail(player_el):
+    """Appiattisce un <Player> di playerdetails.xml (skill, team proprietario e campi piatti)."""
+    p_data = {}
+    for d_child in player_el:
+        if d_child.tag == 'PlayerSkills':
+            # Appiattisce le skill (es. StaminaSkill, KeeperSkill)
+            for skill in d_child:
+                p_data[skill.tag] = skill.text
+        elif d_child.tag == 'OwningTeam':
+            # Info dal team proprietario
+            p_data['TeamID'] = d_child.findtext('TeamID')
+            p_data['TeamName'] = d_child.findtext('TeamName')
+            p_data['OwningTeam_LeagueID'] = d_child.findtext('LeagueID')
+        elif d_child.text and len(d_child) == 0:
+            # Altri campi piatti (NativeLeagueID, NextBirthDay, etc.)
+            p_data[d_child.tag] = d_child.text
+    return p_data
+
+
+def iter_players(source, header=None):
+    """Generatore di dict giocatore da players.xml."""
+    for player_el in iter_elements(source, 'Player', header):
+        p_data = flatten_player(player_el)
+        if p_data.get('PlayerID'):
+            yield p_data
+
+
+def iter_player_details(source, header=None):
+    """Generatore di dict giocatore da playerdetail-*.xml (UserID preso dalla radice)."""
+    header = {} if header is None else header
+    for player_el in iter_elements(source, 'Player', header):
+        p_data = flatten_player_detail(player_el)
+        if header.get('UserID'):
+            p_data['UserID'] = header['UserID']
+        yield p_data
+
+
+def iter_national_teams(source, header=None):
+    """Generatore di dict squadra nazionale da nationalteams.xml."""
+    for team_el in iter_elements(source, 'NationalTeam', header):
+        yield {child.tag: child.text for child in team_el if child.text and len(child) == 0}
+
+
+def parse_player_detail(content):
+    """Ritorna il dict del (primo) giocatore di un XML di dettaglio, oppure None."""
+    return next(iter_player_details(content), None)
@@ -0,0 +1,338 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+# DEBUG abilita i dump dei payload; INFO (default) emette solo la riga strutturata per richiesta
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Se attivo, le risposte includono l'header Server-Timing con le fasi principali
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+
+_current = contextvars.ContextVar('request_trace', default=None)
+
+
+class RequestTrace:
+    """Tempi e contatori raccolti durante una singola richiesta."""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.route = None
+        self.stages = {}
+        self.firestore = {"calls": 0, "reads": 0, "writes": 0, "ms": 0.0, "ops": {}}
+
+    def add_stage(self, name, ms):
+        stage = self.stages.setdefault(name, {"count": 0, "ms": 0.0})
+        stage["count"] += 1
+        stage["ms"] += ms
+
+    def add_firestore(self, op, ms, reads=0, writes=0):
+        fs = self.firestore
+        fs["calls"] += 1
+        fs["reads"] += reads
+        fs["writes"] += writes
+        fs["ms"] += ms
+        op_stats = fs["ops"].setdefault(op, {"count": 0, "ms": 0.0, "reads": 0, "writes": 0})
+        op_stats["count"] += 1
+        op_stats["ms"] += ms
+        op_stats["reads"] += reads
+        op_stats["writes"] += writes
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def summary(self):
+        def rounded(d):
+            return {k: (round(v, 2) if isinstance(v, float) else v) for k, v in d.items()}
+        fs = dict(self.firestore)
+        fs["ops"] = {op: rounded(v) for op, v in fs["ops"].items()}
+        return {
+            "request_id": self.request_id,
+            "route": self.route,
+            "duration_ms": round(self.elapsed_ms(), 2),
+            "stages": {name: rounded(v) for name, v in self.stages.items()},
+            "firestore": rounded(fs)
+        }
+
+
+# ---------------------------------------------------------
+# LOGGING
+# ---------------------------------------------------------
+def log(event, severity='INFO', **fields):
+    """Riga di log JSON (Cloud Logging interpreta severity e i campi strutturati)."""
+    trace = _current.get()
+    record = {"severity": severity, "event": event}
+    if trace is not None:
+        record["request_id"] = trace.request_id
+    record.update(fields)
+    print(json.dumps(record, default=str))
+
+
+def debug(event, **fields):
+    """Log solo con LOG_LEVEL=DEBUG (dump dei payload e simili)."""
+    if LOG_LEVEL == 'DEBUG':
+        log(event, severity='DEBUG', **fields)
+
+
+# ---------------------------------------------------------
+# TIMING
+# ---------------------------------------------------------
+@contextmanager
+def timed(name):
+    """Misura un blocco come fase `name` della richiesta corrente (no-op fuori richiesta)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, (time.perf_counter() - start) * 1000)
+
+
+def set_route(action, method=None):
+    trace = _current.get()
+    if trace is not None:
+        trace.route = f"{action}.{method}" if method else (action or "analysis")
+
+
+def trace_methods(cls):
+    """Decoratore di classe: misura ogni metodo pubblico (anche async) come fase 'Classe.metodo'."""
+    for attr_name, attr in list(vars(cls).items()):
+        if attr_name.startswith('_'):
+            continue
+        if isinstance(attr, staticmethod):
+            setattr(cls, attr_name, staticmethod(_timed_function(f"{cls.__name__}.{attr_name}", attr.__func__)))
+        elif inspect.isfunction(attr):
+            setattr(cls, attr_name, _timed_function(f"{cls.__name__}.{attr_name}", attr))
+    return cls
+
+
+def _timed_function(name, fn):
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return await fn(*args, **kwargs)
+            with timed(name):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return fn(*args, **kwargs)
+        with timed(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def _request_id(request):
+    trace_header = request.headers.get('X-Cloud-Trace-Context', '')
+    if trace_header:
+        return trace_header.split('/')[0]
+    return request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16]
+
+
+def traced_request(fn):
+    """
+    Decoratore per l'entry point HTTP: apre la traccia della richiesta, emette a fine
+    richiesta una riga JSON con tempi per fase e contatori Firestore e, se SERVER_TIMING=1,
+    aggiunge l'header Server-Timing alla risposta.
+    """
+    @functools.wraps(fn)
+    def wrapper(request, *args, **kwargs):
+        trace = RequestTrace(_request_id(request))
+        token = _current.set(trace)
+        status = 500
+        try:
+            response = fn(request, *args, **kwargs)
+            status = _status_of(response)
+            if SERVER_TIMING:
+                response = _with_server_timing(response, trace)
+            return response
+        finally:
+            log("request", status=status, **{k: v for k, v in trace.summary().items() if k != "request_id"})
+            _current.reset(token)
+    return wrapper
+
+
+def _status_of(response):
+    if isinstance(response, tuple) and len(response) > 1:
+        return response[1]
+    return getattr(response, 'status_code', 200)
+
+
+def _with_server_timing(response, trace):
+    parts = [f"total;dur={trace.elapsed_ms():.1f}"]
+    if trace.firestore["calls"]:
+        parts.append(f"firestore;dur={trace.firestore['ms']:.1f};desc=\"{trace.firestore['calls']} calls\"")
+    for name, stage in trace.stages.items():
+        parts.append(f"{name};dur={stage['ms']:.1f}")
+    value = ', '.join(parts)
+
+    if isinstance(response, tuple) and len(response) == 3 and isinstance(response[2], dict):
+        body, status, headers = response
+        return (body, status, {**headers, 'Server-Timing': value})
+    if hasattr(response, 'headers'):
+        response.headers['Server-Timing'] = value
+    return response
+
+
+# ---------------------------------------------------------
+# FIRESTORE
+# ---------------------------------------------------------
+# Oggetti Firestore da avvolgere per misurare le chiamate che fanno I/O
+_WRAPPED_TYPES = {
+    'CollectionReference', 'DocumentReference', 'Query', 'CollectionGroup',
+    'AggregationQuery', 'WriteBatch', 'Transaction', 'BulkWriter',
+    'AsyncCollectionReference', 'AsyncDocumentReference', 'AsyncQuery', 'AsyncCollectionGroup',
+    'AsyncAggregationQuery', 'AsyncWriteBatch', 'AsyncTransaction'
+}
+# Su questi oggetti set/update/delete/create accodano soltanto la scrittura
+_STAGING_TYPES = {'WriteBatch', 'Transaction', 'BulkWriter', 'AsyncWriteBatch', 'AsyncTransaction'}
+_BATCH_TYPES = {'WriteBatch', 'AsyncWriteBatch'}
+_IO_METHODS = {'get', 'stream', 'get_all', 'set', 'update', 'delete', 'create', 'add', 'commit'}
+_WRITE_METHODS = {'set', 'update', 'delete', 'create', 'add'}
+
+
+def wrap_firestore(obj):
+    """Avvolge un oggetto Firestore (query, riferimenti, batch) per contarne letture e scritture."""
+    if type(obj).__name__ in _WRAPPED_TYPES:
+        return _TracedFirestore(obj)
+    return obj
+
+
+def traced_client_call(client, name):
+    """Attributo del client Firestore, misurato se fa I/O (get_all) e avvolto se è un builder."""
+    attr = getattr(client, name)
+    if not callable(attr):
+        return attr
+    return _traced_callable(client, name, attr)
+
+
+def _unwrap(value):
+    if isinstance(value, _TracedFirestore):
+        return object.__getattribute__(value, '_target')
+    if isinstance(value, list):
+        return [_unwrap(v) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_unwrap(v) for v in value)
+    return value
+
+
+def _traced_callable(target, name, fn):
+    type_name = type(target).__name__
+
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        args = [_unwrap(a) for a in args]
+        kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+
+        if name in _WRITE_METHODS and type_name in _STAGING_TYPES:
+            # Scrittura accodata: conteggiata subito (Transaction/BulkWriter) o al commit (WriteBatch)
+            if type_name not in _BATCH_TYPES:
+                _record(f"{type_name}.{name}", 0.0, writes=1, count_call=False)
+            return wrap_firestore(fn(*args, **kwargs))
+
+        if name not in _IO_METHODS or _current.get() is None:
+            return wrap_firestore(fn(*args, **kwargs))
+
+        op = f"{type_name}.{name}"
+        pending_writes = len(target) if name == 'commit' and type_name in _BATCH_TYPES else 0
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+
+        # Client async: si misura fino al completamento della coroutine o dello stream
+        if inspect.iscoroutine(result):
+            return _traced_coroutine(op, name, result, start, pending_writes)
+        if inspect.isasyncgen(result):
+            return _counting_async_stream(op, result, start)
+        if name in ('stream', 'get_all') or inspect.isgenerator(result):
+            return _counting_stream(op, result, start)
+        _record_result(op, name, result, (time.perf_counter() - start) * 1000, pending_writes)
+        return wrap_firestore(result)
+    return call
+
+
+def _record_result(op, name, result, ms, pending_writes):
+    if name == 'commit':
+        _record(op, ms, writes=pending_writes)
+    elif name in _WRITE_METHODS:
+        _record(op, ms, writes=1)
+    elif isinstance(result, list):
+        _record(op, ms, reads=len(result))
+    else:
+        _record(op, ms, reads=1)
+
+
+async def _traced_coroutine(op, name, coro, start, pending_writes):
+    result = await coro
+    _record_result(op, name, result, (time.perf_counter() - start) * 1000, pending_writes)
+    return wrap_firestore(result)
+
+
+async def _counting_async_stream(op, stream, start):
+    reads = 0
+    try:
+        async for item in stream:
+            reads += 1
+            yield item
+    finally:
+        _record(op, (time.perf_counter() - start) * 1000, reads=reads)
+
+
+def _counting_stream(op, stream, start):
+    """Conta i documenti letti da uno stream; il tempo include l'intera iterazione."""
+    reads = 0
+    try:
+        for item in stream:
+            reads += 1
+            yield item
+    finally:
+        _record(op, (time.perf_counter() - start) * 1000, reads=reads)
+
+
+def _record(op, ms, reads=0, writes=0, count_call=True):
+    trace = _current.get()
+    if trace is None:
+        return
+    if count_call:
+        trace.add_firestore(op, ms, reads=reads, writes=writes)
+    else:
+        trace.firestore["writes"] += writes
+
+
+class _TracedFirestore:
+    """Proxy trasparente: inoltra attributi e assegnazioni all'oggetto Firestore originale."""
+    __slots__ = ('_target',)
+
+    def __init__(self, target):
+        object.__setattr__(self, '_target', target)
+
+    def __getattr__(self, name):
+        target = object.__getattribute__(self, '_target')
+        attr = getattr(target, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        return _traced_callable(target, name, attr)
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, '_target'), name, value)
+
+    def __len__(self):
+        return len(object.__getattribute__(self, '_target'))
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, '_target') == _unwrap(other)
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, '_target'))
+
+    def __repr__(self):
+        return repr(object.__getattribute__(self, '_target'))
@@ -1,20 +1,67 @@
+import coldstart
+import gzip
 import os
+from email.utils import formatdate, parsedate_to_datetime
 import functions_framework
-from hattrick_advisor import HattrickAdvisor
-from firebase import TargetManager, RoleManager, ListManager, PlayerManager, UserManager
+from flask import Response
+import async_runtime
+import instrumentation
+from context_cache import request_scoped
+
+# Manager Firestore e advisor vengono importati al primo utilizzo e riusati
+# per tutta la vita dell'istanza calda (vedi _manager)
+_MANAGERS = {}
+
+# Dimensione dei blocchi con cui il mock serve i file XML
+MOCK_CHUNK_SIZE = 64 * 1024
+
+# File mock fino a questa dimensione restano in memoria; oltre vengono letti a blocchi dal disco
+MOCK_CACHE_MAX_BYTES = int(os.environ.get('MOCK_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+# Sotto questa dimensione la compressione gzip non conviene
+MOCK_GZIP_MIN_BYTES = 1024
+
+# Cache dei file mock: {path: {mtime_ns, size, etag, body, gzip, ...}}
+_MOCK_CACHE = {}
+
+def _manager(name):
+    """Istanza singleton del manager `name` di firebase.py (import al primo utilizzo)."""
+    manager = _MANAGERS.get(name)
+    if manager is None:
+        with coldstart.stage('import:firebase'):
+            import firebase
+        with coldstart.stage(f"init:{name}"):
+            manager = getattr(firebase, name)()
+        _MANAGERS[name] = manager
+    return manager
+
+def _page_args(request_json):
+    """Estrae i parametri opzionali pageSize, pageToken e fields (lista o stringa CSV) dal payload."""
+    fields = request_json.get('fields')
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(',') if f.strip()]
+    return {
+        'page_size': request_json.get('pageSize'),
+        'page_token': request_json.get('pageToken'),
+        'fields': fields or None
+    }
 
 @functions_framework.http
+@instrumentation.traced_request
+@request_scoped
 def analyze_player(request):
     """
     HTTP Cloud Function entry point con gestione CORS.
     Funge da router per supportare la retrocompatibilità.
     """
+    if coldstart.mark_first_request():
+        instrumentation.log("cold_start", **coldstart.report())
+
     # --- ROUTING PER MOCK (Retrocompatibilità) ---
-    # Log per debug: vediamo cosa arriva
-    print(f"DEBUG: Path={request.path}, Args={request.args}")
+    instrumentation.debug("http_request", path=request.path, args=request.args.to_dict())
     
     # Se il path contiene /mock o è presente il parametro 'file', delega a mock(request)
     if 'file' in request.args or '/mock' in request.path:
+        instrumentation.set_route('mock')
         return mock(request)
 
     # --- 1. GESTIONE CORS (Pre-flight request) ---
@@ -32,6 +79,11 @@ def analyze_player(request):
         'Access-Control-Allow-Origin': '*'
     }
 
+    # --- UPLOAD IMPORT GIOCATORI (NDJSON/CSV letti in streaming dal corpo della richiesta) ---
+    if request.method == 'POST' and request.args.get('action') == 'import_players':
+        instrumentation.set_route('manage_players', 'import_players')
+        return _import_upload(request, headers)
+
     # --- 3. LOGICA APPLICATIVA ---
     request_json = request.get_json(silent=True)
     
@@ -42,13 +94,17 @@ def analyze_player(request):
 
     try:
         action = request_json.get('action')
-        print(f"Backend triggered: action={action}")
-        print(f"Request payload: {request_json}")
+        instrumentation.set_route(action, request_json.get('method'))
+        # Il payload può contenere dati personali: viene registrato solo con LOG_LEVEL=DEBUG
+        instrumentation.debug("payload", payload=request_json)
         
+        # --- DIAGNOSTICA COLD START ---
+        if action == 'cold_start':
+            return (coldstart.report(), 200, headers)
+
         # --- GESTIONE UTENTI (Profilo) ---
-        if action == 'manage_users':
-            print(f"DEBUG: manage_users called with request: {request_json}")
-            manager = UserManager()
+        elif action == 'manage_users':
+            manager = _manager('UserManager')
             method = request_json.get('method')
             email = request_json.get('email')
             
@@ -66,13 +122,13 @@ def analyze_player(request):
         
         # --- GESTIONE TARGET ---
         elif action == 'manage_targets':
-            manager = TargetManager()
+            manager = _manager('TargetManager')
             method = request_json.get('method') # get, save, delete
             email = request_json.get('email')
             
             if method == 'get':
-                result = manager.get_user_targets(email)
-                return ({"targets": result}, 200, headers)
+                result = manager.get_user_targets(email, **_page_args(request_json))
+                return ({"targets": result, "nextPageToken": result.next_page_token}, 200, headers)
             
             elif method == 'save':
                 target_data = request_json.get('target')
@@ -89,13 +145,13 @@ def analyze_player(request):
 
         # --- GESTIONE RUOLI (Coach Only) ---
         elif action == 'manage_roles':
-            manager = RoleManager()
+            manager = _manager('RoleManager')
             method = request_json.get('method')
             requester = request_json.get('requesterEmail')
             
             if method == 'get_user_context':
                 email = request_json.get('email') or requester
-                ctx = manager.get_user_context(email)
+                ctx = async_runtime.call(manager, 'get_user_context', email)
                 return (ctx, 200, headers)
 
             elif method == 'set_role':
@@ -120,13 +176,13 @@ def analyze_player(request):
 
         # --- GESTIONE LISTE ---
         elif action == 'manage_lists':
-            manager = ListManager()
+            manager = _manager('ListManager')
             method = request_json.get('method')
             email = request_json.get('email') # Requester
             
             if method == 'get_lists':
-                lists = manager.get_lists(email)
-                return ({"lists": lists}, 200, headers)
+                lists = manager.get_lists(email, **_page_args(request_json))
+                return ({"lists": lists, "nextPageToken": lists.next_page_token}, 200, headers)
                 
             elif method == 'create_list':
                 name = request_json.get('name')
@@ -142,37 +198,53 @@ def analyze_player(request):
             elif method == 'add_player':
                 list_id = request_json.get('listId')
                 player_id = request_json.get('playerId')
-                result = manager.add_player(email, list_id, player_id)
+                result = async_runtime.call(manager, 'add_player', email, list_id, player_id)
                 return (result, 200, headers)
                 
             elif method == 'remove_player':
                 list_id = request_json.get('listId')
                 player_id = request_json.get('playerId')
-                result = manager.remove_player(list_id, player_id)
+                result = manager.remove_player(email, list_id, player_id)
+                return (result, 200, headers)
+
+            elif method == 'add_players':
+                list_id = request_json.get('listId')
+                player_ids = request_json.get('playerIds') or []
+                result = async_runtime.call(manager, 'add_players', email, list_id, player_ids)
+                return (result, 200, headers)
+
+            elif method == 'remove_players':
+                list_id = request_json.get('listId')
+                player_ids = request_json.get('playerIds') or []
+                result = manager.remove_players(email, list_id, player_ids)
                 return (result, 200, headers)
                 
             elif method == 'get_list_players':
                 list_id = request_json.get('listId')
-                players = manager.get_list_players(list_id)
-                return ({"players": players}, 200, headers)
+                players = manager.get_list_players(list_id, **_page_args(request_json))
+                return ({"players": players, "nextPageToken": players.next_page_token}, 200, headers)
+
+            elif method == 'rebuild_members':
+                result = manager.rebuild_members_index(email)
+                return (result, 200, headers)
 
             else:
                  return ({"error": "Metodo list non valido"}, 400, headers)
 
         # --- GESTIONE GIOCATORI ---
         elif action == 'manage_players':
-            manager = PlayerManager()
+            manager = _manager('PlayerManager')
             method = request_json.get('method')
             requester = request_json.get('requesterEmail')
             
             if method == 'get_list_players_detailed':
                 list_id = request_json.get('listId')
-                players = manager.get_list_players_detailed(requester, list_id)
-                return ({"players": players}, 200, headers)
+                players = manager.get_list_players_detailed(requester, list_id, **_page_args(request_json))
+                return ({"players": players, "nextPageToken": players.next_page_token}, 200, headers)
             
             elif method == 'get_my_players':
-                players = manager.get_my_players(requester)
-                return ({"players": players}, 200, headers)
+                players = manager.get_my_players(requester, **_page_args(request_json))
+                return ({"players": players, "nextPageToken": players.next_page_token}, 200, headers)
             
             elif method == 'get_player':
                 player_id = request_json.get('playerId')
@@ -185,35 +257,109 @@ def analyze_player(request):
                 return (result, 200, headers)
 
             elif method == 'import_players':
-                players_list = request_json.get('players')
-                result = manager.import_players(requester, players_list)
+                # Array JSON in 'players' oppure testo NDJSON/CSV in 'data' con 'format'
+                fmt = request_json.get('format', 'json')
+                players_list = request_json.get('players') if fmt == 'json' else request_json.get('data')
+                result = manager.import_players(requester, players_list, fmt,
+                                                max_workers=request_json.get('concurrency'))
                 return (result, 200, headers)
 
             elif method == 'sync_players':
-                result = manager.sync_players_from_mock(requester)
+                result = manager.sync_players_from_mock(
+                    requester,
+                    max_workers=request_json.get('concurrency'),
+                    incremental=request_json.get('incremental', True)
+                )
                 return (result, 200, headers)
 
             elif method == 'search_players':
                 query = request_json.get('query', '')
                 list_id = request_json.get('listId')
-                result = manager.search_players(requester, query, list_id)
-                return ({"players": result}, 200, headers)
+                result = async_runtime.call(
+                    manager, 'search_players', requester, query, list_id,
+                    limit=request_json.get('pageSize'),
+                    page_token=request_json.get('pageToken')
+                )
+                return ({"players": result, "nextPageToken": result.next_page_token}, 200, headers)
+
+            elif method == 'query_players':
+                # filters: [{"field", "op", "value"}], sort: {"field", "direction"}, leagueId/listId opzionali
+                try:
+                    players = manager.query_players(
+                        requester,
+                        filters=request_json.get('filters'),
+                        sort=request_json.get('sort'),
+                        list_id=request_json.get('listId'),
+                        league_id=request_json.get('leagueId'),
+                        **_page_args(request_json)
+                    )
+                except ValueError as e:
+                    return ({"error": str(e)}, 400, headers)
+                return ({"players": players, "nextPageToken": players.next_page_token}, 200, headers)
+
+            elif method == 'get_skill_history':
+                # playerIds (o playerId) e intervallo opzionale since/until in formato ISO
+                player_ids = request_json.get('playerIds') or [request_json.get('playerId')]
+                history = manager.get_skill_history(
+                    requester, player_ids,
+                    since=request_json.get('since'),
+                    until=request_json.get('until')
+                )
+                return ({"history": history}, 200, headers)
+
+            elif method == 'rebuild_search_index':
+                result = manager.rebuild_search_index(requester)
+                return (result, 200, headers)
+
+            elif method == 'normalize_schema':
+                # Backfill riprendibile: maxPages limita il lavoro per richiesta, restart riparte da capo
+                result = manager.normalize_schema(
+                    requester,
+                    max_pages=request_json.get('maxPages'),
+                    restart=bool(request_json.get('restart'))
+                )
+                return (result, 200, headers)
             
             else:
                  return ({"error": "Metodo player non valido"}, 400, headers)
 
+        # --- ANALISI BATCH (lista o array di giocatori) ---
+        elif action == 'analyze_batch':
+            email = request_json.get('email')
+            list_id = request_json.get('listId')
+            players = request_json.get('players')
+            defaults = {
+                k: request_json[k] for k in ('player_role', 'team_target', 'role_variant')
+                if request_json.get(k)
+            }
+
+            if list_id:
+                players = _manager('PlayerManager').get_list_players_detailed(email, list_id)
+            elif not isinstance(players, list):
+                return ({"error": "listId o players mancanti per analyze_batch"}, 400, headers)
+
+            # I target utente vengono letti una sola volta per tutto il batch
+            user_targets = _manager('TargetManager').get_user_targets(email) if email else []
+            from hattrick_advisor import run_batch_analysis
+            with instrumentation.timed('run_batch_analysis'):
+                result = run_batch_analysis(players, user_targets, defaults,
+                                            rank_roles=bool(request_json.get('rankRoles')))
+            return (result, 200, headers)
+
         # --- DEFAULT: ANALISI ---
         # Fetch user targets if email is available
         user_targets = []
         email = request_json.get('email')
         if email:
             try:
-                manager = TargetManager()
+                manager = _manager('TargetManager')
                 user_targets = manager.get_user_targets(email)
             except Exception as e:
-                print(f"Warning: could not fetch targets for {email}: {e}")
+                instrumentation.log("targets_fetch_failed", severity='WARNING', email=email, error=str(e))
 
         # Istanzia l'Advisor passando il JSON ricevuto e i target utente
+        with coldstart.stage('import:hattrick_advisor'):
+            from hattrick_advisor import HattrickAdvisor
         advisor = HattrickAdvisor(request_json, user_targets)
         
         # Esegue tutti i controlli
@@ -224,6 +370,36 @@ def analyze_player(request):
         
     except Exception as e:
         # Gestione errori generici
+        instrumentation.log("request_error", severity='ERROR', error=str(e))
+        return ({"error": str(e)}, 500, headers)
+
+def _import_upload(request, headers):
+    """
+    Import da upload: POST ?action=import_players&requesterEmail=...[&format=csv|ndjson|json]
+    con il file nel corpo della richiesta o come campo multipart 'file'.
+    """
+    import player_import
+
+    requester = request.args.get('requesterEmail')
+    if not requester:
+        return ({"error": "requesterEmail mancante per import_players"}, 400, headers)
+
+    upload = request.files.get('file')
+    if upload is not None:
+        fmt = request.args.get('format') or player_import.detect_format(upload.mimetype, upload.filename)
+        source = upload.stream
+    else:
+        fmt = request.args.get('format') or player_import.detect_format(request.mimetype)
+        source = request.stream
+
+    try:
+        result = _manager('PlayerManager').import_players(
+            requester, source, fmt, max_workers=request.args.get('concurrency'))
+        return (result, 200, headers)
+    except ValueError as e:
+        return ({"error": str(e)}, 400, headers)
+    except Exception as e:
+        instrumentation.log("request_error", severity='ERROR', error=str(e))
         return ({"error": str(e)}, 500, headers)
 
 @functions_framework.http
@@ -263,14 +439,87 @@ def mock(request):
     
     file_path = os.path.join(os.path.dirname(__file__), file_name)
 
-    if not os.path.exists(file_path):
+    try:
+        entry = _mock_entry(file_path)
+    except FileNotFoundError:
         return ({"error": f"File {file_name} non trovato"}, 404, headers)
 
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            xml_content = f.read()
-        
-        headers['Content-Type'] = 'application/xml; charset=utf-8'
-        return (xml_content, 200, headers)
-    except Exception as e:
-        return ({"error": str(e)}, 500, headers)
\ No newline at end of file
+    headers['Content-Type'] = 'application/xml; charset=utf-8'
+    headers['Last-Modified'] = entry['last_modified']
+    headers['Cache-Control'] = 'no-cache'
+    headers['Vary'] = 'Accept-Encoding'
+
+    use_gzip = entry['body'] is not None and 'gzip' in request.headers.get('Accept-Encoding', '') \
+        and entry['size'] >= MOCK_GZIP_MIN_BYTES
+    headers['ETag'] = entry['etag_gzip'] if use_gzip else entry['etag']
+
+    # --- GET condizionale: 304 se il client ha già questa versione ---
+    if _not_modified(request, entry):
+        return ('', 304, headers)
+
+    if entry['body'] is None:
+        # File troppo grande per la cache: servito a blocchi (chunked) dal disco
+        return Response(_stream_file(file_path), 200, headers)
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        return (_gzip_body(entry), 200, headers)
+    return (entry['body'], 200, headers)
+
+def _mock_entry(file_path):
+    """
+    Voce di cache del file: corpo in memoria (se entro MOCK_CACHE_MAX_BYTES) e validatori.
+    Invalidata quando cambiano mtime o dimensione del file.
+    """
+    st = os.stat(file_path)
+    entry = _MOCK_CACHE.get(file_path)
+    if entry and entry['mtime_ns'] == st.st_mtime_ns and entry['size'] == st.st_size:
+        return entry
+
+    body = None
+    if st.st_size <= MOCK_CACHE_MAX_BYTES:
+        with open(file_path, 'rb') as f:
+            body = f.read()
+
+    validator = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+    entry = {
+        'mtime_ns': st.st_mtime_ns,
+        'mtime': int(st.st_mtime),
+        'size': st.st_size,
+        'etag': f'"{validator}"',
+        'etag_gzip': f'"{validator}-gz"',
+        'last_modified': formatdate(st.st_mtime, usegmt=True),
+        'body': body,
+        'gzip': None
+    }
+    _MOCK_CACHE[file_path] = entry
+    return entry
+
+def _gzip_body(entry):
+    if entry['gzip'] is None:
+        entry['gzip'] = gzip.compress(entry['body'], compresslevel=6)
+    return entry['gzip']
+
+def _not_modified(request, entry):
+    """Valuta If-None-Match (prioritario) e If-Modified-Since."""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+        return '*' in tags or entry['etag'] in tags or entry['etag_gzip'] in tags
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            return entry['mtime'] <= int(parsedate_to_datetime(if_modified_since).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _stream_file(file_path, chunk_size=MOCK_CHUNK_SIZE):
+    """Legge il file a blocchi di chunk_size byte."""
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,167 @@
+import codecs
+import csv
+import io
+import json
+import os
+
+# Batch di scrittura committati in parallelo durante un import (default e massimo
+# della concurrency richiesta dal client)
+IMPORT_MAX_WORKERS = int(os.environ.get('IMPORT_MAX_WORKERS', '4'))
+# Numero massimo di errori riportati nel dettaglio (il conteggio resta completo)
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', '500'))
+
+FORMATS = ('json', 'ndjson', 'csv')
+
+_CONTENT_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+    'application/csv': 'csv'
+}
+
+
+def worker_count(value=None):
+    """
+    Batch committati in parallelo per la concurrency richiesta dal client, limitata a
+    1..IMPORT_MAX_WORKERS (default IMPORT_MAX_WORKERS se assente o non numerica).
+    """
+    try:
+        requested = int(value)
+    except (TypeError, ValueError):
+        return IMPORT_MAX_WORKERS
+    return max(1, min(requested, IMPORT_MAX_WORKERS))
+
+
+class RowError(ValueError):
+    """Riga dell'import non valida (il messaggio finisce nel report per riga)."""
+
+
+def detect_format(content_type=None, filename=None, default='json'):
+    """Formato dell'upload dal Content-Type o, in mancanza, dall'estensione del file."""
+    mime = (content_type or '').split(';')[0].strip().lower()
+    if mime in _CONTENT_TYPES:
+        return _CONTENT_TYPES[mime]
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.json'):
+        return 'json'
+    return default
+
+
+def _text_stream(source):
+    """Sorgente testuale leggibile riga per riga: str, bytes, file di testo o binario."""
+    if isinstance(source, bytes):
+        source = source.decode('utf-8-sig')
+    if isinstance(source, str):
+        return io.StringIO(source, newline='')
+    if isinstance(source, io.TextIOBase):
+        return source
+    # Stream binario (es. corpo della richiesta): decodifica incrementale, BOM incluso
+    return codecs.getreader('utf-8-sig')(source)
+
+
+def iter_records(source, fmt='json'):
+    """
+    Scorre i record dell'import senza caricarli tutti in memoria (tranne il formato json).
+    Restituisce coppie (numero_riga, record); le righe illeggibili arrivano come RowError
+    al posto del record, così il chiamante può riportarle senza interrompere l'import.
+    Il numero di riga parte da 1 ed esclude l'intestazione CSV.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato di import non supportato: {fmt}")
+
+    if fmt == 'json':
+        records = source
+        if not isinstance(records, list):
+            text = _text_stream(records).read()
+            records = json.loads(text) if text.strip() else []
+        if not isinstance(records, list):
+            raise ValueError("L'import JSON deve essere un array di giocatori.")
+        yield from enumerate(records, start=1)
+        return
+
+    row = 0
+    try:
+        if fmt == 'ndjson':
+            for line in _text_stream(source):
+                line = line.strip()
+                if not line:
+                    continue
+                row += 1
+                try:
+                    yield row, json.loads(line)
+                except ValueError as e:
+                    yield row, RowError(f"JSON non valido: {e}")
+        else:
+            for record in csv.DictReader(_text_stream(source)):
+                row += 1
+                yield row, record
+    except (csv.Error, UnicodeDecodeError) as e:
+        # File malformato: le righe già lette restano valide, il resto viene segnalato
+        yield row + 1, RowError(f"Lettura interrotta: {e}")
+
+
+def normalize_row(record):
+    """
+    Valida e normalizza un record: chiavi e stringhe senza spazi, valori None o vuoti rimossi,
+    PlayerID obbligatorio e numerico. Ritorna (player_id, dati) o solleva RowError.
+    """
+    if isinstance(record, RowError):
+        raise record
+    if not isinstance(record, dict):
+        raise RowError("Riga non valida: atteso un oggetto con i campi del giocatore.")
+
+    clean = {}
+    for key, value in record.items():
+        if key is None:
+            # csv.DictReader raccoglie qui le colonne oltre l'intestazione
+            raise RowError("La riga ha più colonne dell'intestazione.")
+        key = str(key).strip()
+        if not key:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            continue
+        clean[key] = value
+
+    pid_raw = clean.get('PlayerID')
+    player_id = str(pid_raw).strip() if pid_raw is not None else ''
+    if not player_id:
+        raise RowError("PlayerID mancante.")
+    if not player_id.isdigit():
+        raise RowError(f"PlayerID non valido: {player_id}")
+    return player_id, clean
+
+
+class ImportReport:
+    """Esito di un import: conteggi e dettaglio degli errori per riga (limitato a max_errors)."""
+
+    def __init__(self, max_errors=IMPORT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row, player_id, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "player_id": player_id, "error": message})
+
+    def as_dict(self):
+        if not self.error_count:
+            status = "success"
+        else:
+            status = "partial" if self.imported else "error"
+        return {
+            "status": status,
+            "imported_count": self.imported,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "errors_truncated": self.error_count > len(self.errors)
+        }
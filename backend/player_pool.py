@@ -0,0 +1,245 @@
+import bisect
+import heapq
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import context_cache
+import player_query
+import player_schema
+import player_search
+
+# Pool in memoria dei giocatori per nazione, tenuto aggiornato da listener on_snapshot.
+# Disattivato di default: ogni istanza calda apre due listener per nazione caricata.
+PLAYER_POOL_ENABLED = os.environ.get('PLAYER_POOL_ENABLED', '0') == '1'
+# Giocatori totali in memoria e nazioni caricate: oltre questi limiti si scarta la nazione usata meno di recente
+PLAYER_POOL_MAX_PLAYERS = int(os.environ.get('PLAYER_POOL_MAX_PLAYERS', '200000'))
+PLAYER_POOL_MAX_NATIONS = int(os.environ.get('PLAYER_POOL_MAX_NATIONS', '16'))
+# Attesa massima (secondi) del primo snapshot; scaduta, la richiesta va su Firestore
+PLAYER_POOL_WARM_TIMEOUT = float(os.environ.get('PLAYER_POOL_WARM_TIMEOUT', '10'))
+# Per quanti secondi una nazione oltre PLAYER_POOL_MAX_PLAYERS va direttamente su Firestore
+# senza riaprire i listener (che la leggerebbero per intero a ogni richiesta)
+PLAYER_POOL_OVERSIZE_TTL = float(os.environ.get('PLAYER_POOL_OVERSIZE_TTL', '600'))
+
+# Campi tenuti in memoria: quelli letti da ricerca e query strutturate (identità, nazione,
+# indice di ricerca, liste, campi numerici filtrabili e completamento dei target). Il resto
+# del documento (stringhe di dettaglio, storico, digest) si legge da Firestore per pagina.
+POOL_FIELDS = frozenset((
+    'PlayerID', 'FirstName', 'LastName', 'NickName', 'TeamID',
+    player_schema.LEAGUE_FIELD, *player_schema.LEAGUE_SOURCES,
+    'search_key', 'search_name', 'list_ids', player_schema.TARGET_FIELD
+)) | player_query.FILTER_FIELDS
+
+
+def covers(fields):
+    """True se il pool ha tutti i campi richiesti (fields None = documento intero: no)."""
+    return bool(fields) and all(f in POOL_FIELDS for f in fields)
+
+
+class PooledPlayer:
+    """Giocatore in memoria: solo i POOL_FIELDS del documento, chiavi condivise tra istanze."""
+    __slots__ = ('id', 'search_key', 'search_name', 'list_ids', 'data')
+
+    def __init__(self, player_id, data):
+        self.id = player_id
+        self.search_key = data.get('search_key')
+        self.search_name = data.get('search_name') or ''
+        self.list_ids = tuple(data.get('list_ids') or ())
+        self.data = {sys.intern(k): v for k, v in data.items() if k in POOL_FIELDS}
+
+    def to_dict(self, fields):
+        """Copia dei campi indicati (come una select Firestore); vanno verificati con covers()."""
+        return {f: self.data[f] for f in fields if f in self.data}
+
+
+class NationPool:
+    """
+    Giocatori di una nazione indicizzati per ID, lista e search_key. Ogni query passata
+    (es. NativeLeagueID e CountryID) ha un listener; un giocatore resta nel pool finché
+    almeno una delle query lo include.
+    """
+
+    def __init__(self, league_id, queries):
+        self.league_id = league_id
+        self._players = {}      # id -> PooledPlayer
+        self._sources = {}      # id -> set(indice della query che lo include)
+        self._by_list = {}      # list_id -> set(id)
+        self._sorted = None     # ([search_key], [PooledPlayer]) ricostruito alla prima ricerca dopo una modifica
+        self._lock = threading.Lock()
+        self._synced = set()
+        self._expected = len(queries)
+        self._ready = threading.Event()
+        self._watches = [q.on_snapshot(self._listener(i)) for i, q in enumerate(queries)]
+
+    def __len__(self):
+        return len(self._players)
+
+    def _listener(self, idx):
+        def on_snapshot(docs, changes, read_time):
+            with self._lock:
+                for change in changes:
+                    self._apply(idx, change.type.name, change.document)
+                self._synced.add(idx)
+                if len(self._synced) >= self._expected:
+                    self._ready.set()
+        return on_snapshot
+
+    def _apply(self, idx, kind, snapshot):
+        pid = snapshot.id
+        sources = self._sources.setdefault(pid, set())
+        if kind == 'REMOVED':
+            sources.discard(idx)
+            if sources:
+                return
+            del self._sources[pid]
+            self._drop(pid)
+        else:
+            sources.add(idx)
+            self._drop(pid)
+            player = PooledPlayer(pid, snapshot.to_dict() or {})
+            self._players[pid] = player
+            for list_id in player.list_ids:
+                self._by_list.setdefault(list_id, set()).add(pid)
+        self._sorted = None
+
+    def _drop(self, pid):
+        old = self._players.pop(pid, None)
+        if old is None:
+            return
+        for list_id in old.list_ids:
+            members = self._by_list.get(list_id)
+            if members is not None:
+                members.discard(pid)
+                if not members:
+                    del self._by_list[list_id]
+
+    def wait(self, timeout):
+        return self._ready.wait(timeout)
+
+    def active(self):
+        """False se un listener si è chiuso (errore): i dati non verrebbero più aggiornati."""
+        return all(getattr(w, 'is_active', True) for w in self._watches)
+
+    def close(self):
+        for watch in self._watches:
+            watch.unsubscribe()
+
+    def get(self, player_id):
+        return self._players.get(str(player_id))
+
+    def players(self):
+        """Copia dei giocatori della nazione (per le query strutturate in memoria)."""
+        with self._lock:
+            return list(self._players.values())
+
+    def list_members(self, list_id):
+        """ID ordinati dei giocatori della nazione con list_id in list_ids."""
+        with self._lock:
+            return sorted(self._by_list.get(list_id, ()))
+
+    def search(self, token, page_token=None):
+        """Giocatori con search_key (oltre page_token) che corrispondono al token, in ordine di search_key."""
+        with self._lock:
+            if self._sorted is None:
+                ordered = sorted((p for p in self._players.values() if p.search_key), key=lambda p: p.search_key)
+                self._sorted = ([p.search_key for p in ordered], ordered)
+            keys, ordered = self._sorted
+        start = bisect.bisect_right(keys, page_token) if page_token else 0
+        for player in ordered[start:]:
+            if player_search.matches(player.search_name, token):
+                yield player
+
+
+class PlayerPool:
+    """Nazioni caricate in memoria, con eviction LRU dell'intera nazione."""
+
+    def __init__(self):
+        self._nations = OrderedDict()
+        self._lock = threading.Lock()
+        self._oversized = context_cache.TTLCache(PLAYER_POOL_OVERSIZE_TTL, 256)
+
+    def nation(self, league_id, queries_factory):
+        """
+        NationPool della nazione, caricato al primo uso con le query di queries_factory(league_id).
+        Ritorna None se il pool è disattivato, se il primo snapshot non arriva entro il timeout
+        o se la nazione da sola supera PLAYER_POOL_MAX_PLAYERS (ricordato per PLAYER_POOL_OVERSIZE_TTL
+        secondi): il chiamante usa Firestore.
+        """
+        if not PLAYER_POOL_ENABLED:
+            return None
+        league_id = str(league_id)
+        if self._oversized.get(league_id):
+            return None
+        with self._lock:
+            nation = self._nations.get(league_id)
+            if nation is not None and not nation.active():
+                self._nations.pop(league_id).close()
+                nation = None
+            if nation is None:
+                nation = NationPool(league_id, queries_factory(league_id))
+                self._nations[league_id] = nation
+            self._nations.move_to_end(league_id)
+
+        if not nation.wait(PLAYER_POOL_WARM_TIMEOUT):
+            return None
+        if len(nation) > PLAYER_POOL_MAX_PLAYERS:
+            self._oversized.set(league_id, True)
+            self.discard(league_id)
+            return None
+        self._evict(keep=league_id)
+        return nation
+
+    def nations(self, league_ids, queries_factory):
+        """NationPool di tutte le nazioni indicate, o None se anche una sola non è disponibile."""
+        found = []
+        for league_id in dict.fromkeys(str(l) for l in league_ids):
+            nation = self.nation(league_id, queries_factory)
+            if nation is None:
+                return None
+            found.append(nation)
+        return found
+
+    def _evict(self, keep):
+        with self._lock:
+            total = sum(len(n) for n in self._nations.values())
+            while len(self._nations) > 1 and (len(self._nations) > PLAYER_POOL_MAX_NATIONS
+                                              or total > PLAYER_POOL_MAX_PLAYERS):
+                league_id = next(iter(self._nations))
+                if league_id == keep:
+                    self._nations.move_to_end(league_id)
+                    continue
+                evicted = self._nations.pop(league_id)
+                total -= len(evicted)
+                evicted.close()
+
+    def discard(self, league_id):
+        with self._lock:
+            nation = self._nations.pop(str(league_id), None)
+        if nation is not None:
+            nation.close()
+
+    def clear(self):
+        self._oversized.clear()
+        with self._lock:
+            nations = list(self._nations.values())
+            self._nations.clear()
+        for nation in nations:
+            nation.close()
+
+
+def search(nations, token, page_token=None, limit=None):
+    """Ricerca su più nazioni: risultati fusi per search_key, senza duplicati, fino a limit."""
+    seen = set()
+    merged = heapq.merge(*(n.search(token, page_token) for n in nations), key=lambda p: p.search_key)
+    for player in merged:
+        if player.id in seen:
+            continue
+        seen.add(player.id)
+        yield player
+        if limit is not None and len(seen) >= limit:
+            return
+
+
+# Pool condiviso dalle richieste dell'istanza calda
+pool = PlayerPool()
@@ -0,0 +1,128 @@
+import json
+
+import player_schema
+
+# Campi filtrabili con predicati strutturati (valori dello schema tipizzato)
+FILTER_FIELDS = player_schema.INT_FIELDS | player_schema.FLOAT_FIELDS
+# Campi ordinabili: hanno un indice composito (league_id, campo) in firestore.indexes.json,
+# così i predicati sul campo di ordinamento vengono eseguiti da Firestore
+SORT_FIELDS = (
+    'StaminaSkill', 'KeeperSkill', 'PlaymakerSkill', 'ScorerSkill', 'PassingSkill',
+    'WingerSkill', 'DefenderSkill', 'SetPiecesSkill', 'Age', 'TSI'
+)
+
+OPERATORS = ('<', '<=', '==', '>', '>=')
+DIRECTIONS = ('asc', 'desc')
+
+_COMPARE = {
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '==': lambda a, b: a == b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b
+}
+
+
+class Query:
+    """
+    Interrogazione strutturata validata: predicati (campo, operatore, valore) in AND e ordinamento.
+    Il campo di ordinamento guida la query Firestore (i suoi predicati diventano filtri indicizzati),
+    gli altri predicati vengono valutati sul server prima di restituire i giocatori.
+    """
+
+    def __init__(self, predicates, sort_field, descending):
+        self.predicates = predicates
+        self.sort_field = sort_field
+        self.descending = descending
+        self.pushed = [p for p in predicates if p[0] == sort_field]
+        self.residual = [p for p in predicates if p[0] != sort_field]
+
+    def matches(self, p_data, residual_only=False):
+        """True se il documento soddisfa tutti i predicati (o solo quelli non eseguiti da Firestore)."""
+        for field, op, value in (self.residual if residual_only else self.predicates):
+            current = field_value(p_data, field)
+            if isinstance(current, bool) or not isinstance(current, (int, float)):
+                return False
+            if not _COMPARE[op](current, value):
+                return False
+        return True
+
+    def sort_key(self, p_data, doc_id):
+        """Chiave di ordinamento (valore, ID) coerente con l'ordine della query Firestore."""
+        return field_value(p_data, self.sort_field), doc_id
+
+
+def is_target_field(field):
+    prefix = player_schema.TARGET_FIELD + '.'
+    return field.startswith(prefix) and field[len(prefix):] in player_schema.target_keys()
+
+
+def field_value(p_data, field):
+    """Valore del campo, anche annidato (target_pct.<chiave>); None se assente."""
+    value = p_data
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _check_field(field, allowed):
+    if not isinstance(field, str) or not (field in allowed or is_target_field(field)):
+        raise ValueError(f"Campo non interrogabile: {field}")
+    return field
+
+
+def parse(filters, sort=None):
+    """
+    Valida il payload della richiesta e ritorna una Query.
+    - filters: [{"field": "PlaymakerSkill", "op": ">=", "value": 14}, ...] (AND); per il
+      completamento di un target di default: {"field": "target_pct.midfielder_u21_normal", ...}
+    - sort: {"field": ..., "direction": "asc"|"desc"}; default il primo campo filtrato ordinabile
+      (altrimenti TSI), crescente.
+    Solleva ValueError con un messaggio leggibile.
+    """
+    if filters is None:
+        filters = []
+    if not isinstance(filters, list):
+        raise ValueError("filters deve essere una lista di predicati.")
+
+    predicates = []
+    for f in filters:
+        if not isinstance(f, dict):
+            raise ValueError("Ogni filtro deve avere field, op e value.")
+        field = _check_field(f.get('field'), FILTER_FIELDS)
+        op = f.get('op')
+        if op not in OPERATORS:
+            raise ValueError(f"Operatore non valido: {op}")
+        try:
+            value = player_schema.to_float(f.get('value'))
+        except (TypeError, ValueError):
+            raise ValueError(f"Valore non numerico per {field}: {f.get('value')}")
+        if value.is_integer():
+            value = int(value)
+        predicates.append((field, op, value))
+
+    sort = sort or {}
+    if isinstance(sort, str):
+        sort = {'field': sort}
+    default = next((f for f, _, _ in predicates if f in SORT_FIELDS or is_target_field(f)), 'TSI')
+    sort_field = sort.get('field') or default
+    _check_field(sort_field, SORT_FIELDS)
+    direction = (sort.get('direction') or 'asc').lower()
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Direzione di ordinamento non valida: {direction}")
+    return Query(predicates, sort_field, direction == 'desc')
+
+
+def encode_token(sort_value, doc_id):
+    """Cursore di paginazione: valore del campo di ordinamento e ID dell'ultimo documento letto."""
+    return json.dumps([sort_value, doc_id])
+
+
+def decode_token(page_token):
+    try:
+        sort_value, doc_id = json.loads(page_token)
+    except (TypeError, ValueError):
+        raise ValueError("pageToken non valido.")
+    return sort_value, str(doc_id)
@@ -0,0 +1,194 @@
+import re
+
+# Versione dello schema tipizzato di players-details. Va incrementata quando cambiano
+# i campi sotto: il backfill (PlayerManager.normalize_schema) riparte da capo.
+# 2: completamento dei target di default (target_pct)
+SCHEMA_VERSION = 2
+
+# Campo canonico della nazione del giocatore (intero): NativeLeagueID dei dettagli completi,
+# altrimenti CountryID (sync preliminari o import CSV). È l'unico campo usato dalle ricerche.
+LEAGUE_FIELD = 'league_id'
+LEAGUE_SOURCES = ('NativeLeagueID', 'CountryID')
+
+# Tipi dei campi, allineati al modello HattrickPlayer del frontend
+INT_FIELDS = frozenset((
+    'StaminaSkill', 'KeeperSkill', 'PlaymakerSkill', 'ScorerSkill', 'PassingSkill',
+    'WingerSkill', 'DefenderSkill', 'SetPiecesSkill',
+    'Age', 'AgeDays', 'TSI', 'PlayerForm', 'InjuryLevel', 'Cards',
+    'Salary', 'SalaryAbroad', 'PlayerNumber', 'PlayerCategoryID',
+    'Experience', 'Loyalty', 'Leadership', 'Specialty',
+    'Agreeability', 'Aggressiveness', 'Honesty',
+    'Caps', 'CapsU20', 'LeagueGoals', 'CupGoals', 'FriendliesGoals', 'CareerGoals',
+    'CareerHattricks', 'CareerAssists', 'MatchesCurrentTeam', 'GoalsCurrentTeam', 'AssistsCurrentTeam',
+    'TrainingType', 'StaminaTrainingPart', 'TrainingType_Last', 'StaminaTrainingPart_Last',
+    'TrainingLevel', 'NewTrainingLevel', 'TrainingLevel_Last',
+    'TrainerSkill', 'TeamTrainerSkill', 'TeamTrainerLeadership',
+    'AssistantTrainerLevels', 'FormCoachLevels', 'MedicLevels', 'PositionCode', 'MatchTime'
+))
+FLOAT_FIELDS = frozenset(('Potential', 'DiffTraining', 'Rating', 'RatingEndOfGame'))
+BOOL_FIELDS = frozenset(('IsAbroad', 'MotherClubBonus', 'IsNationalTeam', 'WasNationalTeam'))
+
+# Mappa {chiave target: percentuale media di completamento} sui target di default dell'advisor,
+# calcolata all'ingest per filtrare e ordinare i giocatori per ruolo (player_query)
+TARGET_FIELD = 'target_pct'
+
+_TRUE = frozenset(('1', 'true', 'yes', 'si', 'sì'))
+_FALSE = frozenset(('0', 'false', 'no'))
+
+
+def to_int(value):
+    """Intero da int, float senza decimali o stringa ('12', '12.0'); ValueError altrimenti."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return value
+    number = float(str(value).strip())
+    if not number.is_integer():
+        raise ValueError(value)
+    return int(number)
+
+
+def to_float(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    return float(str(value).strip().replace(',', '.'))
+
+
+def to_bool(value):
+    """Booleano da bool, 0/1 o 'True'/'False' (Hattrick usa entrambe le forme)."""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(value)
+
+
+_CONVERTERS = [(INT_FIELDS, to_int), (FLOAT_FIELDS, to_float), (BOOL_FIELDS, to_bool)]
+
+
+def _converter(field):
+    for fields, convert in _CONVERTERS:
+        if field in fields:
+            return convert
+    return None
+
+
+def league_id(p_data, existing=None):
+    """
+    Nazione canonica (int) dai campi sorgente, o None se assente o non numerica.
+    Con existing (documento già salvato) un NativeLeagueID salvato prevale sul CountryID
+    di un aggiornamento parziale (es. sync senza dettagli).
+    """
+    for field in LEAGUE_SOURCES:
+        for data in (p_data, existing or {}):
+            value = data.get(field)
+            if value in (None, ''):
+                continue
+            try:
+                return to_int(value)
+            except (TypeError, ValueError):
+                continue
+    return None
+
+
+_NON_KEY = re.compile(r'[^a-z0-9]+')
+_targets = None
+
+
+def target_key(role, level, variant='Normal'):
+    """Chiave (segmento di field path valido) di una combinazione: 'defender_nt_counter_attack'."""
+    return _NON_KEY.sub('_', f"{role}_{level}_{variant}".lower()).strip('_')
+
+
+def _default_targets():
+    """[(chiave, [(campo skill, target)])] dai target di default dell'advisor (calcolato una volta)."""
+    global _targets
+    if _targets is None:
+        # Import locale: l'advisor serve solo quando arrivano le skill di un giocatore
+        from hattrick_advisor import DEFAULT_TARGETS, SKILL_FIELDS
+        _targets = [
+            (target_key(role, level, variant), [(SKILL_FIELDS[skill], value) for skill, value in stats.items()])
+            for role, levels in DEFAULT_TARGETS.items()
+            for level, variants in levels.items()
+            for variant, stats in variants.items() if stats
+        ]
+    return _targets
+
+
+def target_keys():
+    """Chiavi di target_pct, una per combinazione ruolo/livello/variante di default."""
+    return [key for key, _ in _default_targets()]
+
+
+def target_completion(p_data):
+    """
+    {chiave target: completamento medio} come il punteggio di TargetEngine.rank_roles
+    (percentuale per skill troncata e limitata a 100, 100 = target raggiunto).
+    None se manca una skill o non è un intero.
+    """
+    targets = _default_targets()
+    values = {}
+    for field in {field for _, stats in targets for field, _ in stats}:
+        try:
+            values[field] = to_int(p_data[field])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    completion = {}
+    for key, stats in targets:
+        total = 0
+        for field, target in stats:
+            current = values[field]
+            if target > 0:
+                total += min(100, int(current / target * 100))
+            else:
+                total += 100 if current >= target else 0
+        completion[key] = round(total / len(stats), 1)
+    return completion
+
+
+def apply_targets(p_data, existing=None):
+    """
+    Imposta target_pct su p_data dalle skill del payload unite a quelle del documento
+    esistente, così un aggiornamento parziale (es. solo PlaymakerSkill) lo ricalcola.
+    """
+    completion = target_completion({**existing, **p_data} if existing else p_data)
+    if completion is not None:
+        p_data[TARGET_FIELD] = completion
+    return p_data
+
+
+def normalize(p_data, strict=True, existing=None):
+    """
+    Applica lo schema tipizzato a p_data (modificato e ritornato): campi numerici e booleani
+    convertiti, league_id calcolato se il payload contiene un campo nazione, target_pct se
+    le skill del payload (unite a quelle di existing) sono complete, schema_version.
+    Un valore non convertibile solleva ValueError con strict, altrimenti resta invariato.
+    I valori vuoti restano come sono: _clean_data/normalize_row decidono se scartarli.
+    """
+    for field, value in p_data.items():
+        convert = _converter(field)
+        if convert is None or value is None or value == '':
+            continue
+        try:
+            p_data[field] = convert(value)
+        except (TypeError, ValueError):
+            if strict:
+                raise ValueError(f"Valore non valido per {field}: {value}")
+
+    league = league_id(p_data, existing) if any(f in p_data for f in LEAGUE_SOURCES) else None
+    if league is not None:
+        p_data[LEAGUE_FIELD] = league
+    apply_targets(p_data, existing)
+    p_data['schema_version'] = SCHEMA_VERSION
+    return p_data
+
+
+def changes(p_data):
+    """Campi di un documento esistente da riscrivere per portarlo allo schema corrente ({} se già conforme)."""
+    normalized = normalize(dict(p_data), strict=False)
+    return {k: v for k, v in normalized.items()
+            if k not in p_data or type(p_data[k]) is not type(v) or p_data[k] != v}
@@ -0,0 +1,61 @@
+import re
+import unicodedata
+
+# Lunghezza massima dei prefissi indicizzati (query più lunghe vengono troncate)
+MAX_PREFIX_LENGTH = 20
+
+_NON_ALNUM = re.compile(r'[^a-z0-9 ]+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Minuscolo, senza accenti e con spazi singoli: 'Óscar  Núñez' -> 'oscar nunez'."""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    ascii_text = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    ascii_text = _NON_ALNUM.sub(' ', ascii_text)
+    return _SPACES.sub(' ', ascii_text).strip()
+
+
+def _prefixes(word):
+    return [word[:i] for i in range(1, min(len(word), MAX_PREFIX_LENGTH) + 1)]
+
+
+def build_search_fields(p_data, player_id):
+    """
+    Campi di indice da salvare sul documento giocatore:
+    - search_name: nome completo normalizzato
+    - search_prefixes: prefissi di ogni parola e del nome completo (per array_contains)
+    - search_key: chiave univoca e ordinabile usata come cursore di paginazione
+    Ritorna {} se il giocatore non ha nome/cognome.
+    """
+    first = p_data.get('FirstName')
+    last = p_data.get('LastName')
+    if not first and not last:
+        return {}
+
+    search_name = normalize_text(f"{first or ''} {last or ''}")
+    prefixes = {p for p in _prefixes(search_name) if not p.endswith(' ')}
+    for word in search_name.split(' '):
+        prefixes.update(_prefixes(word))
+
+    return {
+        'search_name': search_name,
+        'search_prefixes': sorted(prefixes),
+        'search_key': f"{search_name}|{player_id}"
+    }
+
+
+def query_token(query):
+    """Normalizza la stringa di ricerca nel token da cercare in search_prefixes ('' = nessun filtro)."""
+    return normalize_text(query)[:MAX_PREFIX_LENGTH]
+
+
+def matches(search_name, token):
+    """Equivalente in memoria di array_contains(token) su search_prefixes."""
+    if not token:
+        return True
+    if search_name.startswith(token):
+        return True
+    return any(word.startswith(token) for word in search_name.split(' '))
@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+
+# Campi salvati in ogni snapshot, in questo ordine. L'ordine fa parte del formato:
+# nuovi campi vanno aggiunti solo in fondo (le voci più corte hanno i campi finali vuoti).
+SNAPSHOT_FIELDS = (
+    'StaminaSkill', 'KeeperSkill', 'PlaymakerSkill', 'ScorerSkill', 'PassingSkill',
+    'WingerSkill', 'DefenderSkill', 'SetPiecesSkill',
+    'TSI', 'PlayerForm', 'InjuryLevel'
+)
+
+KEYFRAME = 'k'
+DELTA = 'd'
+
+
+# ---------------------------------------------------------
+# FORMATO
+# ---------------------------------------------------------
+# Un documento per giocatore e anno ISO ("{player_id}_{anno}") con l'array `entries`,
+# a cui ogni scrittura aggiunge una voce (ArrayUnion, senza leggere il documento):
+#     "<unix_ts>:k:5,8,3,..."   keyframe, valori assoluti
+#     "<unix_ts>:d:,,1,,,,,,-3200,,"   delta rispetto alla voce precedente (vuoto = invariato)
+# La prima voce di ogni anno è sempre un keyframe, così ogni documento si decodifica da solo.
+
+def history_doc_id(player_id, at):
+    return f"{player_id}_{history_year(at)}"
+
+
+def history_year(at):
+    return at.isocalendar()[0]
+
+
+def parse_time(value):
+    """datetime (UTC se senza fuso) da datetime o stringa ISO; None resta None."""
+    if value is None or value == '':
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"Data non valida: {value}")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def vector(p_data):
+    """Valori interi dei campi dello snapshot (None se mancanti o non numerici)."""
+    values = []
+    for field in SNAPSHOT_FIELDS:
+        try:
+            values.append(int(str(p_data[field]).strip()))
+        except (KeyError, TypeError, ValueError):
+            values.append(None)
+    return values
+
+
+def encode_entry(at, values, previous=None):
+    """
+    Voce compatta per lo snapshot `values` al tempo `at`. Con `previous` (vettore completo
+    della voce precedente nello stesso documento) la voce è un delta, altrimenti un keyframe.
+    Ritorna None se non c'è nulla da registrare.
+    """
+    if all(v is None for v in values):
+        return None
+    if previous is not None and None not in previous and None not in values:
+        deltas = [v - p for v, p in zip(values, previous)]
+        if not any(deltas):
+            return None
+        body = ','.join(str(d) if d else '' for d in deltas)
+        kind = DELTA
+    else:
+        body = ','.join('' if v is None else str(v) for v in values)
+        kind = KEYFRAME
+    return f"{int(at.timestamp())}:{kind}:{body}"
+
+
+def decode_entries(entries):
+    """Voci di un documento in ordine di tempo -> [(datetime, {campo: valore})]."""
+    parsed = []
+    for entry in entries or ():
+        ts, kind, body = entry.split(':', 2)
+        parsed.append((int(ts), kind, body.split(',')))
+    parsed.sort(key=lambda e: e[0])
+
+    snapshots = []
+    current = None
+    for ts, kind, parts in parsed:
+        parts += [''] * (len(SNAPSHOT_FIELDS) - len(parts))
+        if kind == KEYFRAME or current is None:
+            # Keyframe parziale (import/salvataggio con merge): i campi assenti restano quelli precedenti
+            previous = current or [None] * len(SNAPSHOT_FIELDS)
+            current = [int(p) if p else prev for p, prev in zip(parts, previous)]
+        else:
+            current = [None if c is None else c + (int(p) if p else 0)
+                       for c, p in zip(current, parts)]
+        at = datetime.fromtimestamp(ts, tz=timezone.utc)
+        snapshots.append((at, dict(zip(SNAPSHOT_FIELDS, current))))
+    return snapshots
+
+
+def weekly(snapshots, since=None, until=None):
+    """Un solo snapshot per settimana ISO (l'ultimo), filtrato sull'intervallo [since, until]."""
+    by_week = {}
+    for at, values in snapshots:
+        if (since and at < since) or (until and at > until):
+            continue
+        year, week, _ = at.isocalendar()
+        by_week[(year, week)] = (at, values)
+
+    result = []
+    for (year, week), (at, values) in sorted(by_week.items()):
+        result.append(dict(values, week=f"{year}-W{week:02d}", at=at.isoformat()))
+    return result
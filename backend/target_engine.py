@@ -0,0 +1,177 @@
+import numpy as np
+
+# Ordine fisso delle colonne skill nelle matrici (eventuali skill custom vengono accodate)
+SKILL_ORDER = ("goalkeeping", "defending", "playmaking", "winger", "passing", "scoring", "set pieces")
+
+
+class TargetEngine:
+    """
+    Motore vettoriale per il confronto skill/target.
+    Tutte le combinazioni ruolo × livello × variante diventano righe di una matrice densa
+    (combo × skill), così percentuali, gap ed esiti si calcolano per migliaia di giocatori
+    in un'unica passata NumPy. L'output per giocatore è identico a
+    HattrickAdvisor.check_role_targets.
+    """
+
+    def __init__(self, targets):
+        """:param targets: dict annidato {ruolo: {livello: {variante: {skill: valore}}}}"""
+        self.combos = []
+        self.combo_skills = []
+        self.index = {}
+
+        skills = list(SKILL_ORDER)
+        for role, levels in targets.items():
+            for level, variants in levels.items():
+                for variant, stats in variants.items():
+                    if not stats:
+                        continue
+                    self.index[(role, level, variant)] = len(self.combos)
+                    self.combos.append((role, level, variant))
+                    # Manteniamo l'ordine del dict per riprodurre l'output originale
+                    self.combo_skills.append(list(stats.items()))
+                    for skill in stats:
+                        if skill not in skills:
+                            skills.append(skill)
+
+        self.skills = skills
+        self.skill_pos = {s: i for i, s in enumerate(skills)}
+
+        self.targets = np.zeros((len(self.combos), len(skills)), dtype=np.float64)
+        self.mask = np.zeros((len(self.combos), len(skills)), dtype=bool)
+        for c, stats in enumerate(self.combo_skills):
+            for skill, value in stats:
+                self.targets[c, self.skill_pos[skill]] = value
+                self.mask[c, self.skill_pos[skill]] = True
+
+    # ---------------------------------------------------------
+    # Costruzione input
+    # ---------------------------------------------------------
+    def skill_matrix(self, skills_list):
+        """Lista di dict current_skills -> matrice (giocatori × skill), 0 per le skill assenti."""
+        matrix = np.zeros((len(skills_list), len(self.skills)), dtype=np.float64)
+        for p, current in enumerate(skills_list):
+            for skill, value in (current or {}).items():
+                pos = self.skill_pos.get(skill)
+                if pos is not None:
+                    matrix[p, pos] = value
+        return matrix
+
+    def resolve(self, role, level, variant):
+        """Indice della combinazione con fallback su Normal, come check_role_targets."""
+        idx = self.index.get((role, level, variant))
+        if idx is not None:
+            return idx, variant
+        idx = self.index.get((role, level, "Normal"))
+        if idx is not None:
+            return idx, "Normal (Fallback)"
+        return None, None
+
+    # ---------------------------------------------------------
+    # Calcolo vettoriale
+    # ---------------------------------------------------------
+    def evaluate(self, skills, targets):
+        """
+        Confronto elemento per elemento tra skill e target con shape compatibili (broadcast).
+        Ritorna (pct, passed, gap): percentuali intere troncate e limitate a 100,
+        maschera skill raggiunte e distanza dal target (0 se raggiunto).
+        """
+        passed = skills >= targets
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.trunc((skills / targets) * 100)
+        pct = np.where(targets > 0, np.minimum(100, ratio), np.where(passed, 100, 0)).astype(np.int64)
+        gap = np.where(passed, 0.0, targets - skills)
+        return pct, passed, gap
+
+    def check_batch(self, players):
+        """
+        :param players: lista di tuple (ruolo, livello, variante, current_skills)
+        :return: lista di dict nello stesso formato di HattrickAdvisor.check_role_targets
+        """
+        resolved = [self.resolve(role, level, variant) for role, level, variant, _ in players]
+        rows = [i for i, (idx, _) in enumerate(resolved) if idx is not None]
+
+        results = [None] * len(players)
+        if rows:
+            skills = self.skill_matrix([players[i][3] for i in rows])
+            combo_idx = np.array([resolved[i][0] for i in rows])
+            pct, passed, _ = self.evaluate(skills, self.targets[combo_idx])
+            for r, i in enumerate(rows):
+                results[i] = self._format(players[i], resolved[i], pct[r], passed[r])
+
+        for i, (idx, _) in enumerate(resolved):
+            if idx is None:
+                role, level = players[i][0], players[i][1]
+                results[i] = {
+                    "status": "INFO",
+                    "message": f"Nessun target configurato per {role} -> {level}"
+                }
+        return results
+
+    def _format(self, player, resolved, pct_row, passed_row):
+        role, level, _, current_skills = player
+        combo, used_variant = resolved
+        current_skills = current_skills or {}
+
+        details = []
+        missing_skills = []
+        for skill_name, target_val in self.combo_skills[combo]:
+            pos = self.skill_pos[skill_name]
+            curr_val = current_skills.get(skill_name, 0)
+            ok = bool(passed_row[pos])
+            if not ok:
+                diff = round(target_val - curr_val, 1)
+                missing_skills.append(f"{skill_name} (-{diff})")
+            details.append({
+                "skill": skill_name,
+                "current": curr_val,
+                "target": target_val,
+                "status": "OK" if ok else "MISSING",
+                "pct": int(pct_row[pos])
+            })
+
+        return {
+            "status": "IN_PROGRESS" if missing_skills else "COMPLETED",
+            "role_analyzed": f"{role.capitalize()} {level} ({used_variant})",
+            "details": details,
+            "missing_summary": missing_skills
+        }
+
+    def rank_roles(self, skills_list, level=None, top=3):
+        """
+        Classifica per ogni giocatore le combinazioni ruolo/variante più adatte.
+        Punteggio = percentuale media di completamento sulle skill del target;
+        a parità vince chi ha già completato il target.
+        :param level: filtra su un livello (es. "U21"); None = tutti
+        """
+        combos = [c for c, (_, lvl, _) in enumerate(self.combos) if level is None or lvl == level]
+        if not combos or not skills_list:
+            return [[] for _ in skills_list]
+
+        skills = self.skill_matrix(skills_list)[:, None, :]            # (P, 1, S)
+        targets = self.targets[combos][None, :, :]                      # (1, C, S)
+        mask = self.mask[combos][None, :, :]
+        pct, passed, gap = self.evaluate(skills, targets)               # (P, C, S)
+
+        n_skills = mask.sum(axis=2)
+        score = np.where(mask, pct, 0).sum(axis=2) / n_skills           # (P, C)
+        completed = np.all(passed | ~mask, axis=2)
+        total_gap = np.where(mask, gap, 0).sum(axis=2)
+
+        # Ordinamento: completati prima, poi punteggio decrescente
+        order = np.lexsort((-score, ~completed), axis=1)[:, :top]
+
+        ranking = []
+        for p in range(len(skills_list)):
+            entries = []
+            for c in order[p]:
+                role, lvl, variant = self.combos[combos[c]]
+                entries.append({
+                    "role": role,
+                    "level": lvl,
+                    "variant": variant,
+                    "score": round(float(score[p, c]), 1),
+                    "completed": bool(completed[p, c]),
+                    "total_gap": round(float(total_gap[p, c]), 1)
+                })
+            ranking.append(entries)
+        return ranking
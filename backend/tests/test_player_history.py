@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import firebase  # noqa: E402
+import hattrick_client  # noqa: E402
+import skill_history  # noqa: E402
+from benchmarks import synthetic  # noqa: E402
+from benchmarks.memory_firestore import MemoryFirestore  # noqa: E402
+
+
+@pytest.fixture
+def setup(monkeypatch):
+    players = [dict(p) for p in list(synthetic.generate(60).players.values())[:5]]
+    client = MemoryFirestore()
+    firebase.db.use(client)
+    state = {'changed': ()}
+
+    base = synthetic.hattrick_client_factory(players)
+
+    class Client(base):
+        def fetch_player_list(self, timeout=10, stream=False, etag=None):
+            return synthetic.hattrick_client_factory(players, changed_ids=state['changed'])(
+                self.base_url).fetch_player_list(timeout, stream, etag)
+
+    monkeypatch.setattr(hattrick_client, 'HattrickClient', Client)
+    return firebase.PlayerManager(), client, players, state
+
+
+def _save(pm, p_data, **changes):
+    payload = {f: p_data[f] for f in skill_history.SNAPSHOT_FIELDS}
+    payload.update(PlayerID=p_data['PlayerID'], FirstName=p_data['FirstName'], LastName=p_data['LastName'])
+    payload.update(changes)
+    pm.save_player(synthetic.BENCH_COACH, payload)
+
+
+def _assert_history_matches(pm, client, player_id):
+    stored = client.collection(pm.players_coll).document(player_id).get().to_dict()
+    entries = []
+    for doc in client.collection(pm.history_coll).stream():
+        if doc.to_dict()['player_id'] == player_id:
+            entries.extend(doc.to_dict()['entries'])
+    decoded = skill_history.decode_entries(entries)
+
+    assert decoded
+    assert all(None not in values.values() for _, values in decoded)
+    assert decoded[-1][1] == dict(zip(skill_history.SNAPSHOT_FIELDS, skill_history.vector(stored)))
+
+
+def test_save_then_sync(setup):
+    pm, client, players, state = setup
+    p_data = players[0]
+    _save(pm, p_data, PlaymakerSkill=int(p_data['PlaymakerSkill']) + 1)
+
+    state['changed'] = (p_data['PlayerID'],)
+    pm.sync_players_from_mock(synthetic.BENCH_COACH)
+
+    _assert_history_matches(pm, client, p_data['PlayerID'])
+
+
+def test_sync_then_save_then_sync(setup):
+    pm, client, players, state = setup
+    p_data = players[0]
+    pm.sync_players_from_mock(synthetic.BENCH_COACH)
+    _save(pm, p_data, PlaymakerSkill=int(p_data['PlaymakerSkill']) + 1)
+    _assert_history_matches(pm, client, p_data['PlayerID'])
+
+    state['changed'] = (p_data['PlayerID'],)
+    pm.sync_players_from_mock(synthetic.BENCH_COACH)
+
+    _assert_history_matches(pm, client, p_data['PlayerID'])
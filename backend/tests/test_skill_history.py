@@ -0,0 +1,64 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import skill_history  # noqa: E402
+
+START = datetime(2026, 3, 2, 12, 0, tzinfo=timezone.utc)
+
+
+def _snapshot(**changes):
+    values = {field: 5 for field in skill_history.SNAPSHOT_FIELDS}
+    values.update(TSI=12000, PlayerForm=6, InjuryLevel=-1)
+    values.update(changes)
+    return values
+
+
+def _encode(snapshots):
+    """Voci come le scrive PlayerManager._history_write: delta rispetto al vettore precedente."""
+    entries, previous = [], None
+    for i, p_data in enumerate(snapshots):
+        values = skill_history.vector(p_data)
+        entry = skill_history.encode_entry(START + timedelta(days=7 * i), values, previous)
+        if entry is not None:
+            entries.append(entry)
+        previous = values
+    return entries
+
+
+def test_round_trip_keyframe_and_deltas():
+    snapshots = [
+        _snapshot(),
+        _snapshot(PlaymakerSkill=6, TSI=13450),
+        _snapshot(PlaymakerSkill=6, TSI=11900, PlayerForm=4, InjuryLevel=2),
+    ]
+    entries = _encode(snapshots)
+
+    assert [e.split(':')[1] for e in entries] == ['k', 'd', 'd']
+    decoded = skill_history.decode_entries(entries)
+    assert [values for _, values in decoded] == snapshots
+    assert [at for at, _ in decoded] == [START + timedelta(days=7 * i) for i in range(3)]
+
+
+def test_unchanged_snapshot_writes_no_entry():
+    entries = _encode([_snapshot(), _snapshot()])
+
+    assert len(entries) == 1
+    assert skill_history.decode_entries(entries)[0][1] == _snapshot()
+
+
+def test_partial_keyframe_keeps_previous_values():
+    partial = {'TSI': 15000, 'PlayerForm': 7}
+    entries = _encode([_snapshot(), partial])
+
+    assert [e.split(':')[1] for e in entries] == ['k', 'k']
+    decoded = skill_history.decode_entries(entries)
+    assert decoded[-1][1] == _snapshot(TSI=15000, PlayerForm=7)
+
+
+def test_entries_decoded_in_time_order():
+    entries = _encode([_snapshot(), _snapshot(ScorerSkill=8)])
+
+    assert skill_history.decode_entries(list(reversed(entries))) == skill_history.decode_entries(entries)
@@ -0,0 +1,173 @@
+import math
+
+# ---------------------------------------------------------
+# TABELLE DI VELOCITÀ DI ALLENAMENTO
+# ---------------------------------------------------------
+# Valori approssimati dal modello di allenamento Hattrick: settimane per salire di un livello
+# a 17 anni, intensità 100%, resistenza 10%, allenatore eccellente, skill a livello ~0.
+SKILL_BASE_WEEKS = {
+    "goalkeeping": 3.3,
+    "defending": 5.3,
+    "playmaking": 4.6,
+    "winger": 3.8,
+    "passing": 4.1,
+    "scoring": 4.5,
+    "set pieces": 1.3
+}
+
+WEEKS_PER_YEAR = 16          # Una stagione Hattrick = 16 settimane = 1 anno di età
+U21_CUTOFF_AGE = 21
+MIN_AGE = 17
+MAX_AGE = 40
+MAX_LEVEL = 22
+REFERENCE_STAMINA_SHARE = 10
+PROJECTION_MAX_WEEKS = 10 * WEEKS_PER_YEAR
+
+
+def _level_factor(level):
+    """Moltiplicatore dei tempi: più il livello è alto, più lenta è la crescita."""
+    return 1.0 + 0.012 * level ** 1.6
+
+
+def _age_speed(age):
+    """Velocità relativa rispetto a un 17enne (cala di circa l'8% per anno)."""
+    return 1.0 / (1.0 + 0.08 * max(0.0, age - MIN_AGE))
+
+
+# Tabelle per età (una riga per settimana) e per livello, precalcolate all'import
+AGE_STEPS = (MAX_AGE - MIN_AGE) * WEEKS_PER_YEAR + 1
+AGE_SPEED = [_age_speed(MIN_AGE + a / WEEKS_PER_YEAR) for a in range(AGE_STEPS)]
+LEVEL_FACTOR = [_level_factor(lvl) for lvl in range(MAX_LEVEL + 1)]
+
+_WEEKLY_GAIN = {}
+
+def weekly_gain(skill):
+    """
+    Tabella [indice_età][livello] = frazione di livello guadagnata in una settimana.
+    Costruita alla prima richiesta per skill (per non pesare sul cold start) e poi riusata.
+    """
+    table = _WEEKLY_GAIN.get(skill)
+    if table is None:
+        costs = [SKILL_BASE_WEEKS[skill] * f for f in LEVEL_FACTOR]
+        table = [[speed / cost for cost in costs] for speed in AGE_SPEED]
+        _WEEKLY_GAIN[skill] = table
+    return table
+
+
+def age_index(age):
+    """Età (anni + giorni/112) -> riga della tabella, una riga per settimana."""
+    idx = int(round((float(age) - MIN_AGE) * WEEKS_PER_YEAR))
+    return min(max(idx, 0), AGE_STEPS - 1)
+
+
+def stamina_factor(stamina_share):
+    """Quota di allenamento che resta alla skill dopo la resistenza, relativa al 10% di riferimento."""
+    share = min(max(float(stamina_share), 0.0), 100.0)
+    return (100.0 - share) / (100.0 - REFERENCE_STAMINA_SHARE)
+
+
+def weeks_to_cutoff(age):
+    """Settimane rimanenti prima che il giocatore compia 21 anni (0 se già fuori età U21)."""
+    return max(0, int(math.ceil((U21_CUTOFF_AGE - float(age)) * WEEKS_PER_YEAR)))
+
+
+# ---------------------------------------------------------
+# PROIEZIONE
+# ---------------------------------------------------------
+def project_skill(level, age, skill, stamina_share, weeks=PROJECTION_MAX_WEEKS):
+    """
+    Traiettoria settimanale di una skill allenata per un singolo giocatore.
+    Ritorna la lista dei livelli per le settimane 0..weeks.
+    """
+    table = weekly_gain(skill)
+    factor = stamina_factor(stamina_share)
+    a = age_index(age)
+    level = float(level)
+    trajectory = [level]
+    for _ in range(weeks):
+        level = level + table[a][min(int(level), MAX_LEVEL)] * factor
+        a = min(a + 1, AGE_STEPS - 1)
+        trajectory.append(level)
+    return trajectory
+
+
+def project_skill_batch(levels, ages, skill, stamina_shares, weeks=PROJECTION_MAX_WEEKS):
+    """
+    Versione vettoriale di project_skill: una riga per giocatore, stesso calcolo settimana per settimana.
+    Ritorna un array (giocatori × weeks + 1).
+    """
+    # Import locale: NumPy serve solo per le proiezioni batch
+    import numpy as np
+
+    table = _gain_array(skill)
+    factor = np.array([stamina_factor(s) for s in stamina_shares], dtype=np.float64)
+    a = np.array([age_index(age) for age in ages], dtype=np.int64)
+    level = np.array(levels, dtype=np.float64)
+
+    trajectory = np.empty((len(level), weeks + 1), dtype=np.float64)
+    trajectory[:, 0] = level
+    for w in range(1, weeks + 1):
+        level = level + table[a, np.minimum(level.astype(np.int64), MAX_LEVEL)] * factor
+        a = np.minimum(a + 1, AGE_STEPS - 1)
+        trajectory[:, w] = level
+    return trajectory
+
+
+_GAIN_ARRAYS = {}
+
+def _gain_array(skill):
+    if skill not in _GAIN_ARRAYS:
+        import numpy as np
+        _GAIN_ARRAYS[skill] = np.array(weekly_gain(skill), dtype=np.float64)
+    return _GAIN_ARRAYS[skill]
+
+
+def first_week_at(trajectory, target):
+    """Prima settimana in cui la traiettoria raggiunge il target (None se mai)."""
+    for week, level in enumerate(trajectory):
+        if level >= target:
+            return week
+    return None
+
+
+def trajectory_report(current_skills, age, training, target_skills, target_level, trajectory):
+    """
+    Report di traiettoria per un giocatore, a partire dalla traiettoria della skill allenata
+    (None se l'allenamento non corrisponde a una skill proiettabile).
+    """
+    cutoff = weeks_to_cutoff(age)
+    targets = []
+    all_reachable = True
+
+    for skill_name, target_val in target_skills.items():
+        curr_val = current_skills.get(skill_name, 0)
+        trained = skill_name == training and trajectory is not None
+        if curr_val >= target_val:
+            weeks = 0
+        elif trained:
+            weeks = first_week_at(trajectory, target_val)
+        else:
+            weeks = None
+
+        before_cutoff = weeks is not None and weeks <= cutoff
+        if weeks is None or (target_level == "U21" and not before_cutoff):
+            all_reachable = False
+
+        targets.append({
+            "skill": skill_name,
+            "current": curr_val,
+            "target": target_val,
+            "trained": trained,
+            "weeks": weeks,
+            "reached_before_u21_cutoff": before_cutoff
+        })
+
+    report = {
+        "status": "OK" if all_reachable else "KO",
+        "training": training,
+        "weeks_to_u21_cutoff": cutoff,
+        "targets": targets
+    }
+    if trajectory is not None:
+        report["projected_level_at_cutoff"] = round(trajectory[min(cutoff, len(trajectory) - 1)], 2)
+    return report
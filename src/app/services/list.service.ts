@@ -47,6 +47,14 @@ export class ListService {
     return this.getRequestPayload('remove_player', { listId, playerId });
   }
 
+  addPlayers(listId: string, playerIds: string[]): Observable<any> {
+    return this.getRequestPayload('add_players', { listId, playerIds });
+  }
+
+  removePlayers(listId: string, playerIds: string[]): Observable<any> {
+    return this.getRequestPayload('remove_players', { listId, playerIds });
+  }
+
   getListPlayers(listId: string): Observable<{ players: any[] }> {
     return this.getRequestPayload('get_list_players', { listId });
   }
@@ -55,4 +55,13 @@ export class PlayerDataService {
     searchPlayers(query: string, listId?: string): Observable<{ players: HattrickPlayer[] }> {
         return this.getRequestPayload('search_players', { query, listId });
     }
+
+    queryPlayers(filters: { field: string; op: string; value: number }[], sort?: { field: string; direction?: 'asc' | 'desc' },
+                 leagueId?: string, pageSize?: number, pageToken?: string): Observable<{ players: HattrickPlayer[]; nextPageToken: string | null }> {
+        return this.getRequestPayload('query_players', { filters, sort, leagueId, pageSize, pageToken });
+    }
+
+    getSkillHistory(playerIds: string[], since?: string, until?: string): Observable<{ history: { [playerId: string]: any[] } }> {
+        return this.getRequestPayload('get_skill_history', { playerIds, since, until });
+    }
 }